@@ -0,0 +1,282 @@
+# autotune.py
+# 自動調參工具：以標註好真實線段的錄製畫面，自動搜尋雙邊濾波 / Canny / Hough 參數
+# 用於 8BallPool_assist 取代用 tuner.py 滑桿肉眼調參
+#
+# - 目標函數：F1（偵測線段與標註線段的配對）減去每幀處理時間的懲罰
+# - 搜尋方式：隨機取樣 + successive halving（先用少量幀淘汰差的參數組，留下的再用更多幀評估）
+# - 評估在多個行程平行執行；評估過的 (流程設定, 參數, 評估幀) 結果存在快取檔，重跑時直接沿用
+#   （結果含處理時間，快取鍵也包含主機名稱、行程數與 OpenCV 版本，其他機器或設定的計時不會被沿用）
+# - 最佳參數以 utils.save_params 原子寫入參數檔
+#
+# 標註檔為 JSON Lines，每行 {"frame": 幀編號, "lines": [[x1, y1, x2, y2], ...]}，
+# 可直接由 batch.py 的輸出修正而來。
+#
+# 用法：
+#   python autotune.py recordings/session1 labels.jsonl --candidates 81 --workers 8
+#   python autotune.py frames/ labels.jsonl --time-weight 0.02 --dry-run
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+import cv2
+import numpy as np
+import utils
+import verifier
+from batch import frame_count, read_frames
+from config import config
+from line_clustering import as_segments, segment_metrics
+from utils import ParamStore
+from vision_core import VisionProcessor
+
+# 影響偵測結果的流程設定：快取鍵包含這些值，不同流程的評估結果不會互相沿用
+PIPELINE_CONFIG = ('VERIFY_MODE', 'CLUSTER_LINES', 'PYRAMID_MODE', 'PYRAMID_LEVELS', 'CANDIDATE_MODE',
+                   'USE_DUAL_HOUGH', 'ROI_MODE')
+
+
+def search_space(dual=None):
+    """
+    搜尋範圍（與 tuner.py 滑桿範圍一致）：參數名稱 -> (最小值, 最大值)，皆為整數。
+    :param dual: 是否搜尋雙重 Hough 參數，None 時依 config.USE_DUAL_HOUGH
+    """
+    if dual is None:
+        dual = config.USE_DUAL_HOUGH
+    space = {
+        'bilateral_d': (1, 40),
+        'bilateral_sigmaColor': (1, 400),
+        'bilateral_sigmaSpace': (1, 200),
+        'canny_threshold1': (0, 1500),
+        'canny_threshold2': (0, 1500),
+        'min_inliers': (1, 100),
+    }
+    if dual:
+        space.update({
+            'hough_threshold_long': (1, 200),
+            'hough_minLineLength_long': (1, 200),
+            'hough_maxLineGap_long': (1, 100),
+            'hough_threshold_short': (1, 200),
+            'hough_minLineLength_short': (1, 50),
+            'hough_maxLineGap_short': (1, 100),
+        })
+    else:
+        space.update({
+            'hough_threshold': (1, 200),
+            'hough_minLineLength': (1, 200),
+            'hough_maxLineGap': (1, 100),
+        })
+    return space
+
+
+def sample_params(space, rng, n):
+    """
+    在搜尋範圍內均勻隨機取樣 n 組參數。
+    """
+    return [{k: int(rng.integers(lo, hi + 1)) for k, (lo, hi) in space.items()} for _ in range(n)]
+
+
+def load_labels(path):
+    """
+    :return: {幀編號: 標註線段 float (G,4)}
+    """
+    labels = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                labels[int(record['frame'])] = as_segments(record['lines'])
+    return labels
+
+
+def match_lines(detected, truth, angle_tol_deg=3.0, offset_tol=4.0):
+    """
+    偵測線段與標註線段一對一配對（同 LineTracker 的配對規則：角度與偏移都在容差內，成本小者優先）。
+    :return: 配對成功的數量
+    """
+    detected, truth = as_segments(detected), as_segments(truth)
+    if len(detected) == 0 or len(truth) == 0:
+        return 0
+    dtheta, offset, _ = segment_metrics(detected[:, None, :], truth[None, :, :])
+    cost = np.where((dtheta <= np.deg2rad(angle_tol_deg)) & (offset <= offset_tol),
+                    offset + np.rad2deg(dtheta), np.inf)
+    matched = 0
+    for _ in range(min(cost.shape)):
+        i, j = np.unravel_index(np.argmin(cost), cost.shape)
+        if not np.isfinite(cost[i, j]):
+            break
+        matched += 1
+        cost[i, :] = np.inf
+        cost[:, j] = np.inf
+    return matched
+
+
+# === 子行程 ===
+_worker = {}
+_WORKER_THREADS = 1  # 每個子行程的 OpenCV 執行緒數（平行度由行程數決定）
+
+
+def _init_worker(source, labeled, gray):
+    """
+    子行程初始化：只讀入有標註的幀（每個行程各自讀取，不在行程間傳遞影像）。
+    """
+    cv2.setNumThreads(_WORKER_THREADS)
+    wanted = set(labeled)
+    _worker['frames'] = {i: np.array(frame) for i, frame, _ in read_frames(source, min(wanted), max(wanted) + 1, gray)
+                         if i in wanted}
+
+
+def evaluate(task):
+    """
+    以一組參數處理指定的幀並與標註比較。
+    :param task: (params, [(幀編號, 標註線段)])
+    :return: {'tp', 'fp', 'fn', 'ms'}，ms 為每幀平均處理時間（特徵提取 + 驗證）
+    """
+    params, frames = task
+    vp = VisionProcessor(config)
+    tp = fp = fn = 0
+    elapsed = 0.0
+    min_inliers = params.get('min_inliers', config.MIN_INLIERS)
+    for i, truth in frames:
+        start = time.perf_counter()
+        f = vp.extract(_worker['frames'][i], params)
+        detected = verifier.verify_lines(f.candidate_lines, f.points, min_inliers=min_inliers,
+                                         edges=f.edges, index=f.index)
+        elapsed += time.perf_counter() - start
+        matched = match_lines(detected, truth, config.TRACK_ANGLE_TOL_DEG, config.TRACK_OFFSET_TOL)
+        tp += matched
+        fp += len(detected) - matched
+        fn += len(truth) - matched
+    return {'tp': tp, 'fp': fp, 'fn': fn, 'ms': elapsed * 1000 / max(1, len(frames))}
+
+
+def objective(result, time_weight):
+    """
+    :return: F1 - time_weight × 每幀毫秒數（越大越好）
+    """
+    tp, fp, fn = result['tp'], result['fp'], result['fn']
+    f1 = 2 * tp / (2 * tp + fp + fn) if tp else 0.0
+    return f1 - time_weight * result['ms']
+
+
+class ScoreCache:
+    """
+    評估結果快取：鍵為 (資料集, 流程設定, 參數, 評估的幀編號)，可存成 JSON 檔供下次沿用。
+    結果包含處理時間（ms），因此資料集字串需包含計時環境（見 timing_env()）。
+    """
+    def __init__(self, path=None, dataset=''):
+        """
+        :param path: 快取檔路徑，None 表示只存在記憶體
+        :param dataset: 資料集識別字串（來源與標註檔，以及計時環境），不同資料集或環境的結果不會互相沿用
+        """
+        self.path = path
+        self.dataset = dataset
+        self.pipeline = [[k, getattr(config, k)] for k in PIPELINE_CONFIG]
+        self.results = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.results = json.load(f)
+
+    def key(self, params, frames):
+        return json.dumps([self.dataset, self.pipeline, sorted(params.items()), [i for i, _ in frames]])
+
+    def get(self, params, frames):
+        return self.results.get(self.key(params, frames))
+
+    def put(self, params, frames, result):
+        self.results[self.key(params, frames)] = result
+
+    def save(self):
+        if self.path:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.results, f)
+            os.replace(tmp_path, self.path)
+
+
+def timing_env(workers):
+    """
+    計時環境識別字串：處理時間只在同一台機器、同樣的行程數與執行緒數、同版本 OpenCV 下可比較。
+    :param workers: 評估行程數
+    """
+    return f'{platform.node()}|{workers} procs x {_WORKER_THREADS} threads|opencv {cv2.__version__}'
+
+
+def successive_halving(pool, candidates, frames, cache, time_weight, min_frames=4, eta=3, log=print):
+    """
+    successive halving：每一輪以目前的幀數評估所有候選，保留前 1/eta，下一輪幀數乘以 eta，
+    直到以全部幀評估完最後剩下的候選。min_frames >= 幀數時等同純隨機搜尋。
+    :param pool: multiprocessing.Pool
+    :param candidates: 參數 dict 列表
+    :param frames: [(幀編號, 標註線段)]，已打亂順序（每輪取前 n 幀，較大的輪次包含較小的輪次）
+    :param cache: ScoreCache
+    :return: [(分數, 參數, 評估結果)]，依分數由高到低（最後一輪）
+    """
+    n = min(min_frames, len(frames))
+    while True:
+        subset = frames[:n]
+        todo = [p for p in candidates if cache.get(p, subset) is None]
+        for p, result in zip(todo, pool.map(evaluate, [(p, subset) for p in todo])):
+            cache.put(p, subset, result)
+        cache.save()
+        ranked = sorted(((objective(cache.get(p, subset), time_weight), p, cache.get(p, subset)) for p in candidates),
+                        key=lambda r: -r[0])
+        best_score, _, best = ranked[0]
+        log(f'rung: {len(candidates)} candidates x {n} frames ({len(todo)} evaluated, '
+            f'{len(candidates) - len(todo)} cached)  best {best_score:.4f} ({best["ms"]:.2f} ms/frame)')
+        if n >= len(frames):
+            return ranked
+        candidates = [p for _, p, _ in ranked[:max(1, len(candidates) // eta)]]
+        n = min(n * eta, len(frames))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline parameter search against labeled frames')
+    parser.add_argument('source', help='frame_store recording, image directory or video')
+    parser.add_argument('labels', help='JSON Lines ground truth: {"frame": i, "lines": [[x1, y1, x2, y2], ...]}')
+    parser.add_argument('--candidates', type=int, default=81, help='random parameter sets to try')
+    parser.add_argument('--min-frames', type=int, default=4, help='frames in the first halving rung')
+    parser.add_argument('--eta', type=int, default=3, help='halving rate')
+    parser.add_argument('--time-weight', type=float, default=0.01, help='objective penalty per ms of processing')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cache', default='autotune_cache.json', help='score cache file ("" to disable)')
+    parser.add_argument('--params', help='parameter file to read / update (default: config.PARAMS_FILE)')
+    parser.add_argument('--dry-run', action='store_true', help='do not write the params file')
+    args = parser.parse_args(argv)
+
+    labels = load_labels(args.labels)
+    total = frame_count(args.source)
+    labels = {i: lines for i, lines in labels.items() if i < total}
+    if not labels:
+        parser.error('no labeled frames inside the source')
+    rng = np.random.default_rng(args.seed)
+    frames = list(labels.items())
+    rng.shuffle(frames)
+    store = ParamStore(args.params)
+    current = store.get().copy()
+    # 目前的參數也一起比較，確保結果不會比現況差；
+    # 每組候選都以完整的參數檔為底，只替換搜尋的參數（評估與寫回的是同一組參數）
+    space = search_space()
+    candidates = [dict(current)]
+    candidates += [dict(current, **sample) for sample in sample_params(space, rng, args.candidates - 1)]
+    workers = args.workers or os.cpu_count()
+    dataset = (f'{os.path.abspath(args.source)}|{os.path.abspath(args.labels)}|{os.path.getmtime(args.labels)}|'
+               f'{timing_env(workers)}')
+    cache = ScoreCache(args.cache or None, dataset)
+    gray = config.CAPTURE_GRAY
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(args.source, list(labels), gray)) as pool:
+        ranked = successive_halving(pool, candidates, frames, cache, args.time_weight, args.min_frames, args.eta)
+    score, best, result = ranked[0]
+    print(f"best score {score:.4f}: tp {result['tp']} fp {result['fp']} fn {result['fn']} "
+          f"{result['ms']:.2f} ms/frame")
+    print(json.dumps({k: best[k] for k in space if k in best}))
+    if not args.dry_run:
+        utils.save_params(best, store.path)
+        print(f'written to {store.path}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,177 @@
+# batch.py
+# 批次處理工具：不開 GUI，對影片檔、圖片資料夾或 frame_store 錄製執行完整偵測流程，
+# 以 JSON Lines 逐幀輸出偵測結果
+# 用於 8BallPool_assist 大量錄製資料的偵測率統計與離線分析
+#
+# 流程：
+# 1. 將幀序列切成連續區段，分給多個行程平行執行「特徵提取 + 驗證」（每幀互相獨立）
+# 2. 主行程依幀順序收集各區段結果，以單一 LineTracker 依序更新，
+#    追蹤狀態在區段交界處自然延續，結果與逐幀串行處理完全相同
+# 3. 每幀輸出一行 JSON，邊處理邊寫出
+#
+# 用法：
+#   python batch.py session.mp4 --output lines.jsonl --workers 8
+#   python batch.py recordings/session1 --recorded-params > lines.jsonl
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+import cv2
+import numpy as np
+import verifier
+from capture import _IMAGE_EXTS
+from config import config
+from frame_store import FrameStore, is_recording
+from line_tracker import LineTracker
+from utils import ParamStore
+from vision_core import VisionProcessor
+
+
+def frame_count(source):
+    """
+    :param source: 影片檔、圖片檔 / 資料夾或錄製資料夾
+    :return: 總幀數
+    """
+    if is_recording(source):
+        return len(FrameStore(source))
+    if os.path.isdir(source):
+        return len(_image_files(source))
+    if source.lower().endswith(_IMAGE_EXTS):
+        return 1
+    video = cv2.VideoCapture(source)
+    if not video.isOpened():
+        raise ValueError(f'Cannot open video: {source}')
+    count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    video.release()
+    return count
+
+
+def _image_files(path):
+    return sorted(f for f in glob.glob(os.path.join(path, '*')) if f.lower().endswith(_IMAGE_EXTS))
+
+
+def read_frames(source, start, end, gray=True):
+    """
+    讀取 [start, end) 區段的畫面（每個行程各自開檔，不在行程間傳遞影像）。
+    :return: 產生 (幀編號, 畫面, 錄製時的參數或 None)
+    """
+    if is_recording(source):
+        store = FrameStore(source)
+        for i in range(start, end):
+            frame = store.frames[i]
+            if gray and frame.ndim == 3:
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            yield i, frame, store.params_at(i)
+        return
+    if os.path.isdir(source) or source.lower().endswith(_IMAGE_EXTS):
+        files = _image_files(source) if os.path.isdir(source) else [source]
+        flag = cv2.IMREAD_GRAYSCALE if gray else cv2.IMREAD_COLOR
+        for i in range(start, end):
+            yield i, cv2.imread(files[i], flag), None
+        return
+    video = cv2.VideoCapture(source)
+    try:
+        video.set(cv2.CAP_PROP_POS_FRAMES, start)
+        for i in range(start, end):
+            ok, frame = video.read()
+            if not ok:
+                return
+            yield i, cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if gray else frame, None
+    finally:
+        video.release()
+
+
+def _init_worker():
+    # 每個行程只用單執行緒 OpenCV，避免多行程 × 多執行緒互搶 CPU
+    cv2.setNumThreads(1)
+
+
+def detect_chunk(task):
+    """
+    子行程工作：對一個區段執行特徵提取與驗證（不含追蹤）。
+    :param task: (source, start, end, params, use_recorded_params, gray)
+    :return: [(幀編號, 驗證後線段 [[x1, y1, x2, y2], ...])]
+    """
+    source, start, end, params, use_recorded_params, gray = task
+    vp = VisionProcessor(config)
+    dual = config.USE_DUAL_HOUGH
+    results = []
+    for i, frame, recorded in read_frames(source, start, end, gray):
+        p = recorded if use_recorded_params and recorded is not None else params
+        features = vp.extract(frame, p, dual=dual)
+        verified = verifier.verify_lines(
+            features.candidate_lines, features.points,
+            min_inliers=p.get('min_inliers', config.MIN_INLIERS),
+            edges=features.edges, index=features.index
+        )
+        results.append((i, [np.ravel(line).tolist() for line in verified]))
+    return results
+
+
+def run(source, params, out, workers=None, chunk_size=64, use_recorded_params=False, gray=True):
+    """
+    平行偵測、依序追蹤，並以 JSON Lines 寫出每幀結果：
+    {"frame": 幀編號, "verified": [[x1, y1, x2, y2], ...], "lines": [[x1, y1, x2, y2, alpha], ...]}
+    :param out: 可寫入的文字檔物件
+    :return: 統計 dict（總幀數、有偵測到線段的幀數、耗時）
+    """
+    total = frame_count(source)
+    params = dict(params)
+    tasks = [(source, s, min(s + chunk_size, total), params, use_recorded_params, gray)
+             for s in range(0, total, chunk_size)]
+    tracker = LineTracker()
+    frames = detected = 0
+    start_time = time.perf_counter()
+    with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+        # imap 依區段順序回傳，追蹤器因此能跨區段延續狀態
+        for chunk in pool.imap(detect_chunk, tasks):
+            for i, verified in chunk:
+                tracker.update(verified)
+                stable = [np.ravel(line).tolist() + [alpha] for line, alpha in tracker.get_stable_results()]
+                out.write(json.dumps({'frame': i, 'verified': verified, 'lines': stable}) + '\n')
+                frames += 1
+                detected += bool(verified)
+    return {
+        'frames': frames,
+        'detected_frames': detected,
+        'detection_rate': detected / frames if frames else 0.0,
+        'seconds': time.perf_counter() - start_time,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Headless batch line detection (JSON Lines output)')
+    parser.add_argument('source', help='video file, image file / directory or frame_store recording')
+    parser.add_argument('--output', help='JSON Lines output file (default: stdout)')
+    parser.add_argument('--params', help='parameter file (default: config.PARAMS_FILE)')
+    parser.add_argument('--recorded-params', action='store_true',
+                        help='use the parameter snapshot stored with each recorded frame')
+    parser.add_argument('--workers', type=int, default=None, help='process count (default: CPU count)')
+    parser.add_argument('--chunk-size', type=int, default=64, help='frames per task')
+    color = parser.add_mutually_exclusive_group()
+    color.add_argument('--gray', dest='gray', action='store_true', default=config.CAPTURE_GRAY,
+                       help='process grayscale frames (default: config.CAPTURE_GRAY)')
+    color.add_argument('--color', dest='gray', action='store_false',
+                       help='process BGR frames')
+    args = parser.parse_args(argv)
+
+    params = ParamStore(args.params).get()
+    out = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        stats = run(args.source, params, out, args.workers, args.chunk_size,
+                    args.recorded_params, gray=args.gray)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    fps = stats['frames'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+    print(f"frames: {stats['frames']}  detected: {stats['detected_frames']} "
+          f"({stats['detection_rate']:.1%})  {fps:.1f} fps", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
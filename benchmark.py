@@ -0,0 +1,373 @@
+# benchmark.py
+# 效能測試工具：以錄製的畫面（圖片資料夾或 frame_store 錄製）重播，量測各階段與完整主循環的延遲、幀率與峰值記憶體
+# 用於 8BallPool_assist 的效能回歸檢查（不需要螢幕或 Qt，可在一般 Linux 主機執行）
+#
+# 用法：
+#   python benchmark.py frames/ --output bench.json
+#   python benchmark.py frames/ --output new.json --baseline bench.json --tolerance 0.15
+#   python benchmark.py frames/ --smoothing   # 比較各平滑濾波後端的耗時與邊緣品質
+#   python benchmark.py frames/ --candidates  # 比較 Hough（單一 / 雙重）與 RANSAC 候選的耗時與召回率
+
+import argparse
+import gc
+import json
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+import cv2
+import numpy as np
+import verifier
+from buffer_pool import BufferPool
+from capture import open_capture
+from config import config
+from line_clustering import as_segments, segment_metrics
+from line_tracker import LineTracker
+from pipeline import LineDetector, compose_frame
+from ransac import ransac_lines
+from smoothing import SMOOTH_BACKENDS, smooth
+from utils import ParamStore
+from vision_core import VisionProcessor, merge_lines
+
+
+def load_frames(source, gray=False):
+    """
+    讀入重播用的畫面（圖片檔、圖片資料夾或 frame_store 錄製資料夾）。
+    :return: 畫面列表（各自獨立的陣列）
+    """
+    with open_capture(None, source) as cap:
+        return [cap.grab(gray=gray).copy() for _ in range(len(cap))]
+
+
+def summarize(samples_ms):
+    """
+    :param samples_ms: 每次呼叫的耗時（毫秒）
+    :return: {'mean_ms', 'p50_ms', 'p99_ms', 'fps', 'samples'}
+    """
+    a = np.asarray(samples_ms, dtype=np.float64)
+    mean = float(a.mean())
+    return {
+        'mean_ms': mean,
+        'p50_ms': float(np.percentile(a, 50)),
+        'p99_ms': float(np.percentile(a, 99)),
+        'fps': 1000.0 / mean if mean > 0 else float('inf'),
+        'samples': int(len(a)),
+    }
+
+
+def time_calls(fn, inputs, repeat):
+    """
+    依序以每個輸入呼叫 fn，重複 repeat 輪，回傳每次呼叫的耗時（毫秒）。
+    """
+    fn(inputs[0])  # 暖身
+    samples = []
+    for _ in range(repeat):
+        for item in inputs:
+            start = time.perf_counter()
+            fn(item)
+            samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def peak_memory(fn, inputs):
+    """
+    以 tracemalloc 量測跑完一輪輸入期間 Python / NumPy 配置的峰值（位元組）。
+    另外執行一輪，避免 tracemalloc 的額外成本影響計時。
+    OpenCV 內部配置不在 tracemalloc 追蹤範圍內。
+    """
+    tracemalloc.start()
+    try:
+        for item in inputs:
+            fn(item)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def steady_allocations(fn, inputs):
+    """
+    量測穩定狀態下每次呼叫的配置量：先暖身一輪（緩衝區池在此時配置完成），
+    再以 tracemalloc 記錄每次呼叫期間超出呼叫前用量的峰值，以及期間發生的 GC 次數。
+    :return: (每次呼叫的平均暫時配置位元組, 最大值, GC 次數)
+    """
+    for item in inputs:
+        fn(item)
+    gc.collect()
+    collections = sum(s['collections'] for s in gc.get_stats())
+    per_call = []
+    tracemalloc.start()
+    try:
+        for item in inputs:
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            fn(item)
+            per_call.append(tracemalloc.get_traced_memory()[1] - base)
+    finally:
+        tracemalloc.stop()
+    return float(np.mean(per_call)), int(max(per_call)), sum(s['collections'] for s in gc.get_stats()) - collections
+
+
+def build_stages(frames, params):
+    """
+    準備各階段的獨立量測函式與輸入。
+    前一階段的輸出先算好，讓每個階段只量到自己的成本。
+    :return: {階段名稱: (fn, inputs)}
+    """
+    vp = VisionProcessor(config)
+    # 預先算好的各幀輸出要同時保留，不能共用同一組緩衝區
+    reference = VisionProcessor(config)
+    reference.pool = None
+    features = [reference.extract(frame, params) for frame in frames]
+    min_inliers = params.get('min_inliers', config.MIN_INLIERS)
+    pool = BufferPool() if config.BUFFER_POOL else None
+
+    def verify(f):
+        return verifier.verify_lines(f.candidate_lines, f.points, min_inliers=min_inliers, edges=f.edges, index=f.index,
+                                     pool=pool)
+
+    verified = [verify(f) for f in features]
+    tracker = LineTracker()
+
+    def track(lines):
+        tracker.update(lines)
+        return tracker.get_stable_results()
+
+    stable = [track(lines) for lines in verified]
+    shape = frames[0].shape[:2]
+    detector = LineDetector(config)
+    canvas = {'compose': None, 'tick': None}  # 同主程式：上一張畫布顯示完畢後沿用
+
+    def compose(lines):
+        canvas['compose'] = compose_frame(lines, shape, config, canvas['compose'])
+
+    def tick(frame):
+        canvas['tick'] = compose_frame(detector.process(frame, params), shape, config, canvas['tick'])
+
+    return {
+        'vision': (lambda frame: vp.extract(frame, params), frames),
+        'verify': (verify, features),
+        'track': (track, verified),
+        'compose': (compose, stable),
+        'tick': (tick, frames),
+    }
+
+
+def run(frames, params, repeat=3, stages=None):
+    """
+    執行效能測試。
+    :return: 結果 dict（可直接寫成 JSON）
+    """
+    results = {}
+    for name, (fn, inputs) in build_stages(frames, params).items():
+        if stages and name not in stages:
+            continue
+        stats = summarize(time_calls(fn, inputs, repeat))
+        stats['peak_tracemalloc_bytes'] = peak_memory(fn, inputs)
+        stats['alloc_mean_bytes'], stats['alloc_max_bytes'], stats['gc_collections'] = steady_allocations(fn, inputs)
+        results[name] = stats
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'frames': len(frames),
+            'frame_shape': list(frames[0].shape),
+            'repeat': repeat,
+            'params': dict(params),
+            'config': {k: getattr(config, k) for k in (
+                'SMOOTH_BACKEND', 'BUFFER_POOL', 'USE_DUAL_HOUGH', 'CANDIDATE_MODE', 'PYRAMID_MODE', 'VERIFY_MODE', 'CLUSTER_LINES', 'INCREMENTAL_MODE', 'ROI_MODE', 'OVERLAY_RENDER_MODE')},
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'machine': platform.machine(),
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        },
+        'stages': results,
+    }
+
+
+def compare_smoothing(frames, params, repeat=3):
+    """
+    比較各平滑濾波後端：
+    - 濾波耗時（mean / p50 / p99）
+    - 邊緣品質：以雙邊濾波後的 Canny 邊緣為基準，1 像素容差下的 precision / recall / F1
+    - 完整流程每幀驗證通過的線段數
+    :return: {後端: 結果 dict}
+    """
+    vp = VisionProcessor(config)
+    _, d, sigma_color, sigma_space = vp.smooth_params(params)
+    canny = vp.canny_params(params)
+    grays = [f if f.ndim == 2 else cv2.cvtColor(f, cv2.COLOR_BGR2GRAY) for f in frames]
+    kernel = np.ones((3, 3), dtype=np.uint8)
+    refs = [cv2.Canny(smooth(g, 'bilateral', d, sigma_color, sigma_space), *canny) for g in grays]
+    ref_near = [cv2.dilate(r, kernel) for r in refs]
+    results = {}
+    for backend in SMOOTH_BACKENDS:
+        stats = summarize(time_calls(lambda g: smooth(g, backend, d, sigma_color, sigma_space), grays, repeat))
+        hit_p = hit_r = n_edges = n_refs = 0
+        for g, ref, near in zip(grays, refs, ref_near):
+            edges = cv2.Canny(smooth(g, backend, d, sigma_color, sigma_space), *canny)
+            hit_p += cv2.countNonZero(cv2.bitwise_and(edges, near))
+            hit_r += cv2.countNonZero(cv2.bitwise_and(ref, cv2.dilate(edges, kernel)))
+            n_edges += cv2.countNonZero(edges)
+            n_refs += cv2.countNonZero(ref)
+        precision = hit_p / n_edges if n_edges else 0.0
+        recall = hit_r / n_refs if n_refs else 0.0
+        stats['edge_precision'] = precision
+        stats['edge_recall'] = recall
+        stats['edge_f1'] = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        p = dict(params, smooth_backend=backend)
+        min_inliers = p.get('min_inliers', config.MIN_INLIERS)
+        lines = 0
+        for frame in frames:
+            f = vp.extract(frame, p)
+            lines += len(verifier.verify_lines(f.candidate_lines, f.points, min_inliers=min_inliers,
+                                               edges=f.edges, index=f.index))
+        stats['lines_per_frame'] = lines / len(frames)
+        results[backend] = stats
+    return results
+
+
+def compare_candidates(frames, params, repeat=3):
+    """
+    比較候選線段來源（在同一組邊緣圖 / 點雲上）：
+    - 候選產生耗時（mean / p50 / p99）
+    - 每幀候選數與驗證通過的線段數
+    - 召回率：以雙重 Hough 驗證通過的線段為基準，角度與偏移在分群容差內且有重疊即視為找到
+    'ransac_seeded' 以前一幀自己的驗證結果為種子（同主程式的 RANSAC 模式）。
+    :return: {來源: 結果 dict}
+    """
+    vp = VisionProcessor(config)
+    vp.pool = None
+    features = [vp.extract(frame, params) for frame in frames]
+    min_inliers = params.get('min_inliers', config.MIN_INLIERS)
+    single = vp.hough_params(params)
+    long_, short = vp.hough_params(params, 'long'), vp.hough_params(params, 'short')
+    min_ransac, min_length, max_gap, max_lines, confidence = vp.ransac_params(params)
+
+    def hough(edges, threshold, min_line_length, max_line_gap):
+        return cv2.HoughLinesP(edges, 1, np.pi / 180, threshold=threshold,
+                               minLineLength=min_line_length, maxLineGap=max_line_gap)
+
+    def ransac(points, seeds=None):
+        return ransac_lines(points, seeds, min_inliers=min_ransac, min_length=min_length, max_gap=max_gap,
+                            max_lines=max_lines, confidence=confidence, batch=config.RANSAC_BATCH,
+                            max_iterations=config.RANSAC_MAX_ITERATIONS, max_elements=config.VERIFY_MAX_ELEMENTS)
+
+    def verify(lines, f):
+        return verifier.verify_lines(lines, f.points, min_inliers=min_inliers, edges=f.edges, index=f.index)
+
+    # 種子：前一幀的驗證結果（先跑一輪未計時的序列取得）
+    seeds, previous = [], None
+    for f in features:
+        seeds.append(previous)
+        previous = verify(ransac(f.points, previous), f) or None
+    generators = {
+        'hough': (lambda f: hough(f.edges, *single), features),
+        'dual_hough': (lambda f: merge_lines(hough(f.edges, *long_), hough(f.edges, *short)), features),
+        'ransac': (lambda f: ransac(f.points), features),
+        'ransac_seeded': (lambda item: ransac(item[0].points, item[1]), list(zip(features, seeds))),
+    }
+    reference = [as_segments(verify(generators['dual_hough'][0](f), f)) for f in features]
+    angle_tol = np.deg2rad(config.CLUSTER_ANGLE_TOL_DEG)
+    results = {}
+    for name, (fn, inputs) in generators.items():
+        stats = summarize(time_calls(fn, inputs, repeat))
+        n_candidates = n_verified = hits = n_refs = 0
+        for f, item, ref in zip(features, inputs, reference):
+            lines = fn(item)
+            found = as_segments(verify(lines, f))
+            n_candidates += 0 if lines is None else len(lines)
+            n_verified += len(found)
+            n_refs += len(ref)
+            if len(ref) and len(found):
+                angle, offset, gap = segment_metrics(ref[:, None], found[None])
+                hits += int(((angle < angle_tol) & (offset < config.CLUSTER_RHO_TOL) & (gap == 0)).any(axis=1).sum())
+        stats['candidates_per_frame'] = n_candidates / len(frames)
+        stats['lines_per_frame'] = n_verified / len(frames)
+        stats['recall'] = hits / n_refs if n_refs else 1.0
+        results[name] = stats
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    與基準結果比較，回傳退步的階段。
+    以 p50 比較（比 mean / p99 穩定），超過基準 (1 + tolerance) 倍即視為退步。
+    :return: [(階段, 基準 p50, 目前 p50)]
+    """
+    regressions = []
+    for name, stats in results['stages'].items():
+        base = baseline.get('stages', {}).get(name)
+        if base and stats['p50_ms'] > base['p50_ms'] * (1 + tolerance):
+            regressions.append((name, base['p50_ms'], stats['p50_ms']))
+    return regressions
+
+
+def print_report(results):
+    print(f"{'stage':<10} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9} {'fps':>9} {'peak KiB':>10} "
+          f"{'alloc KiB/call':>15} {'gc':>4}")
+    for name, s in results['stages'].items():
+        print(f"{name:<10} {s['mean_ms']:9.3f} {s['p50_ms']:9.3f} {s['p99_ms']:9.3f} {s['fps']:9.1f} "
+              f"{s['peak_tracemalloc_bytes'] / 1024:10.1f} {s['alloc_mean_bytes'] / 1024:15.1f} {s['gc_collections']:4d}")
+
+
+def print_smoothing(results):
+    print(f"{'backend':<16} {'mean ms':>9} {'p99 ms':>9} {'edge P':>8} {'edge R':>8} {'edge F1':>8} {'lines':>7}")
+    for name, s in results.items():
+        print(f"{name:<16} {s['mean_ms']:9.3f} {s['p99_ms']:9.3f} {s['edge_precision']:8.3f} "
+              f"{s['edge_recall']:8.3f} {s['edge_f1']:8.3f} {s['lines_per_frame']:7.2f}")
+
+
+def print_candidates(results):
+    print(f"{'candidates':<16} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9} {'cands':>7} {'lines':>7} {'recall':>8}")
+    for name, s in results.items():
+        print(f"{name:<16} {s['mean_ms']:9.3f} {s['p50_ms']:9.3f} {s['p99_ms']:9.3f} "
+              f"{s['candidates_per_frame']:7.2f} {s['lines_per_frame']:7.2f} {s['recall']:8.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay-based per-stage benchmark')
+    parser.add_argument('source', help='image file, image directory or frame_store recording')
+    parser.add_argument('--params', help='parameter file (default: config.PARAMS_FILE)')
+    parser.add_argument('--repeat', type=int, default=3, help='passes over the frames')
+    parser.add_argument('--stages', nargs='*', help='only run these stages')
+    color = parser.add_mutually_exclusive_group()
+    color.add_argument('--gray', dest='gray', action='store_true', default=config.CAPTURE_GRAY,
+                       help='feed grayscale frames (default: config.CAPTURE_GRAY)')
+    color.add_argument('--color', dest='gray', action='store_false',
+                       help='feed BGR frames')
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--baseline', help='compare against a previous JSON result')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='allowed p50 slowdown ratio')
+    parser.add_argument('--smoothing', action='store_true', help='also compare smoothing backends')
+    parser.add_argument('--candidates', action='store_true', help='also compare Hough and RANSAC candidate generators')
+    args = parser.parse_args(argv)
+
+    params = ParamStore(args.params).get()
+    frames = load_frames(args.source, gray=args.gray)
+    results = run(frames, params, args.repeat, args.stages)
+    print_report(results)
+    if args.smoothing:
+        results['smoothing'] = compare_smoothing(frames, params, args.repeat)
+        print()
+        print_smoothing(results['smoothing'])
+    if args.candidates:
+        results['candidates'] = compare_candidates(frames, params, args.repeat)
+        print()
+        print_candidates(results['candidates'])
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for name, base, now in regressions:
+            print(f'REGRESSION {name}: p50 {base:.3f} ms -> {now:.3f} ms')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
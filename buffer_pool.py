@@ -0,0 +1,77 @@
+# buffer_pool.py
+# 緩衝區池模組：預先配置主循環每幀都要用到的陣列，以 OpenCV / NumPy 的 dst= / out= 參數重複寫入
+# 用於 8BallPool_assist 的視覺核心、驗證與 overlay 合成，讓穩定狀態下的主循環幾乎不配置新記憶體
+#
+# - 每個名稱對應一塊只會變大的扁平緩衝區；get() 回傳其前段 reshape 成所需形狀的 view
+#   （ROI 大小每幀不同、點雲數量每幀不同，暖身後都不需要重新配置）
+# - 池子不加鎖：每個擁有者（VisionProcessor、管線的某個執行緒）各自持有一個池子
+# - 回傳的陣列在下一次以同名稱 get() 時會被覆寫，需要保留時請自行 copy()
+
+import math
+import numpy as np
+
+
+class BufferPool:
+    """
+    具名緩衝區池：
+        edges = pool.get('edges', gray.shape)
+        cv2.Canny(filtered, t1, t2, edges=edges)
+    """
+    def __init__(self, growth=1.25):
+        """
+        :param growth: 緩衝區不夠大時，新容量為所需大小的幾倍（預留空間，避免點雲數量小幅增加就重新配置）
+        """
+        self.growth = growth
+        self._buffers = {}      # 名稱 -> 扁平緩衝區
+        self.allocations = 0    # 配置（含重新配置）次數，暖身後應維持不變
+
+    def get(self, name, shape, dtype=np.uint8):
+        """
+        取得指定形狀的緩衝區（內容未初始化）。
+        :param name: 緩衝區名稱
+        :param shape: 形狀 tuple 或整數
+        :param dtype: 資料型別
+        :return: C 連續的 numpy.ndarray view
+        """
+        dtype = np.dtype(dtype)
+        shape = (int(shape),) if np.isscalar(shape) else shape
+        size = math.prod(shape)
+        buf = self._buffers.get(name)
+        if buf is None or buf.dtype != dtype or buf.size < size:
+            capacity = size if buf is None or buf.dtype != dtype else max(size, int(size * self.growth))
+            buf = self._buffers[name] = np.empty(max(1, capacity), dtype=dtype)
+            self.allocations += 1
+        return buf[:size].reshape(shape)
+
+    def zeros(self, name, shape, dtype=np.uint8):
+        """
+        同 get()，但先清為 0。
+        """
+        out = self.get(name, shape, dtype)
+        out.fill(0)
+        return out
+
+    def arange(self, n):
+        """
+        0..n-1 的索引表（只在需要更長時重新建立），給 np.compress 取出邊緣像素的線性索引用。
+        :return: int32 (n,) view
+        """
+        table = self._buffers.get('__arange__')
+        if table is None or table.size < n:
+            table = self._buffers['__arange__'] = np.arange(max(1, int(n * self.growth)), dtype=np.int32)
+            self.allocations += 1
+        return table[:n]
+
+    @property
+    def nbytes(self):
+        """
+        :return: 池子目前持有的總位元組數
+        """
+        return sum(buf.nbytes for buf in self._buffers.values())
+
+
+def point_dtype(shape):
+    """
+    點雲座標的資料型別：畫面邊長在 int16 範圍內時用 int16（記憶體與頻寬為 int64 的 1/4）。
+    """
+    return np.int16 if max(shape[:2]) <= np.iinfo(np.int16).max else np.int32
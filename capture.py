@@ -1,19 +1,184 @@
 # capture.py
 # 螢幕擷取模組：擷取指定矩形區域的螢幕畫面，並轉為 OpenCV BGR 格式
 # 用於 8BallPool_assist 的畫面輸入
+#
+# ScreenCapture：長駐的擷取工作階段，持續保持 mss 連線、零拷貝讀取原始緩衝區，
+#                並重複使用預先配置的輸出陣列（可選擇只輸出灰階）
+# FileCapture  ：以圖片檔（單檔或資料夾）模擬螢幕，介面與 ScreenCapture 相同，
+#                可在沒有遊戲畫面的 Linux（Xvfb / 無螢幕）上做效能測試
+# ReplaySource ：重播 frame_store 錄製的畫面（記憶體映射、零拷貝），見 frame_store.py
 
+import argparse
+import glob
+import os
+import threading
+import time
 import numpy as np
 import mss
 import cv2
+from frame_store import ReplaySource, is_recording
+
+_IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.bmp')
+_local = threading.local()  # capture_screen 用：每個執行緒各自持有一個擷取工作階段
+
 
 def capture_screen(rect):
     """
     擷取指定矩形區域的螢幕畫面，並轉為 BGR 格式（OpenCV 用）。
+    沿用同一執行緒中的長駐擷取工作階段，回傳獨立的陣列副本。
     :param rect: {'top', 'left', 'width', 'height'} 擷取區域
     :return: numpy.ndarray (H, W, 3) BGR
     """
-    with mss.mss() as sct:
-        img = np.array(sct.grab(rect))  # BGRA 格式
-        # 轉為 BGR（去除 alpha）
-        bgr = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-        return bgr 
\ No newline at end of file
+    session = getattr(_local, 'session', None)
+    if session is None or session.rect != rect:
+        if session is not None:
+            session.close()
+        session = ScreenCapture(rect)
+        _local.session = session
+    return session.grab().copy()
+
+
+class _BufferedCapture:
+    """
+    擷取來源共用邏輯：將 BGRA 原始畫面轉入預先配置的 BGR / 灰階緩衝區。
+    子類別只需實作 _grab_bgra()。
+    """
+    def __init__(self, rect, gray=False):
+        """
+        :param rect: {'top', 'left', 'width', 'height'} 擷取區域
+        :param gray: True 時 grab() 預設只輸出灰階 (H, W)
+        """
+        self.rect = dict(rect)
+        self.gray = gray
+        self._bgr = None   # 預先配置的 BGR 輸出 (H, W, 3)
+        self._gray = None  # 預先配置的灰階輸出 (H, W)
+
+    def _grab_bgra(self):
+        raise NotImplementedError
+
+    def grab(self, gray=None):
+        """
+        擷取一幀。回傳的陣列為內部緩衝區，下一次 grab() 會被覆寫；
+        需要保留時請自行 copy()。
+        :param gray: 是否輸出灰階，None 時使用建構時的設定
+        :return: numpy.ndarray (H, W, 3) BGR 或 (H, W) 灰階
+        """
+        bgra = self._grab_bgra()
+        h, w = bgra.shape[:2]
+        if gray if gray is not None else self.gray:
+            if self._gray is None or self._gray.shape != (h, w):
+                self._gray = np.empty((h, w), dtype=np.uint8)
+            cv2.cvtColor(bgra, cv2.COLOR_BGRA2GRAY, dst=self._gray)
+            return self._gray
+        if self._bgr is None or self._bgr.shape != (h, w, 3):
+            self._bgr = np.empty((h, w, 3), dtype=np.uint8)
+        cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=self._bgr)
+        return self._bgr
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ScreenCapture(_BufferedCapture):
+    """
+    長駐螢幕擷取：
+    1. mss 連線只建立一次（mss 物件不可跨執行緒，請在使用的執行緒中建立）
+    2. 以 np.frombuffer 直接檢視 mss 的原始 BGRA 緩衝區，不另外複製
+    3. 色彩轉換直接寫入預先配置的輸出陣列
+    """
+    def __init__(self, rect, gray=False):
+        super().__init__(rect, gray)
+        self._sct = mss.mss()
+
+    def _grab_bgra(self):
+        shot = self._sct.grab(self.rect)
+        # Retina 螢幕上 shot 的實際像素大小可能是 rect 的 2 倍
+        return np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+
+    def close(self):
+        if self._sct is not None:
+            self._sct.close()
+            self._sct = None
+
+
+class FileCapture(_BufferedCapture):
+    """
+    以圖片檔模擬螢幕擷取（循環播放）：
+    path 可以是單一圖片或圖片資料夾（依檔名排序）。
+    圖片在建立時一次讀入並轉為 BGRA，grab() 的成本只剩色彩轉換。
+    """
+    def __init__(self, path, rect=None, gray=False):
+        if os.path.isdir(path):
+            files = sorted(f for f in glob.glob(os.path.join(path, '*')) if f.lower().endswith(_IMAGE_EXTS))
+        else:
+            files = [path]
+        if not files:
+            raise FileNotFoundError(f'No images found in {path}')
+        self._frames = []
+        for f in files:
+            img = cv2.imread(f, cv2.IMREAD_COLOR)
+            if img is None:
+                raise ValueError(f'Cannot read image: {f}')
+            self._frames.append(cv2.cvtColor(img, cv2.COLOR_BGR2BGRA))
+        h, w = self._frames[0].shape[:2]
+        super().__init__(rect or {'top': 0, 'left': 0, 'width': w, 'height': h}, gray)
+        self._index = 0
+
+    def __len__(self):
+        return len(self._frames)
+
+    def _grab_bgra(self):
+        frame = self._frames[self._index]
+        self._index = (self._index + 1) % len(self._frames)
+        return frame
+
+
+def open_capture(rect, source=None, gray=False):
+    """
+    依來源建立擷取物件。
+    :param rect: {'top', 'left', 'width', 'height'} 擷取區域
+    :param source: None 表示螢幕；錄製資料夾表示 ReplaySource；圖片檔或資料夾路徑表示 FileCapture
+    :param gray: 是否預設只輸出灰階
+    :return: ScreenCapture、ReplaySource 或 FileCapture
+    """
+    if source and is_recording(source):
+        return ReplaySource(source, rect, gray=gray)
+    if source:
+        return FileCapture(source, rect, gray=gray)
+    return ScreenCapture(rect, gray=gray)
+
+
+if __name__ == '__main__':
+    # 擷取效能測試：比較舊的 capture_screen 與長駐工作階段
+    # 例：python capture.py --frames 300（Linux 可搭配 Xvfb：xvfb-run python capture.py）
+    #     python capture.py --source recordings/frames/
+    from config import config
+    parser = argparse.ArgumentParser(description='Capture throughput benchmark')
+    parser.add_argument('--source', help='image file or directory (default: screen)')
+    parser.add_argument('--frames', type=int, default=200)
+    args = parser.parse_args()
+    rect = config.GAME_WINDOW_RECT
+
+    def bench(label, fn):
+        fn()  # 暖身
+        start = time.perf_counter()
+        for _ in range(args.frames):
+            fn()
+        ms = (time.perf_counter() - start) * 1000 / args.frames
+        print(f'{label:<20} {ms:7.3f} ms/frame')
+
+    if args.source is None:
+        def legacy():
+            with mss.mss() as sct:
+                img = np.array(sct.grab(rect))
+                return cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+        bench('legacy', legacy)
+    with open_capture(rect, args.source) as cap:
+        bench('session (BGR)', cap.grab)
+        bench('session (gray)', lambda: cap.grab(gray=True))
@@ -14,12 +14,24 @@ class Config:
         'height': 188
     }
 
+    # === 畫面來源 ===
+    CAPTURE_SOURCE = None  # None: 擷取螢幕；圖片檔或資料夾路徑: 以檔案模擬畫面；錄製資料夾: 重播錄製的畫面
+    CAPTURE_GRAY = False   # True: 主程式只需灰階，直接擷取灰階可省去一次 BGR 轉換與複製
+
+    # === 畫面錄製（離線調參 / 效能測試用） ===
+    RECORD_PATH = None      # 錄製資料夾；None 表示不錄製
+    RECORD_CAPACITY = 3000  # 最多錄製的幀數（預先配置，寫滿後停止錄製）
+
     # === HSV 顏色過濾參數 ===
     # 用於過濾白色輔助線，對光線和螢幕非常敏感，建議視情況微調
     HSV_WHITE_LOWER = np.array([0, 0, 200])
     HSV_WHITE_UPPER = np.array([180, 30, 255])
+    # 啟用時只保留白色區域附近的 Canny 邊緣（可由參數檔 'hsv_gate' 切換；需要彩色畫面，灰階時只比較亮度）
+    HSV_GATE = False
+    HSV_GATE_DILATE = 2  # 白色遮罩向外擴張的像素數（邊緣在白線外側 1 像素）
 
     # === 影像處理參數（預設值，會被 params_ransac.json 覆蓋） ===
+    SMOOTH_BACKEND = 'bilateral'    # 平滑濾波後端：'bilateral' / 'bilateral_down' / 'guided' / 'median' / 'box'
     BILATERAL_D = 20                # 雙邊濾波 d
     BILATERAL_SIGMA_COLOR = 200     # 雙邊濾波 sigmaColor
     BILATERAL_SIGMA_SPACE = 1       # 雙邊濾波 sigmaSpace
@@ -43,16 +55,102 @@ class Config:
     # === Hough 模式開關 ===
     USE_DUAL_HOUGH = True  # True: 雙重 Hough, False: 單一 Hough
 
+    # === 候選線段來源 ===
+    # 'hough': HoughLinesP（單一 / 雙重依 USE_DUAL_HOUGH）, 'ransac': 在邊緣點雲上批次 RANSAC（ransac.py）
+    CANDIDATE_MODE = 'hough'
+    RANSAC_BATCH = 128             # 每批同時評估的兩點樣本數
+    RANSAC_MAX_ITERATIONS = 2048   # 每條線段最多取樣次數（未達信心水準時的上限）
+    RANSAC_CONFIDENCE = 0.99       # 自適應停止的信心水準
+    RANSAC_MAX_LINES = 3           # 每幀最多提出幾條線段（依支持點數由多到少；驗證也只保留前 verifier.TOP_K 條）
+    RANSAC_MIN_LENGTH = 20         # 線段最短長度（像素）
+    RANSAC_MAX_GAP = 20            # 同一線段上相鄰支持點的最大間隙（像素）
+
+    # === 金字塔模式（低解析度找候選，再在全解析度的窄帶內精修） ===
+    PYRAMID_MODE = False
+    PYRAMID_LEVELS = 1  # 候選偵測在縮小 2^levels 倍的畫面上進行
+    PYRAMID_BAND = 3    # 精修時沿候選線段兩側各取幾個全解析度像素
+
+    # === 候選線段分群（驗證前合併近似共線的 Hough 線段） ===
+    # 預設關閉（輸出與原始流程相同）；開啟後同一條線的重複候選會合併，驗證結果的前 TOP_K 條可能由較短的線段補上
+    CLUSTER_LINES = False
+    CLUSTER_ANGLE_TOL_DEG = 4.0  # 角度容差（度）
+    CLUSTER_RHO_TOL = 3.0        # 偏移容差（像素）：線段端點到該群合併直線的距離
+    CLUSTER_MAX_GAP = 20.0       # 同一群線段沿線方向的最大間隙（像素）
+    CLUSTER_MIN_LENGTH = 5.0     # 短於此長度的片段不參與分群（反鋸齒斜線的階梯片段）
+
+    # === 線段驗證引擎 ===
+    # 'loop': 原始逐線段迴圈, 'numpy': 分塊向量化, 'raster': 邊緣圖查表, 'grid': 空間索引
+    VERIFY_MODE = 'loop'
+    VERIFY_MAX_ELEMENTS = 1 << 18  # 'numpy' 後端每塊最多計算的 (線段數 × 點數)，限制暫存記憶體
+    GRID_CELL_SIZE = 8             # 'grid' 後端的點雲索引格子邊長（像素）
+
+    # === 緩衝區池（buffer_pool.py） ===
+    # True: 灰階、濾波、邊緣、點雲（int16）與驗證暫存陣列都寫入預先配置的緩衝區，穩定狀態下幾乎不配置記憶體
+    BUFFER_POOL = False
+
+    # === 主循環排程（scheduler.py，取代固定 30ms 的計時器） ===
+    SCHEDULER_ENABLED = True          # False：改回固定週期（SCHEDULER_BUDGET_MS）的計時器，不做截止時間排程與閒置降頻
+    SCHEDULER_BUDGET_MS = 30          # 全速時的目標週期（延遲預算）
+    SCHEDULER_IDLE_INTERVAL_MS = 200  # 閒置（一段時間沒有線段）時的週期，0 表示永不閒置
+    SCHEDULER_IDLE_AFTER_S = 2.0      # 持續多久沒有線段後進入閒置（閒置中畫面有變化立即恢復全速）
+    SCHEDULER_MIN_GAP_MS = 1          # 兩次主循環之間至少留給 Qt 事件迴圈的時間
+
+    # === 多執行緒管線模式 ===
+    # True: 擷取 / 視覺 / overlay 合成各自在背景執行緒執行，Qt 主執行緒只更新影像
+    USE_PIPELINE = False
+    PIPELINE_CAPTURE_INTERVAL_MS = 15  # 擷取執行緒兩次擷取的最短間隔
+    PIPELINE_POLL_INTERVAL_MS = 10     # Qt 主執行緒檢查新 overlay 影像的間隔
+
+    # === 增量模式（靜態畫面略過視覺流程） ===
+    INCREMENTAL_MODE = False
+    FRAME_CHANGE_THRESHOLD = 2        # 像素灰階差異門檻
+    FRAME_CHANGE_MIN_PIXELS = 0       # 超過門檻的像素數需大於此值才視為畫面變化
+    FRAME_FINGERPRINT_SCALE = 4       # 指紋縮小倍率（INTER_AREA 平均，1 像素的細線移動仍遠超過差異門檻）
+    FRAME_CHANGE_REPORT_FRAMES = 300  # 每隔幾幀將這段期間的略過率記入效能指標（'skip_pct'），0 表示不記錄
+
+    # === ROI 模式（只處理追蹤線段周圍區域） ===
+    # 預設關閉；開啟後窄帶外的畫面有變化時仍會做全畫面搜尋
+    ROI_MODE = False
+    ROI_MARGIN = 24          # 窄帶半寬：沿追蹤線段兩側（與兩端）各處理幾個像素
+    ROI_REFRESH_FRAMES = 15  # 連續幾幀 ROI 處理後強制做一次全畫面搜尋
+
     # === 輔助線繪製參數 ===
     LINE_ALPHA_DEFAULT = 40         # 輔助線初始透明度（0~255）
     LINE_FADE_STEP = 8              # 每幀淡出速度（數值越大淡出越快）
     LINE_WIDTH = 2                  # 輔助線寬度（像素）
     LINE_COLOR = (255, 255, 255)    # 輔助線顏色（純白）
+    # Overlay 繪製方式：'vector' 以 QPainter 直接畫線並只重繪線段區域；'image' 每幀合成整張 RGBA 畫布
+    OVERLAY_RENDER_MODE = 'image'
+    OVERLAY_DIRTY_SPAN = 16         # 向量模式的重繪區域：每條線段沿主軸每隔幾像素切成一個小矩形
+
+    # === 線段追蹤參數 ===
+    TRACK_MAX_LINES = 16            # 同時追蹤的線段上限（固定容量，超過時丟棄最淡的線段）
+    TRACK_ANGLE_TOL_DEG = 3.0       # 視為同一條線的角度容差（度）
+    TRACK_OFFSET_TOL = 4.0          # 視為同一條線的偏移容差（像素）
+    TRACK_SMOOTHING = False         # 是否以等速模型平滑端點
+    TRACK_SMOOTHING_ALPHA = 0.6     # 位置修正比例（1 表示完全採用量測值）
+    TRACK_SMOOTHING_BETA = 0.2      # 速度修正比例
 
     # === 參數檔案名稱 ===
     PARAMS_FILE = 'params_ransac.json'  # 供 utils.load_params 使用
+    PARAMS_POLL_INTERVAL_MS = 100       # ParamStore 檢查參數檔是否變更的間隔
+    PARAMS_SAVE_DEBOUNCE_MS = 150       # tuner 滑桿停止變動多久後才寫入參數檔
+
+    # === 效能監測（metrics.py；可由參數檔 'metrics_enabled' / 'metrics_hud' 在執行中切換） ===
+    METRICS_ENABLED = False          # 是否記錄各步驟耗時與數量
+    METRICS_HUD = False              # 是否在 overlay 左上角顯示 HUD
+    METRICS_WINDOW = 512             # 每個指標保留最近幾筆（計算 p50 / p99）
+    METRICS_LOG_INTERVAL_S = 5.0     # 每隔幾秒印出一行摘要，0 表示不印
+    METRICS_PROM_FILE = None         # Prometheus text format 輸出檔，None 表示不輸出
+    METRICS_EXPORT_INTERVAL_S = 5.0  # 每隔幾秒寫出 Prometheus 檔案
+    METRICS_HUD_INTERVAL_MS = 500    # HUD 文字更新間隔（避免每幀重繪）
 
     # === 其他開關 ===
     ENABLE_TUNER = True             # 是否自動啟動參數調整器
+    # True: tuner 經由共享記憶體（shared_frames.py）取得主程式已擷取的畫面與階段輸出，參數直接送回主程式；
+    # False: tuner 自行擷取畫面並重跑視覺流程，只透過參數檔溝通
+    TUNER_SHARED = False
+    TUNER_SHM_SCALE = 2             # 共享畫面容量 = 擷取區域像素數 × SCALE²（Retina 畫面實際像素為 2 倍）
+    TUNER_SHM_MAX_LINES = 512       # 最多分享幾條候選線段
 
 config = Config() 
\ No newline at end of file
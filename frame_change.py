@@ -0,0 +1,114 @@
+# frame_change.py
+# 畫面變化偵測模組：以低成本指紋比對判斷畫面是否與上次處理的畫面相同
+# 用於 8BallPool_assist 的增量模式（靜態畫面略過整條視覺流程）
+
+import cv2
+import numpy as np
+
+
+class FrameChangeDetector:
+    """
+    畫面變化偵測：
+    1. 將畫面轉灰階並依 scale 縮小，作為指紋
+    2. 與「上一次判定為變化」的參考指紋逐像素比較（避免緩慢漂移被累積忽略）
+    3. 差異大於 threshold 的像素數超過 min_pixels 才視為變化
+    同時統計略過率（未變化幀 / 總幀數）。
+    指紋、灰階與差異圖都寫入預先配置的緩衝區，參考指紋與新指紋兩塊緩衝區輪替使用，每幀不配置新陣列。
+    """
+    def __init__(self, threshold=2, min_pixels=0, scale=1):
+        """
+        :param threshold: 像素灰階差異門檻（0~255）
+        :param min_pixels: 超過門檻的像素數需大於此值才算變化
+        :param scale: 指紋縮小倍率；越大越快，但細線移動在指紋上的灰階變化會被平均掉（約 1/scale），門檻需相應調低
+        """
+        self.threshold = threshold
+        self.min_pixels = min_pixels
+        self.scale = max(1, int(scale))
+        self.reference = None  # 參考指紋
+        self._scratch = None   # 新指紋的緩衝區（與 reference 輪替）
+        self._gray = None      # BGR 輸入縮小前的灰階緩衝區
+        self._diff = None      # 差異圖緩衝區
+        self._mask = None      # changed_outside() 的區域遮罩緩衝區
+        self.motion = None     # 最近一次 changed() 的差異圖（超過門檻為 255）；沒有參考指紋時為 None
+        self.total = 0         # 檢查過的幀數
+        self.skipped = 0       # 判定為未變化的幀數
+
+    def fingerprint(self, frame):
+        """
+        :param frame: BGR 或灰階畫面
+        :return: 灰階指紋 (h/scale, w/scale)（內部緩衝區，下一次呼叫可能被覆寫）
+        """
+        h, w = frame.shape[:2]
+        size = (h, w) if self.scale == 1 else (max(1, h // self.scale), max(1, w // self.scale))
+        fp = self._scratch = _reuse(self._scratch, size)
+        if self.scale == 1:
+            if frame.ndim == 2:
+                np.copyto(fp, frame)
+            else:
+                cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=fp)
+            return fp
+        gray = frame
+        if frame.ndim != 2:
+            gray = self._gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=_reuse(self._gray, (h, w)))
+        cv2.resize(gray, size[::-1], dst=fp, interpolation=cv2.INTER_AREA)
+        return fp
+
+    def changed(self, frame):
+        """
+        判斷畫面是否與參考指紋不同；若不同則更新參考指紋。
+        :param frame: BGR 或灰階畫面
+        :return: True 表示有變化（需要重新處理）
+        """
+        self.total += 1
+        fp = self.fingerprint(frame)
+        self.motion = None
+        if self.reference is not None and self.reference.shape == fp.shape:
+            diff = self._diff = cv2.absdiff(fp, self.reference, dst=_reuse(self._diff, fp.shape))
+            cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY, dst=diff)
+            self.motion = diff
+            if cv2.countNonZero(diff) <= self.min_pixels:
+                self.skipped += 1
+                return False
+        # 新指紋成為參考，舊參考的緩衝區留給下一幀
+        self.reference, self._scratch = fp, self.reference
+        return True
+
+    def changed_outside(self, lines, margin):
+        """
+        最近一次 changed() 的變化是否有落在線段窄帶（線段兩側各 margin 像素）之外的部分。
+        :param lines: 線段列表（每條格式同 Hough 輸出，畫面座標）
+        :param margin: 窄帶半寬（像素）
+        :return: True 表示窄帶外有變化，或沒有可比較的差異圖
+        """
+        if self.motion is None:
+            return True
+        mask = self._mask = _reuse(self._mask, self.motion.shape)
+        mask.fill(255)
+        thickness = int(2 * margin / self.scale) + 1
+        for x1, y1, x2, y2 in np.asarray(lines, dtype=np.float64).reshape(-1, 4) / self.scale:
+            cv2.line(mask, (int(round(x1)), int(round(y1))), (int(round(x2)), int(round(y2))), 0, thickness)
+        cv2.bitwise_and(mask, self.motion, dst=mask)
+        return cv2.countNonZero(mask) > self.min_pixels
+
+    def reset(self):
+        """
+        清除參考指紋，下一幀必定視為變化。
+        """
+        self.reference = None
+
+    @property
+    def skip_rate(self):
+        return self.skipped / self.total if self.total else 0.0
+
+    def report(self):
+        """
+        :return: 略過率摘要字串
+        """
+        return f'靜態幀略過率: {self.skip_rate:.1%} ({self.skipped}/{self.total})'
+
+
+def _reuse(buf, shape):
+    """
+    :return: 形狀相同時沿用 buf，否則配置新的 uint8 陣列
+    """
+    return buf if buf is not None and buf.shape == shape else np.empty(shape, dtype=np.uint8)
@@ -0,0 +1,274 @@
+# frame_store.py
+# 畫面錄製模組：將擷取到的畫面、時間戳與當時的參數快照寫入預先配置的記憶體映射檔，
+# 並提供與擷取物件相同介面的重播來源
+# 用於 8BallPool_assist 的離線調參、效能測試與重現問題（不需要螢幕）
+#
+# 錄製資料夾內容：
+#   frames.npy      (容量, H, W[, 3]) uint8，np.lib.format.open_memmap 預先配置
+#   timestamps.npy  (容量,) float64，擷取時間（time.time()）
+#   param_ids.npy   (容量,) int32，每幀對應的參數快照編號
+#   params.jsonl    參數快照，每行一個（只在參數改變時新增）
+#   meta.json       實際錄製的幀數與畫面格式
+#
+# 用法（無螢幕時可搭配 Xvfb 或以圖片資料夾作為來源）：
+#   python frame_store.py record recordings/session1 --frames 600
+#   python frame_store.py info recordings/session1
+
+import argparse
+import json
+import os
+import time
+import cv2
+import numpy as np
+
+_META_FILE = 'meta.json'
+
+
+def is_recording(path):
+    """
+    :return: path 是否為錄製資料夾
+    """
+    return os.path.isfile(os.path.join(path, _META_FILE))
+
+
+def _params_key(params):
+    key = getattr(params, 'key', None)
+    return key if key is not None else tuple(sorted(params.items()))
+
+
+class FrameRecorder:
+    """
+    畫面錄製器：
+    1. 第一幀寫入時依畫面大小一次配置 capacity 幀的記憶體映射檔，之後只做陣列複製
+    2. 參數快照只在內容改變時寫入 params.jsonl，每幀只記錄快照編號
+    3. 寫滿後停止錄製（append 回傳 False），不會覆寫已錄的畫面
+    """
+    def __init__(self, path, capacity=3000, flush_frames=100):
+        """
+        :param path: 錄製資料夾（不存在時自動建立）
+        :param capacity: 最多錄製的幀數
+        :param flush_frames: 每隔幾幀將映射檔與 meta.json 寫回磁碟，0 表示只在 close() 時寫回
+        """
+        self.path = path
+        self.capacity = capacity
+        self.flush_frames = flush_frames
+        self.count = 0
+        self._frames = None
+        self._timestamps = None
+        self._param_ids = None
+        self._params_file = None
+        self._last_params_key = None
+        self._params_count = 0
+        os.makedirs(path, exist_ok=True)
+
+    def _allocate(self, frame):
+        def open_npy(name, dtype, shape):
+            return np.lib.format.open_memmap(os.path.join(self.path, name), mode='w+', dtype=dtype, shape=shape)
+        self._frames = open_npy('frames.npy', np.uint8, (self.capacity,) + frame.shape)
+        self._timestamps = open_npy('timestamps.npy', np.float64, (self.capacity,))
+        self._param_ids = open_npy('param_ids.npy', np.int32, (self.capacity,))
+        self._params_file = open(os.path.join(self.path, 'params.jsonl'), 'w')
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+    def append(self, frame, params, timestamp=None):
+        """
+        錄製一幀。
+        :param frame: 畫面 (H, W, 3) BGR 或 (H, W) 灰階，大小需與第一幀相同
+        :param params: 當時使用的參數（dict 或 ParamSnapshot）
+        :param timestamp: 擷取時間，None 時使用目前時間
+        :return: 是否有寫入（已寫滿時回傳 False）
+        """
+        if self._frames is None:
+            self._allocate(frame)
+        if self.full:
+            return False
+        if frame.shape != self._frames.shape[1:]:
+            raise ValueError(f'Frame shape {frame.shape} does not match recording {self._frames.shape[1:]}')
+        key = _params_key(params)
+        if key != self._last_params_key:
+            self._params_file.write(json.dumps(dict(params)) + '\n')
+            self._params_file.flush()
+            self._last_params_key = key
+            self._params_count += 1
+        i = self.count
+        self._frames[i] = frame
+        self._timestamps[i] = time.time() if timestamp is None else timestamp
+        self._param_ids[i] = self._params_count - 1
+        self.count += 1
+        if self.flush_frames and self.count % self.flush_frames == 0:
+            self.flush()
+        return True
+
+    def flush(self):
+        """
+        將映射檔寫回磁碟並更新 meta.json（原子取代）。
+        """
+        if self._frames is None:
+            return
+        for array in (self._frames, self._timestamps, self._param_ids):
+            array.flush()
+        meta = {
+            'count': self.count,
+            'capacity': self.capacity,
+            'shape': list(self._frames.shape[1:]),
+            'dtype': 'uint8',
+        }
+        tmp_path = os.path.join(self.path, _META_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self.path, _META_FILE))
+
+    def close(self):
+        self.flush()
+        if self._params_file is not None:
+            self._params_file.close()
+            self._params_file = None
+        self._frames = self._timestamps = self._param_ids = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FrameStore:
+    """
+    讀取錄製資料夾：畫面以唯讀記憶體映射開啟，取用單幀不需複製整個檔案。
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, _META_FILE)) as f:
+            meta = json.load(f)
+        self.count = meta['count']
+        self.shape = tuple(meta['shape'])
+
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode='r')[:self.count]
+        self.frames = load('frames.npy')
+        self.timestamps = load('timestamps.npy')
+        self.param_ids = load('param_ids.npy')
+        self.params = []
+        params_path = os.path.join(path, 'params.jsonl')
+        if os.path.exists(params_path):
+            with open(params_path) as f:
+                self.params = [json.loads(line) for line in f if line.strip()]
+
+    def __len__(self):
+        return self.count
+
+    def params_at(self, i):
+        """
+        :return: 第 i 幀錄製時使用的參數 dict（沒有記錄時回傳 None）
+        """
+        pid = int(self.param_ids[i])
+        return self.params[pid] if 0 <= pid < len(self.params) else None
+
+
+class ReplaySource:
+    """
+    重播錄製的畫面，介面同 ScreenCapture（grab / close / with）：
+    - 錄製格式與要求格式相同時，grab() 直接回傳記憶體映射的唯讀檢視（零拷貝）
+    - 格式不同時（例如錄灰階、要求 BGR）才轉換到預先配置的緩衝區
+    - params / timestamp 為最近一次 grab() 那一幀錄製時的參數與時間
+    """
+    def __init__(self, path, rect=None, gray=False, loop=True):
+        """
+        :param path: 錄製資料夾
+        :param rect: 相容參數（重播的畫面大小以錄製為準）
+        :param gray: True 時 grab() 預設輸出灰階
+        :param loop: 播完後是否從頭循環；False 時播完 grab() 回傳 None
+        """
+        self.store = FrameStore(path)
+        if len(self.store) == 0:
+            raise ValueError(f'Recording is empty: {path}')
+        h, w = self.store.shape[:2]
+        self.rect = dict(rect) if rect else {'top': 0, 'left': 0, 'width': w, 'height': h}
+        self.gray = gray
+        self.loop = loop
+        self.index = 0       # 下一次 grab() 的幀編號
+        self.params = None
+        self.timestamp = None
+        self._buffer = None
+
+    def __len__(self):
+        return len(self.store)
+
+    def seek(self, index):
+        self.index = index % len(self.store)
+
+    def grab(self, gray=None):
+        """
+        :param gray: 是否輸出灰階，None 時使用建構時的設定
+        :return: numpy.ndarray (H, W, 3) BGR 或 (H, W) 灰階（唯讀，需要修改時請自行 copy()）
+        """
+        store = self.store
+        if self.index >= len(store):
+            if not self.loop:
+                return None
+            self.index = 0
+        i = self.index
+        self.index += 1
+        self.params = store.params_at(i)
+        self.timestamp = float(store.timestamps[i])
+        frame = store.frames[i]
+        want_gray = gray if gray is not None else self.gray
+        if want_gray == (frame.ndim == 2):
+            return frame
+        code = cv2.COLOR_BGR2GRAY if want_gray else cv2.COLOR_GRAY2BGR
+        shape = frame.shape[:2] if want_gray else frame.shape[:2] + (3,)
+        if self._buffer is None or self._buffer.shape != shape:
+            self._buffer = np.empty(shape, dtype=np.uint8)
+        cv2.cvtColor(frame, code, dst=self._buffer)
+        return self._buffer
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == '__main__':
+    from capture import open_capture
+    from config import config
+    from utils import ParamStore
+    parser = argparse.ArgumentParser(description='Record frames to / inspect a memory-mapped frame store')
+    sub = parser.add_subparsers(dest='command', required=True)
+    rec = sub.add_parser('record', help='record frames headlessly')
+    rec.add_argument('path')
+    rec.add_argument('--frames', type=int, default=600)
+    rec.add_argument('--source', default=config.CAPTURE_SOURCE, help='image file or directory (default: screen)')
+    rec.add_argument('--interval-ms', type=float, default=30)
+    color = rec.add_mutually_exclusive_group()
+    color.add_argument('--gray', dest='gray', action='store_true', default=config.CAPTURE_GRAY,
+                       help='record grayscale frames (default: config.CAPTURE_GRAY)')
+    color.add_argument('--color', dest='gray', action='store_false',
+                       help='record BGR frames')
+    info = sub.add_parser('info', help='print recording summary')
+    info.add_argument('path')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        params_store = ParamStore()
+        gray = args.gray
+        with open_capture(config.GAME_WINDOW_RECT, args.source, gray=gray) as cap, \
+                FrameRecorder(args.path, capacity=args.frames) as recorder:
+            while not recorder.full:
+                start = time.perf_counter()
+                recorder.append(cap.grab(), params_store.get())
+                remaining = args.interval_ms / 1000 - (time.perf_counter() - start)
+                if remaining > 0:
+                    time.sleep(remaining)
+        print(f'Recorded {args.frames} frames to {args.path}')
+    else:
+        store = FrameStore(args.path)
+        duration = float(store.timestamps[-1] - store.timestamps[0]) if len(store) > 1 else 0.0
+        print(f'frames: {len(store)}  shape: {store.shape}  duration: {duration:.2f}s  '
+              f'param snapshots: {len(store.params)}')
@@ -0,0 +1,205 @@
+# line_clustering.py
+# 線段分群模組：將近似共線的 Hough 線段（依 (theta, rho) 分桶、再對最長的幾條合併直線重新分配）合併為一條代表線段
+# 用於 8BallPool_assist 的候選線段精簡（驗證前）與線段追蹤的配對
+
+import math
+import numpy as np
+
+
+def as_segments(lines):
+    """
+    將 Hough 輸出 (N,1,4)、(N,4) 或線段列表轉為 float64 (N,4) 陣列。
+    """
+    if lines is None or len(lines) == 0:
+        return np.empty((0, 4), dtype=np.float64)
+    return np.asarray(lines, dtype=np.float64).reshape(-1, 4)
+
+
+def line_params(segments):
+    """
+    計算每條線段的方向角、法向偏移與長度。
+    :param segments: float (N,4)
+    :return: (theta, rho, length)
+             theta ∈ [0, π) 為線段方向角；rho 為原點到直線的有號距離（法向量 (-sinθ, cosθ)）
+    """
+    x1, y1, x2, y2 = segments.T
+    dx = x2 - x1
+    dy = y2 - y1
+    theta = np.mod(np.arctan2(dy, dx), np.pi)
+    rho = -x1 * np.sin(theta) + y1 * np.cos(theta)
+    return theta, rho, np.hypot(dx, dy)
+
+
+def line_distance(theta_a, rho_a, theta_b, rho_b):
+    """
+    兩組直線間的角度差與偏移差（可廣播）。
+    方向角在 0 / π 附近會繞回，此時其中一條的 rho 需反號後再比較。
+    :return: (角度差 ∈ [0, π/2], 偏移差)
+    """
+    d = np.abs(theta_a - theta_b)
+    wrapped = d > np.pi / 2
+    d = np.where(wrapped, np.pi - d, d)
+    drho = np.abs(np.where(wrapped, rho_a + rho_b, rho_a - rho_b))
+    return d, drho
+
+
+def segment_metrics(seg_a, seg_b):
+    """
+    逐對計算兩組線段（等長，或可廣播）之間的：
+    - 角度差
+    - 偏移：較短線段端點到較長線段所在直線的最大距離。
+      以端點量距離，避免以原點為基準的 rho 在遠處被角度誤差放大；
+      短線段的角度本來就不準，這個距離也自然對短線段較寬鬆。
+    - 間隙：兩線段投影到較長線段方向上的區間間距（重疊時為 0）
+    :param seg_a: float (..., 4)
+    :param seg_b: float (..., 4)
+    :return: (角度差, 偏移, 間隙)
+    """
+    seg_a, seg_b = np.broadcast_arrays(seg_a, seg_b)
+    ta, ra, la = line_params(seg_a.reshape(-1, 4))
+    tb, rb, lb = line_params(seg_b.reshape(-1, 4))
+    dtheta, _ = line_distance(ta, ra, tb, rb)
+    a_longer = la > lb
+    # 每一對取較長線段的方向與法向
+    theta = np.where(a_longer, ta, tb)
+    rho = np.where(a_longer, ra, rb)
+    ux, uy = np.cos(theta), np.sin(theta)
+
+    def project(seg):
+        # 兩端點在方向上的投影 (u) 與法向座標 (v)
+        x1, y1, x2, y2 = seg.reshape(-1, 4).T
+        return x1 * ux + y1 * uy, x2 * ux + y2 * uy, -x1 * uy + y1 * ux, -x2 * uy + y2 * ux
+
+    au1, au2, av1, av2 = project(seg_a)
+    bu1, bu2, bv1, bv2 = project(seg_b)
+    offset_a = np.maximum(np.abs(av1 - rho), np.abs(av2 - rho))
+    offset_b = np.maximum(np.abs(bv1 - rho), np.abs(bv2 - rho))
+    offset = np.where(a_longer, offset_b, offset_a)
+    gap = np.maximum(np.maximum(np.minimum(au1, au2), np.minimum(bu1, bu2))
+                     - np.minimum(np.maximum(au1, au2), np.maximum(bu1, bu2)), 0)
+    shape = seg_a.shape[:-1]
+    return dtheta.reshape(shape), offset.reshape(shape), gap.reshape(shape)
+
+
+# 重新分配時最多比較的群數（依總長度取前幾群；驗證只保留前 verifier.TOP_K 條，較輕的群不必互相合併）
+_ANCHORS = 32
+
+
+def _fit(labels, n, seg, lengths):
+    """
+    以 bincount 累積每群成員線段上均勻分布的點（長度加權）的一階、二階矩，主軸方向即為合併後的方向
+    （等同以所有成員上的點重新擬合，而不是平均各片段的角度）。
+    長度 L、方向向量 d 的線段上均勻分布的點：平均為中點，共變異為 d·dᵀ / 12。
+    :param labels: 每條線段的群編號 (N,)，0 ~ n-1
+    :return: (中心 cx, cy, 方向 ux, uy, 總長度)，皆為 (n,)
+    """
+    x1, y1, x2, y2 = seg.T
+    mx, my = (x1 + x2) / 2, (y1 + y2) / 2
+    dx, dy = x2 - x1, y2 - y1
+    w = np.maximum(lengths, 1e-6)
+    sw = np.bincount(labels, w, n)
+    sw_safe = np.maximum(sw, 1e-12)
+    cx = np.bincount(labels, w * mx, n) / sw_safe
+    cy = np.bincount(labels, w * my, n) / sw_safe
+    cxx = np.bincount(labels, w * (mx * mx + dx * dx / 12), n) / sw_safe - cx * cx
+    cyy = np.bincount(labels, w * (my * my + dy * dy / 12), n) / sw_safe - cy * cy
+    cxy = np.bincount(labels, w * (mx * my + dx * dy / 12), n) / sw_safe - cx * cy
+    theta = 0.5 * np.arctan2(2 * cxy, cxx - cyy)
+    return cx, cy, np.cos(theta), np.sin(theta), np.bincount(labels, lengths, n)
+
+
+def _project(seg, cx, cy, ux, uy):
+    """
+    每條線段兩端點在各自所屬直線（中心 (cx, cy)、方向 (ux, uy)，皆為 (N,)）上的投影區間。
+    :return: (較小端 lo, 較大端 hi)
+    """
+    t1 = (seg[:, 0] - cx) * ux + (seg[:, 1] - cy) * uy
+    t2 = (seg[:, 2] - cx) * ux + (seg[:, 3] - cy) * uy
+    return np.minimum(t1, t2), np.maximum(t1, t2)
+
+
+def _assign(seg, lengths, lines, sin_tol, rho_tol):
+    """
+    每條線段分配到第一個接受它的直線：角度差在容差內、兩端點離直線不超過 rho_tol。
+    短片段的角度受像素量化影響（斜線的階梯片段量成 0° / 90°），兩端點都在 rho_tol 帶內即可，
+    角度容差只放寬到端點條件本身允許的範圍（|d × u| <= 2 * rho_tol）。
+    沿線方向的間隙在分配後才切開，因此直線另一端的片段也會取得正確的方向。
+    :param lines: (中心 cx, cy, 方向 ux, uy)，皆為 (M,)，依優先順序排列
+    :return: 每條線段的直線編號 (N,)，沒有直線接受時為 -1
+    """
+    cx, cy, ux, uy = lines
+    rx1, ry1 = seg[:, 0, None] - cx, seg[:, 1, None] - cy
+    rx2, ry2 = seg[:, 2, None] - cx, seg[:, 3, None] - cy
+    cross = np.abs((rx2 - rx1) * uy - (ry2 - ry1) * ux)
+    ok = ((cross <= np.maximum(sin_tol * lengths[:, None], 2 * rho_tol))
+          & (np.abs(ry1 * ux - rx1 * uy) <= rho_tol) & (np.abs(ry2 * ux - rx2 * uy) <= rho_tol))
+    return np.where(ok.any(axis=1), np.argmax(ok, axis=1), -1)
+
+
+def cluster_lines(candidate_lines, angle_tol_deg=4.0, rho_tol=3.0, max_gap=20.0, min_length=5.0):
+    """
+    將近似共線的候選線段分群合併（全部以 NumPy 向量化，不逐條處理）：
+    1. 捨棄短於 min_length 的片段（反鋸齒斜線的邊緣常被 Hough 切成一段段水平 / 垂直的階梯，方向不可靠）
+    2. 依量化後的 (theta, rho) 以 np.unique 分桶，每桶以 bincount 累積的矩擬合一條直線
+    3. 總長度最長的 _ANCHORS 桶作為錨點，每條線段與錨點的「合併直線」比較（而不是只和單一片段比較），
+       分配到第一個接受它的錨點，以成員重新擬合後再分配一次；合併直線由所有成員上的點擬合，
+       階梯片段只會併入斜線本身，不會像單一連結那樣被一段段串成一條方向偏掉的長線
+    4. 每群沿合併直線方向依 max_gap 切段，每段輸出一條涵蓋其成員的代表線段，依總長度由長到短排序
+    :param candidate_lines: Hough 線段 (N,1,4) 或 None
+    :param angle_tol_deg: 角度容差（度）
+    :param rho_tol: 偏移容差（像素）
+    :param max_gap: 沿線方向的最大間隙（像素）
+    :param min_length: 參與分群的最短線段長度（像素）
+    :return: 代表線段 int32 (K,1,4)，格式同 Hough 輸出；無輸入（或全部過短）時回傳 None
+    """
+    segments = as_segments(candidate_lines)
+    theta, rho, lengths = line_params(segments)
+    keep = np.flatnonzero(lengths >= min_length)
+    if len(keep) == 0:
+        return None
+    seg, theta, rho, lengths = segments[keep], theta[keep], rho[keep], lengths[keep]
+    n = len(seg)
+    sin_tol = math.sin(math.radians(angle_tol_deg))
+    # 2. 依量化後的 (theta, rho) 分桶，每桶以矩擬合一條直線
+    tq = np.floor(theta / math.radians(angle_tol_deg)).astype(np.int64)
+    rq = np.floor(rho / max(rho_tol, 1e-6)).astype(np.int64)
+    _, bins = np.unique(tq * (1 << 32) + (rq - rq.min()), return_inverse=True)
+    bins = bins.ravel()
+    k = int(bins.max()) + 1
+    cx, cy, ux, uy, total = _fit(bins, k, seg, lengths)
+    # 3. 總長度最長的幾桶作為錨點，每條線段重新分配到第一個（最長）接受它的錨點；
+    #    再以分配到的成員重新擬合錨點直線、分配第二次（同一條線被切到相鄰桶的片段也會併入）
+    anchors = np.argsort(-total, kind='stable')[:_ANCHORS]
+    lines = cx[anchors], cy[anchors], ux[anchors], uy[anchors]
+    choice = _assign(seg, lengths, lines, sin_tol, rho_tol)
+    member = choice >= 0
+    refit = _fit(choice[member], len(anchors), seg[member], lengths[member])
+    found = refit[4] > 0
+    lines = tuple(np.where(found, new, old) for new, old in zip(refit[:4], lines))
+    choice = _assign(seg, lengths, lines, sin_tol, rho_tol)
+    # 沒有錨點接受的線段留在原本的桶（與錨點分開編號）
+    labels = np.where(choice >= 0, choice, len(anchors) + bins)
+    _, labels = np.unique(labels, return_inverse=True)
+    labels = labels.ravel()
+    k = int(labels.max()) + 1
+    # 4. 以分配後的成員重新擬合，沿線方向依間隙切開（共線但分開的邊緣，例如同高度的球緣切線）
+    cx, cy, ux, uy, _ = _fit(labels, k, seg, lengths)
+    lo, hi = _project(seg, cx[labels], cy[labels], ux[labels], uy[labels])
+    order = np.lexsort((lo, labels))
+    labels, lo, hi, lengths = labels[order], lo[order], hi[order], lengths[order]
+    # 各群的 t 加上遞增的偏移後做累積最大值，即為每群內「目前為止的最遠端點」（不跨群）
+    span = float(np.abs(np.concatenate([lo, hi])).max()) * 2 + max_gap + 1
+    reach = np.maximum.accumulate(hi + labels * span) - labels * span
+    start = np.ones(n, dtype=bool)
+    start[1:] = (labels[1:] != labels[:-1]) | (lo[1:] - reach[:-1] > max_gap)
+    first = np.flatnonzero(start)
+    parts = np.cumsum(start) - 1
+    part_total = np.bincount(parts, lengths)
+    owner = labels[first]
+    p_lo = lo[first]
+    p_hi = np.maximum.reduceat(hi, first)
+    merged = np.stack([cx[owner] + p_lo * ux[owner], cy[owner] + p_lo * uy[owner],
+                       cx[owner] + p_hi * ux[owner], cy[owner] + p_hi * uy[owner]], axis=1)
+    # 每段輸出一條涵蓋其成員的代表線段，依總長度由長到短排序
+    merged = merged[np.argsort(-part_total, kind='stable')]
+    return np.rint(merged).astype(np.int32).reshape(-1, 1, 4)
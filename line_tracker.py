@@ -4,6 +4,8 @@
 
 import numpy as np
 from config import config
+from line_clustering import as_segments, segment_metrics
+
 
 class LineTracker:
     """
@@ -11,51 +13,124 @@ class LineTracker:
     1. 記憶最近一次有效的線段列表及其 alpha（透明度）
     2. 若短暫失去偵測，會繼續輸出上一次結果，並讓 alpha 每幀遞減
     3. alpha<=0 時才真正消失
+    狀態以固定容量的 NumPy 陣列保存（最多 config.TRACK_MAX_LINES 條），
+    本幀線段與追蹤線段以角度 / 偏移容差向量化配對，1 像素的位移不會被當成新線段；
+    可選擇以等速模型（alpha-beta 濾波）平滑端點。
     """
     def __init__(self):
-        self.tracked_lines = []  # 每項為 {'line': 線段, 'alpha': 透明度, 'lost': 失聯幀數}
         self.DEFAULT_ALPHA = config.LINE_ALPHA_DEFAULT  # 初始透明度
         self.FADE_STEP = config.LINE_FADE_STEP         # 每幀淡出速度
+        capacity = config.TRACK_MAX_LINES
+        self.lines = np.zeros((capacity, 4), dtype=np.float64)     # 線段端點
+        self.velocity = np.zeros((capacity, 4), dtype=np.float64)  # 端點每幀位移（等速平滑用）
+        self.alpha = np.zeros(capacity, dtype=np.int32)            # 透明度
+        self.lost = np.zeros(capacity, dtype=np.int32)             # 失聯幀數
+        self.count = 0                                             # 目前追蹤中的線段數
+        self._angle_tol = np.deg2rad(config.TRACK_ANGLE_TOL_DEG)
+        self._offset_tol = config.TRACK_OFFSET_TOL
+
+    @property
+    def tracked_lines(self):
+        """
+        相容舊介面：[{'line': 線段, 'alpha': 透明度, 'lost': 失聯幀數}]
+        """
+        return [{'line': line, 'alpha': alpha, 'lost': int(self.lost[i])}
+                for i, (line, alpha) in enumerate(self.get_stable_results())]
+
+    def _associate(self, current):
+        """
+        配對本幀線段與追蹤線段：角度差與偏移都在容差內才可配對，
+        依 (偏移 + 角度) 成本由小到大貪婪配對，每條線段最多配對一次。
+        :param current: float (N,4)
+        :return: match (N,)，每條本幀線段對應的追蹤索引，-1 表示新線段
+        """
+        n, k = len(current), self.count
+        match = np.full(n, -1, dtype=np.int64)
+        if n == 0 or k == 0:
+            return match
+        dtheta, offset, _ = segment_metrics(current[:, None, :], self.lines[None, :k, :])
+        cost = np.where((dtheta <= self._angle_tol) & (offset <= self._offset_tol),
+                        offset + np.rad2deg(dtheta), np.inf)
+        for _ in range(min(n, k)):
+            i, j = np.unravel_index(np.argmin(cost), cost.shape)
+            if not np.isfinite(cost[i, j]):
+                break
+            match[i] = j
+            cost[i, :] = np.inf
+            cost[:, j] = np.inf
+        return match
 
     def update(self, current_lines):
         """
         更新追蹤器：
-        - 若本幀有有效線段，則刷新記憶，否則進行淡出
-        - 新線段 alpha=預設值，舊線段失聯時 alpha 遞減
+        - 本幀線段與追蹤線段配對成功：更新端點（可選等速平滑），重設 alpha
+        - 本幀新出現的線段：alpha=預設值
+        - 沒被配對到的追蹤線段：alpha 遞減，<=0 時移除
         :param current_lines: 本幀偵測到的線段列表
         """
-        new_tracked = []
-        if current_lines is not None and len(current_lines) > 0:
-            # 用簡單的線段相等（可進階用相似度）
-            for line in current_lines:
-                found = False
-                for tracked in self.tracked_lines:
-                    if np.array_equal(line, tracked['line']):
-                        # 線段還在，重設 alpha
-                        new_tracked.append({'line': line, 'alpha': self.DEFAULT_ALPHA, 'lost': 0})
-                        found = True
-                        break
-                if not found:
-                    # 新線段
-                    new_tracked.append({'line': line, 'alpha': self.DEFAULT_ALPHA, 'lost': 0})
-            # 對於舊線段沒被偵測到的，進行淡出
-            for tracked in self.tracked_lines:
-                if not any(np.array_equal(tracked['line'], l) for l in current_lines):
-                    alpha = tracked['alpha'] - self.FADE_STEP
-                    if alpha > 0:
-                        new_tracked.append({'line': tracked['line'], 'alpha': alpha, 'lost': tracked['lost']+1})
-            self.tracked_lines = new_tracked
-        else:
-            # 沒有新線段，全部淡出
-            for tracked in self.tracked_lines:
-                alpha = tracked['alpha'] - self.FADE_STEP
-                if alpha > 0:
-                    new_tracked.append({'line': tracked['line'], 'alpha': alpha, 'lost': tracked['lost']+1})
-            self.tracked_lines = new_tracked
+        current = as_segments(current_lines)
+        k = self.count
+        match = self._associate(current)
+        matched = match >= 0
+        # 端點方向與追蹤線段一致（避免 (p1,p2) / (p2,p1) 互換造成平滑錯亂）
+        if matched.any():
+            old = self.lines[match[matched]]
+            new = current[matched]
+            flip = ((new[:, 2] - new[:, 0]) * (old[:, 2] - old[:, 0]) +
+                    (new[:, 3] - new[:, 1]) * (old[:, 3] - old[:, 1])) < 0
+            new[flip] = new[flip][:, [2, 3, 0, 1]]
+            if config.TRACK_SMOOTHING:
+                # alpha-beta 濾波：先以等速預測，再依量測殘差修正位置與速度
+                vel = self.velocity[match[matched]]
+                predicted = old + vel
+                residual = new - predicted
+                new = predicted + config.TRACK_SMOOTHING_ALPHA * residual
+                vel = vel + config.TRACK_SMOOTHING_BETA * residual
+            else:
+                vel = new - old
+            current[matched] = new
+        # 新狀態順序：本幀線段（配對或新增），接著是淡出中的舊線段
+        lines = current
+        velocity = np.zeros_like(current)
+        if matched.any():
+            velocity[matched] = vel
+        alpha = np.full(len(current), self.DEFAULT_ALPHA, dtype=np.int32)
+        lost = np.zeros(len(current), dtype=np.int32)
+        fading = np.ones(k, dtype=bool)
+        fading[match[matched]] = False
+        fade_alpha = self.alpha[:k][fading] - self.FADE_STEP
+        keep = fade_alpha > 0
+        if keep.any():
+            lines = np.concatenate([lines, self.lines[:k][fading][keep]])
+            velocity = np.concatenate([velocity, np.zeros((int(keep.sum()), 4))])
+            alpha = np.concatenate([alpha, fade_alpha[keep]])
+            lost = np.concatenate([lost, self.lost[:k][fading][keep] + 1])
+        # 超過容量時丟棄最淡的線段
+        capacity = len(self.lines)
+        if len(lines) > capacity:
+            order = np.argsort(-alpha, kind='stable')[:capacity]
+            order.sort()
+            lines, velocity, alpha, lost = lines[order], velocity[order], alpha[order], lost[order]
+        n = len(lines)
+        self.lines[:n] = lines
+        self.velocity[:n] = velocity
+        self.alpha[:n] = alpha
+        self.lost[:n] = lost
+        self.count = n
+
+    def get_stable_arrays(self):
+        """
+        取得平滑後的線段結果（陣列形式，供批次處理）：
+        :return: (線段 float (K,4), alpha int (K,))
+        """
+        k = self.count
+        return self.lines[:k].copy(), self.alpha[:k].copy()
 
     def get_stable_results(self):
         """
         取得平滑後的線段結果（含 alpha）：
-        :return: [(線段, alpha)]
+        :return: [(線段, alpha)]，線段格式同 Hough 輸出 (1,4)
         """
-        return [(t['line'], t['alpha']) for t in self.tracked_lines if t['alpha'] > 0] 
\ No newline at end of file
+        k = self.count
+        lines = np.rint(self.lines[:k]).astype(np.int32).reshape(-1, 1, 4)
+        return [(lines[i], int(self.alpha[i])) for i in range(k) if self.alpha[i] > 0]
@@ -3,17 +3,18 @@
 # 功能：擷取遊戲畫面、進行視覺分析、繪製輔助線於 overlay，並支援參數即時調整
 
 import sys
-import cv2
-import numpy as np
+import time
 from PySide6.QtWidgets import QApplication
 from PySide6.QtCore import QTimer, Qt
-from capture import capture_screen
+from capture import open_capture
 from config import config
-from vision_core import VisionProcessor
+from frame_store import FrameRecorder
+from metrics import metrics
 from overlay_window import OverlayWindow
-import verifier
-from line_tracker import LineTracker
-from utils import load_params, extend_line_segment
+from scheduler import FrameScheduler
+from pipeline import LineDetector, FramePipeline, compose_frame, publish_features, show_frame
+from shared_frames import SharedFrameChannel
+from utils import ParamStore
 import subprocess
 import objc
 from ctypes import c_void_p
@@ -25,15 +26,23 @@ def main():
     主程式入口：
     1. 初始化 QApplication、視覺處理器、Overlay 視窗、追蹤器
     2. 根據 config 決定是否啟動 tuner.py 參數調整器
-    3. 啟動定時器，每 30ms 執行一次 main_loop_tick
+    3. 以 FrameScheduler 排程 main_loop_tick（依耗時與延遲預算調整，閒置時降頻）；
+       管線模式（config.USE_PIPELINE）下改由背景執行緒處理，定時器只負責更新 overlay
     4. 設定 Overlay 為滑鼠穿透（macOS 專用）
     """
     # 啟動 tuner.py 作為子程序（非阻塞，僅當 ENABLE_TUNER 為 True）
+    # 共享模式下 tuner 直接使用主程式的畫面與階段輸出，不再自行擷取與處理
+    channel = None
     if config.ENABLE_TUNER:
-        subprocess.Popen([sys.executable, 'tuner.py'])
+        if config.TUNER_SHARED:
+            rect = config.GAME_WINDOW_RECT
+            channel = SharedFrameChannel.create(rect['width'] * rect['height'] * config.TUNER_SHM_SCALE ** 2,
+                                                config.TUNER_SHM_MAX_LINES)
+            subprocess.Popen([sys.executable, 'tuner.py', '--shared', channel.name])
+        else:
+            subprocess.Popen([sys.executable, 'tuner.py'])
 
     app = QApplication(sys.argv)
-    vision_processor = VisionProcessor(config)
     overlay = OverlayWindow()
     overlay.update_geometry(config.GAME_WINDOW_RECT)
     overlay.setWindowFlags(
@@ -43,7 +52,26 @@ def main():
     overlay.setAttribute(Qt.WA_TranslucentBackground)
     overlay.show()
 
-    tracker = LineTracker()
+    detector = LineDetector(config)
+    # 參數檔變更時才重新讀取，回傳不可變的參數快照
+    params_store = ParamStore()
+    # 錄製模式：把實際處理的畫面、時間戳與參數快照寫入記憶體映射檔，供離線重播
+    recorder = FrameRecorder(config.RECORD_PATH, config.RECORD_CAPACITY) if config.RECORD_PATH else None
+
+    def current_params():
+        """
+        目前的參數快照；tuner 經由共享記憶體送來新參數時立即套用（不必等參數檔寫入）。
+        """
+        if channel is not None:
+            pushed = channel.poll_params()
+            if pushed is not None:
+                params_store.update(pushed)
+        return params_store.get()
+
+    def make_capture():
+        # 長駐擷取工作階段（重複使用 mss 連線與輸出緩衝區）；HSV 遮罩需要彩色畫面
+        gray = config.CAPTURE_GRAY and not config.HSV_GATE
+        return open_capture(config.GAME_WINDOW_RECT, config.CAPTURE_SOURCE, gray=gray)
 
     def main_loop_tick():
         """
@@ -53,42 +81,100 @@ def main():
         3. 提取 Hough 線段候選與點雲
         4. 用點雲驗證線段，篩選出最可靠的線段
         5. 用追蹤器平滑結果，消除偶發閃爍
-        6. 將每條線段延伸到邊界，繪製到透明畫布上
+        6. 將每條線段延伸到邊界，繪製到透明畫布上（向量模式則只算端點）
         7. 更新 Overlay 視窗
+        各步驟耗時記錄在 metrics（關閉時幾乎沒有成本）
+        :return: 穩定線段結果（供排程器判斷是否閒置）
         """
-        params = load_params()  # 每一幀都即時讀取，支援 tuner.py 動態調整
-        frame = capture_screen(config.GAME_WINDOW_RECT)
-        if config.USE_DUAL_HOUGH:
-            candidate_lines, points = vision_processor.get_features_dual_hough(frame, params)
-        else:
-            candidate_lines, points = vision_processor.get_features(frame, params)
-        verified_lines = verifier.verify_lines(candidate_lines, points, min_inliers=params.get('min_inliers', config.MIN_INLIERS))
-        tracker.update(verified_lines)
-        stable_lines = tracker.get_stable_results()
-        h, w = frame.shape[:2]
-        overlay_image = np.zeros((h, w, 4), dtype=np.uint8)  # 透明畫布 (h, w, 4)
-        bounds = {'left': 0, 'top': 0, 'width': w, 'height': h}
-        # 根據 alpha 決定繪製方式：新線段延伸，淡出線段畫原始端點
-        for line, alpha in stable_lines:
-            if int(alpha) >= config.LINE_ALPHA_DEFAULT:
-                # 剛偵測到，延伸到邊界
-                end1, end2 = extend_line_segment(line, bounds)
-                cv2.line(overlay_image, (int(end1[0]), int(end1[1])), (int(end2[0]), int(end2[1])), config.LINE_COLOR + (int(alpha),), config.LINE_WIDTH)
-            else:
-                # 淡出時，直接畫舊的線段端點
-                if isinstance(line, np.ndarray) and line.shape == (4,):
-                    x1, y1, x2, y2 = line
-                elif isinstance(line, (list, np.ndarray)) and len(line) == 1 and len(line[0]) == 4:
-                    x1, y1, x2, y2 = line[0]
-                else:
-                    x1, y1, x2, y2 = line
-                cv2.line(overlay_image, (int(x1), int(y1)), (int(x2), int(y2)), config.LINE_COLOR + (int(alpha),), config.LINE_WIDTH)
-        overlay.update_image(overlay_image)
-
-    # 啟動主循環定時器（每 30ms 執行一次）
+        params = current_params()  # tuner 送來的參數或參數檔變更時自動更新，支援 tuner.py 動態調整
+        metrics.configure(params)
+        with metrics.stage('tick'):
+            with metrics.stage('capture'):
+                frame = capture.grab()
+            if recorder is not None:
+                recorder.append(frame, params)
+            stable_lines = detector.process(frame, params)
+            if channel is not None:
+                publish_features(channel, frame, detector)
+            if not detector.unchanged:
+                with metrics.stage('compose'):
+                    # 上一張畫布已顯示完畢，'image' 模式直接清空沿用
+                    payload = compose_frame(stable_lines, frame.shape, config, compose_state['canvas'])
+                with metrics.stage('show'):
+                    show_frame(overlay, payload, config)
+                compose_state['canvas'] = payload
+            # 輸出與上一幀相同時沿用目前的 overlay 影像
+        report_metrics()
+        return stable_lines
+
+    def scheduled_tick():
+        """
+        單次計時器觸發：執行一次主循環，再依排程器結果排定下一次。
+        主循環尚未完成前不會有下一次觸發，逾時的幀不會排隊累積。
+        """
+        start = scheduler.begin()
+        stable_lines = None
+        try:
+            stable_lines = main_loop_tick()
+        finally:
+            timer.start(scheduler.end(start, bool(stable_lines), detector.frame_changed))
+
+    def report_metrics():
+        """
+        定期輸出效能摘要（log / Prometheus 檔案），並依開關更新 HUD。
+        """
+        metrics.maybe_report()
+        if not metrics.hud:
+            overlay.set_hud('')
+            return
+        now = time.monotonic()
+        if now >= hud_state['next']:
+            hud_state['next'] = now + config.METRICS_HUD_INTERVAL_MS / 1000
+            overlay.set_hud(metrics.hud_text())
+
+    def pipeline_tick():
+        """
+        管線模式：只取出背景執行緒已完成的 overlay 並更新視窗。
+        參數由 vision 執行緒讀取，這裡只套用它交過來的快照（參數通道只有一個讀取端）。
+        """
+        params = pipeline.params.poll()
+        if params is not None:
+            metrics.configure(params)
+        result = pipeline.output.poll()
+        if result is not None:
+            with metrics.stage('show'):
+                show_frame(overlay, result[1], config)
+            pipeline.recycle(result[1])  # 畫布已轉為 QPixmap，交還 compose 執行緒重複使用
+            metrics.record_latency('latency', (time.perf_counter() - result[0]) * 1000)  # 擷取到顯示
+        report_metrics()
+
+    hud_state = {'next': 0.0}
+    compose_state = {'canvas': None}  # 上一次 compose_frame 的結果（已顯示完畢，可重複使用）
+
     timer = QTimer()
-    timer.timeout.connect(main_loop_tick)
-    timer.start(30)
+    if config.USE_PIPELINE:
+        pipeline = FramePipeline(config, make_capture, current_params, detector, recorder, channel)
+        pipeline.start()
+        app.aboutToQuit.connect(pipeline.stop)
+        timer.timeout.connect(pipeline_tick)
+        timer.start(config.PIPELINE_POLL_INTERVAL_MS)
+    elif not config.SCHEDULER_ENABLED:
+        capture = make_capture()
+        # 固定週期計時器（不使用排程器）
+        timer.timeout.connect(main_loop_tick)
+        timer.start(config.SCHEDULER_BUDGET_MS)
+    else:
+        capture = make_capture()
+        scheduler = FrameScheduler(config)
+        # 單次計時器，每次主循環結束後由排程器決定下一次的等待時間
+        timer.setSingleShot(True)
+        timer.setTimerType(Qt.PreciseTimer)
+        timer.timeout.connect(scheduled_tick)
+        timer.start(0)
+    if recorder is not None:
+        app.aboutToQuit.connect(recorder.close)  # 在管線停止之後才關閉錄製檔
+    if channel is not None:
+        app.aboutToQuit.connect(channel.close)
 
     # 設定 Overlay 為滑鼠穿透（macOS 專用，讓滑鼠事件不被 overlay 攔截）
     winid = int(overlay.winId())
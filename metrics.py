@@ -0,0 +1,219 @@
+# metrics.py
+# 效能監測模組：以環形緩衝區記錄主循環各步驟的耗時與候選線段 / 點雲數量
+# 用於 8BallPool_assist 找出 overlay 延遲的來源（擷取、濾波、Hough、驗證或 Qt 重繪）
+#
+# 三種輸出：
+# 1. overlay 左上角的 HUD 文字（hud_text）
+# 2. 定期印出的一行摘要（report_line）
+# 3. Prometheus text format 檔案（prometheus_text / export）
+# 關閉時 stage() 回傳共用的空 context manager，record_*() 直接返回，幾乎沒有額外成本。
+# 可由參數檔的 'metrics_enabled' / 'metrics_hud' 在執行中切換。
+
+import contextlib
+import os
+import threading
+import time
+import numpy as np
+from config import config
+
+# Prometheus 直方圖的耗時分桶上限（毫秒）
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0)
+_NULL = contextlib.nullcontext()
+
+
+class RingBuffer:
+    """
+    固定容量的環形緩衝區，只保留最近 capacity 筆數值（計算百分位數用）；
+    另外累計全部數值的總和、筆數與直方圖分桶（Prometheus 需要單調遞增的累計值）。
+    管線模式下擷取 / 視覺 / overlay 執行緒會同時記錄同一個指標，寫入與讀取都以鎖保護。
+    """
+    __slots__ = ('values', 'count', 'total', 'buckets', 'lock')
+
+    def __init__(self, capacity, buckets=None):
+        self.values = np.zeros(capacity, dtype=np.float64)
+        self.count = 0
+        self.total = 0.0
+        self.buckets = np.zeros(len(buckets) + 1, dtype=np.int64) if buckets is not None else None
+        self.lock = threading.Lock()
+
+    def add(self, value, bounds=None):
+        with self.lock:
+            self.values[self.count % len(self.values)] = value
+            self.count += 1
+            self.total += value
+            if self.buckets is not None:
+                self.buckets[np.searchsorted(bounds, value)] += 1
+
+    def samples(self):
+        """
+        :return: 最近的數值（最多 capacity 筆，順序不保證）的複本
+        """
+        with self.lock:
+            return self.values[:min(self.count, len(self.values))].copy()
+
+
+class _StageTimer:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record_latency(self.name, (time.perf_counter() - self.start) * 1000)
+
+
+class Metrics:
+    """
+    主循環效能指標：
+    - latency：步驟名稱 -> 耗時（毫秒）的 RingBuffer
+    - counts ：名稱 -> 數量（候選線段數、點雲數 ...）的 RingBuffer
+    """
+    def __init__(self, window=None):
+        """
+        :param window: 每個指標保留的最近筆數，None 時使用 config.METRICS_WINDOW
+        """
+        self.window = window or config.METRICS_WINDOW
+        self.enabled = config.METRICS_ENABLED
+        self.hud = config.METRICS_HUD
+        self.latency = {}
+        self.counts = {}
+        self._bounds = np.asarray(LATENCY_BUCKETS_MS)
+        self._next_log = 0.0
+        self._next_export = 0.0
+
+    def configure(self, params):
+        """
+        依參數快照切換開關（參數檔沒有設定時使用 config 的預設值）。
+        """
+        enabled = bool(params.get('metrics_enabled', config.METRICS_ENABLED))
+        if enabled and not self.enabled:
+            # 剛開啟時先累積一段時間再輸出第一次摘要
+            now = time.monotonic()
+            self._next_log = now + config.METRICS_LOG_INTERVAL_S
+            self._next_export = now + config.METRICS_EXPORT_INTERVAL_S
+        self.enabled = enabled
+        self.hud = self.enabled and bool(params.get('metrics_hud', config.METRICS_HUD))
+
+    def stage(self, name):
+        """
+        量測一個步驟的耗時：with metrics.stage('hough'): ...
+        """
+        return _StageTimer(self, name) if self.enabled else _NULL
+
+    def record_latency(self, name, ms):
+        if not self.enabled:
+            return
+        ring = self.latency.get(name)
+        if ring is None:
+            ring = self.latency.setdefault(name, RingBuffer(self.window, LATENCY_BUCKETS_MS))
+        ring.add(ms, self._bounds)
+
+    def record_count(self, name, value):
+        if not self.enabled:
+            return
+        ring = self.counts.get(name)
+        if ring is None:
+            ring = self.counts.setdefault(name, RingBuffer(self.window))
+        ring.add(value)
+
+    def reset(self):
+        self.latency = {}
+        self.counts = {}
+
+    @staticmethod
+    def _stats(ring):
+        s = ring.samples()
+        p50, p99 = np.percentile(s, (50, 99))
+        return float(s.mean()), float(p50), float(p99)
+
+    def summary(self):
+        """
+        :return: {'latency': {名稱: (mean, p50, p99)}, 'counts': {名稱: (mean, p50, p99)}}（最近 window 筆）
+        """
+        return {
+            'latency': {name: self._stats(ring) for name, ring in list(self.latency.items()) if ring.count},
+            'counts': {name: self._stats(ring) for name, ring in list(self.counts.items()) if ring.count},
+        }
+
+    def report_line(self):
+        """
+        :return: 一行摘要，例如 'metrics: capture 0.41/0.92ms | hough 1.10/2.31ms | points 812'
+        """
+        s = self.summary()
+        parts = [f'{name} {p50:.2f}/{p99:.2f}ms' for name, (_, p50, p99) in s['latency'].items()]
+        parts += [f'{name} {p50:.0f}' for name, (_, p50, _) in s['counts'].items()]
+        return 'metrics: ' + ' | '.join(parts)
+
+    def hud_text(self):
+        """
+        :return: HUD 用的多行文字（每行：名稱 p50 / p99）
+        """
+        s = self.summary()
+        lines = [f'{name:<12}{p50:6.2f} /{p99:6.2f} ms' for name, (_, p50, p99) in s['latency'].items()]
+        lines += [f'{name:<12}{p50:6.0f}' for name, (_, p50, _) in s['counts'].items()]
+        return '\n'.join(lines)
+
+    def prometheus_text(self):
+        """
+        :return: Prometheus text format：
+                 耗時為 histogram（累計分桶），數量為 summary（最近 window 筆的分位數 + 累計總和）
+        """
+        out = [
+            '# HELP pool_assist_stage_latency_ms Main loop step latency in milliseconds.',
+            '# TYPE pool_assist_stage_latency_ms histogram',
+        ]
+        for name, ring in list(self.latency.items()):
+            # 分桶、總和與筆數在同一把鎖內讀取，輸出的直方圖才會一致
+            with ring.lock:
+                cumulative = np.cumsum(ring.buckets)
+                count, total = ring.count, ring.total
+            for bound, n in zip(LATENCY_BUCKETS_MS, cumulative):
+                out.append(f'pool_assist_stage_latency_ms_bucket{{stage="{name}",le="{bound}"}} {n}')
+            out.append(f'pool_assist_stage_latency_ms_bucket{{stage="{name}",le="+Inf"}} {count}')
+            out.append(f'pool_assist_stage_latency_ms_sum{{stage="{name}"}} {total}')
+            out.append(f'pool_assist_stage_latency_ms_count{{stage="{name}"}} {count}')
+        out += [
+            '# HELP pool_assist_count Per-frame counts (candidate lines, edge points, ...).',
+            '# TYPE pool_assist_count summary',
+        ]
+        for name, ring in list(self.counts.items()):
+            if not ring.count:
+                continue
+            p50, p99 = np.percentile(ring.samples(), (50, 99))
+            out.append(f'pool_assist_count{{name="{name}",quantile="0.5"}} {p50}')
+            out.append(f'pool_assist_count{{name="{name}",quantile="0.99"}} {p99}')
+            out.append(f'pool_assist_count_sum{{name="{name}"}} {ring.total}')
+            out.append(f'pool_assist_count_count{{name="{name}"}} {ring.count}')
+        return '\n'.join(out) + '\n'
+
+    def export(self, path):
+        """
+        原子寫入 Prometheus 檔案（node_exporter textfile collector 可直接讀取）。
+        """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def maybe_report(self, now=None):
+        """
+        每幀呼叫一次：到了 config 設定的間隔才印出摘要 / 寫出 Prometheus 檔案。
+        """
+        if not self.enabled:
+            return
+        now = time.monotonic() if now is None else now
+        if config.METRICS_LOG_INTERVAL_S and now >= self._next_log:
+            self._next_log = now + config.METRICS_LOG_INTERVAL_S
+            print(self.report_line())
+        if config.METRICS_PROM_FILE and now >= self._next_export:
+            self._next_export = now + config.METRICS_EXPORT_INTERVAL_S
+            self.export(config.METRICS_PROM_FILE)
+
+
+# 全域共用的指標物件（同 config.config）
+metrics = Metrics()
@@ -3,28 +3,91 @@
 # 用於 8BallPool_assist 的輔助線顯示
 
 from PySide6.QtWidgets import QWidget
-from PySide6.QtCore import Qt
-from PySide6.QtGui import QPainter, QPixmap, QImage
+from PySide6.QtCore import Qt, QRect, QLineF
+from PySide6.QtGui import QPainter, QPixmap, QImage, QPen, QColor, QRegion
 import numpy as np
 import cv2
+from config import config
+from metrics import metrics
+
+
+def dirty_rects(segments, pad, step=16):
+    """
+    線段的重繪區域：每條線段沿主軸每 step 像素切成一段，每段取外接矩形再向外擴張 pad 像素。
+    斜線的單一外接矩形幾乎涵蓋整個視窗，切段後面積約為 線段長度 × (step + 2 × pad)。
+    :param segments: float (K,4) 線段端點（視窗座標）
+    :param pad: 線寬與反鋸齒需要的邊界（像素）
+    :param step: 每段沿主軸的長度（像素）
+    :return: int (R,4) 矩形 [left, top, width, height]
+    """
+    seg = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+    if len(seg) == 0:
+        return np.empty((0, 4), dtype=np.int64)
+    d = seg[:, 2:] - seg[:, :2]
+    n = np.maximum(1, np.ceil(np.abs(d).max(axis=1) / step)).astype(np.int64)
+    owner = np.repeat(np.arange(len(seg)), n)
+    k = np.arange(len(owner)) - np.repeat(np.cumsum(n) - n, n)
+    t0 = (k / n[owner])[:, None]
+    t1 = ((k + 1) / n[owner])[:, None]
+    a = seg[owner, :2] + t0 * d[owner]
+    b = seg[owner, :2] + t1 * d[owner]
+    lo = np.floor(np.minimum(a, b)).astype(np.int64) - pad
+    hi = np.ceil(np.maximum(a, b)).astype(np.int64) + pad
+    return np.concatenate([lo, hi - lo + 1], axis=1)
+
 
 class OverlayWindow(QWidget):
     """
     透明疊加視窗：
     1. 接收 OpenCV 影像（BGR 或 BGRA），轉為 QPixmap。
     2. 以透明方式繪製在桌面上方。
+    3. 向量模式：直接接收線段端點與 alpha，以 QPainter 繪製，
+       只重繪新舊線段涵蓋的區域（沿線段切成小矩形，斜線也不會擴大成整個視窗），不需要整張畫布。
+    4. 可選的效能 HUD：左上角顯示 metrics 摘要文字。
     """
     def __init__(self):
         super().__init__()
         self.pixmap_to_draw = None  # 當前要顯示的 QPixmap
+        self.lines_to_draw = None   # 向量模式：[(QLineF, alpha)]（視窗座標）
+        self._lines_region = QRegion()  # 目前線段涵蓋的區域（下次更新時需清除）
+        self.hud_text = ''              # 效能 HUD 文字（空字串表示不顯示）
+        self._hud_rect = QRect()        # HUD 文字涵蓋的區域
+        self._rgb = None                # 影像模式的色彩轉換緩衝區（QPixmap.fromImage 會複製，可重複使用）
 
     def paintEvent(self, event):
         """
-        Qt paint 事件：將 pixmap 畫到視窗上。
+        Qt paint 事件：將 pixmap 或向量線段畫到視窗上。
         """
-        painter = QPainter(self)
-        if self.pixmap_to_draw is not None:
-            painter.drawPixmap(self.rect(), self.pixmap_to_draw)
+        with metrics.stage('paint'):
+            painter = QPainter(self)
+            if self.pixmap_to_draw is not None:
+                painter.drawPixmap(self.rect(), self.pixmap_to_draw)
+            if self.lines_to_draw:
+                r, g, b = config.LINE_COLOR
+                for line, alpha in self.lines_to_draw:
+                    painter.setPen(QPen(QColor(r, g, b, alpha), config.LINE_WIDTH))
+                    painter.drawLine(line)
+            if self.hud_text:
+                painter.fillRect(self._hud_rect, QColor(0, 0, 0, 160))
+                painter.setPen(QColor(0, 255, 0))
+                painter.drawText(self._hud_rect.adjusted(4, 2, -4, -2), Qt.AlignLeft | Qt.AlignTop, self.hud_text)
+            painter.end()
+
+    def set_hud(self, text):
+        """
+        更新效能 HUD 文字，只重繪 HUD 區域。
+        :param text: 多行文字，空字串表示隱藏 HUD
+        """
+        if text == self.hud_text:
+            return
+        old_rect = self._hud_rect
+        self.hud_text = text
+        if text:
+            bounds = self.fontMetrics().boundingRect(QRect(0, 0, self.width(), self.height()), Qt.AlignLeft | Qt.AlignTop, text)
+            self._hud_rect = QRect(0, 0, bounds.width() + 8, bounds.height() + 4)
+        else:
+            self._hud_rect = QRect()
+        self.update(QRegion(old_rect) + QRegion(self._hud_rect))
 
     def update_geometry(self, rect):
         """
@@ -38,23 +101,49 @@ class OverlayWindow(QWidget):
         接收 OpenCV 影像（BGR 或 BGRA），轉為 QPixmap 並觸發重繪。
         :param frame: numpy.ndarray (H, W, 3/4)
         """
+        self.lines_to_draw = None
+        self._lines_region = QRegion()
         if frame is None:
             self.pixmap_to_draw = None
             self.update()
             return
         height, width, channel = frame.shape
+        if channel not in (3, 4):
+            raise ValueError('Unsupported channel number for overlay image')
+        if self._rgb is None or self._rgb.shape != frame.shape:
+            self._rgb = np.empty(frame.shape, dtype=np.uint8)
         if channel == 4:
             # BGRA 轉 RGBA
-            rgba_image = cv2.cvtColor(frame, cv2.COLOR_BGRA2RGBA)
+            rgba_image = cv2.cvtColor(frame, cv2.COLOR_BGRA2RGBA, dst=self._rgb)
             bytesPerLine = 4 * width
             q_image = QImage(rgba_image.data, width, height, bytesPerLine, QImage.Format_RGBA8888)
-        elif channel == 3:
+        else:
             # BGR 轉 RGB
-            rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self._rgb)
             bytesPerLine = 3 * width
             q_image = QImage(rgb_image.data, width, height, bytesPerLine, QImage.Format_RGB888)
-        else:
-            raise ValueError('Unsupported channel number for overlay image')
         pixmap = QPixmap.fromImage(q_image)
         self.pixmap_to_draw = pixmap
-        self.update() 
\ No newline at end of file
+        self.update() 
+
+    def update_lines(self, segments, alphas, shape):
+        """
+        向量模式：接收線段端點與 alpha，只重繪新舊線段涵蓋的區域。
+        :param segments: (K,4) 線段端點（畫面像素座標）
+        :param alphas: (K,) 透明度
+        :param shape: 畫面大小 (h, w)，用於換算到視窗座標（Retina 畫面像素可能是視窗的 2 倍）
+        """
+        self.pixmap_to_draw = None
+        sx = self.width() / shape[1]
+        sy = self.height() / shape[0]
+        seg = np.asarray(segments, dtype=np.float64).reshape(-1, 4) * [sx, sy, sx, sy]
+        lines = [(QLineF(x1, y1, x2, y2), int(alpha)) for (x1, y1, x2, y2), alpha in zip(seg.tolist(), alphas)]
+        region = QRegion()
+        for left, top, width, height in dirty_rects(seg, config.LINE_WIDTH + 1, config.OVERLAY_DIRTY_SPAN).tolist():
+            region += QRect(left, top, width, height)
+        # 需重繪的區域 = 舊線段（清除）+ 新線段（繪製）
+        dirty = self._lines_region + region
+        self.lines_to_draw = lines
+        self._lines_region = region
+        if not dirty.isEmpty():
+            self.update(dirty)
@@ -0,0 +1,396 @@
+# pipeline.py
+# 處理流程模組：單幀偵測、overlay 合成，以及多執行緒管線模式
+# 用於 8BallPool_assist 的主循環（main.py）
+#
+# 管線模式：擷取 → 視覺+驗證+追蹤 → overlay 合成，各自在獨立執行緒執行，
+# 之間以單槽「最新覆蓋」佇列連接：下游忙碌時舊幀直接被丟棄，不會累積延遲。
+# Qt 主執行緒只負責取出已完成的 overlay 影像並更新視窗。
+
+import threading
+import time
+import cv2
+import numpy as np
+import verifier
+from frame_change import FrameChangeDetector
+from line_tracker import LineTracker
+from line_clustering import as_segments
+from metrics import metrics
+from utils import extend_line_segments
+from vision_core import VisionProcessor
+
+
+class LatestSlot:
+    """
+    單槽佇列（latest-frame-wins）：
+    - put() 直接覆蓋尚未被取走的舊項目，並累計丟棄數（回傳被覆蓋的項目，方便回收其緩衝區）
+    - get() 阻塞等待新項目；poll() 不阻塞
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._has_item = False
+        self._closed = False
+        self.dropped = 0  # 被覆蓋（未處理即丟棄）的項目數
+
+    def put(self, item):
+        """
+        :return: 被覆蓋的舊項目，沒有時回傳 None
+        """
+        with self._cond:
+            replaced = None
+            if self._has_item:
+                self.dropped += 1
+                replaced = self._item
+            self._item = item
+            self._has_item = True
+            self._cond.notify()
+            return replaced
+
+    def get(self, timeout=None):
+        """
+        取出最新項目；逾時或已關閉時回傳 None。
+        """
+        with self._cond:
+            if not self._has_item and not self._closed:
+                self._cond.wait(timeout)
+            return self._take()
+
+    def poll(self):
+        """
+        不阻塞地取出最新項目，沒有時回傳 None。
+        """
+        with self._cond:
+            return self._take()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _take(self):
+        if not self._has_item:
+            return None
+        item = self._item
+        self._item = None
+        self._has_item = False
+        return item
+
+
+class LineDetector:
+    """
+    單幀偵測流程：
+    1. 提取 Hough 線段候選與點雲
+    2. 用點雲驗證線段，篩選出最可靠的線段
+    3. 用追蹤器平滑結果，消除偶發閃爍
+    增量模式（config.INCREMENTAL_MODE）下，畫面與參數都沒有變化時
+    直接沿用上一次的驗證結果，略過整條視覺流程。
+    ROI 模式（config.ROI_MODE）下，只處理追蹤中線段兩側 ROI_MARGIN 像素的窄帶；
+    線段遺失、窄帶外的畫面有變化（可能出現新線段）、窄帶內找不到線段或每隔 ROI_REFRESH_FRAMES 幀時
+    改做全畫面搜尋。
+    """
+    def __init__(self, config, vision_processor=None, tracker=None):
+        self.config = config
+        self.vision_processor = vision_processor or VisionProcessor(config)
+        self.tracker = tracker or LineTracker()
+        # 畫面變化偵測只在有人使用時建立（指紋依 FRAME_FINGERPRINT_SCALE 縮小）：
+        # 增量模式略過靜態幀、ROI 模式判斷窄帶外是否有變化、排程器判斷是否從閒置恢復
+        self.change_detector = None
+        if config.INCREMENTAL_MODE or config.ROI_MODE or _scheduler_idles(config):
+            self.change_detector = FrameChangeDetector(
+                config.FRAME_CHANGE_THRESHOLD, config.FRAME_CHANGE_MIN_PIXELS, config.FRAME_FINGERPRINT_SCALE
+            )
+        self.unchanged = False        # 最近一次 process() 的輸出是否與前一次相同（可沿用上一張 overlay）
+        self.frame_changed = True     # 最近一次 detect() 的畫面是否有變化（排程器判斷是否從閒置恢復；未偵測時恆為 True）
+        self.detected = False         # 最近一次 detect() 是否實際跑了視覺流程（False 表示沿用上一次結果）
+        self.last_candidates = None   # 最近一次視覺流程的候選線段（整張畫面座標，分享給 tuner 預覽）
+        self._last_verified = None    # 上一次的驗證結果
+        self._last_params_key = None  # 上一次使用的參數
+        self._last_signature = None   # 上一次穩定線段輸出的簽章
+        self._frames_since_full = 0   # ROI 模式：距離上次全畫面搜尋的幀數
+        self._report_mark = (0, 0)    # 上一次記錄略過率時的 (檢查幀數, 略過幀數)
+
+    def detect(self, frame, params):
+        """
+        特徵提取 + 驗證（不經過追蹤器）。
+        :return: 驗證後的線段列表（每條格式同 Hough 輸出）
+        """
+        cd = self.change_detector
+        if cd is not None:
+            params_key = _params_key(params)
+            if params_key != self._last_params_key:
+                # 參數改變時必須重新處理
+                cd.reset()
+                self._last_params_key = params_key
+            self.frame_changed = cd.changed(frame)
+            if not self.frame_changed and self.config.INCREMENTAL_MODE and self._last_verified is not None:
+                self.detected = False
+                return self._last_verified
+        self._last_verified = self._detect(frame, params)
+        self.detected = True
+        return self._last_verified
+
+    def _detect(self, frame, params):
+        cfg = self.config
+        if cfg.ROI_MODE:
+            tracked = [line for line, _ in self.tracker.get_stable_results()]
+            cd = self.change_detector
+            if (tracked and self._frames_since_full < cfg.ROI_REFRESH_FRAMES
+                    and not cd.changed_outside(tracked, cfg.ROI_MARGIN)):
+                self._frames_since_full += 1
+                verified = self._verify(frame, params, tracked)
+                if verified:
+                    return verified
+            # 線段遺失、ROI 內沒有結果或到了定期刷新：全畫面搜尋
+            self._frames_since_full = 0
+        return self._verify(frame, params)
+
+    def _verify(self, frame, params, roi_lines=None):
+        vp = self.vision_processor
+        dual = self.config.USE_DUAL_HOUGH
+        # RANSAC 模式以上一次的驗證結果為種子（Hough 模式不使用）
+        seeds = self._last_verified if self.config.CANDIDATE_MODE == 'ransac' else None
+        if roi_lines is not None:
+            candidate_lines, points = vp.get_features_roi(frame, params, roi_lines, self.config.ROI_MARGIN, dual, seeds)
+        elif dual:
+            candidate_lines, points = vp.get_features_dual_hough(frame, params, seeds=seeds)
+        else:
+            candidate_lines, points = vp.get_features(frame, params, seeds=seeds)
+        self.last_candidates = candidate_lines
+        metrics.record_count('candidates', 0 if candidate_lines is None else len(candidate_lines))
+        metrics.record_count('edge_points', len(points))
+        with metrics.stage('verify'):
+            return verifier.verify_lines(
+                candidate_lines, points,
+                min_inliers=params.get('min_inliers', self.config.MIN_INLIERS),
+                edges=vp.last_edges, index=vp.last_index, pool=vp.pool
+            )
+
+    def process(self, frame, params):
+        """
+        偵測並更新追蹤器。
+        :return: 平滑後的線段結果 [(線段, alpha)]
+        """
+        verified = self.detect(frame, params)
+        with metrics.stage('track'):
+            self.tracker.update(verified)
+            stable_lines = self.tracker.get_stable_results()
+        signature = [(tuple(np.ravel(line)), int(alpha)) for line, alpha in stable_lines]
+        self.unchanged = signature == self._last_signature
+        self._last_signature = signature
+        cd = self.change_detector
+        interval = self.config.FRAME_CHANGE_REPORT_FRAMES
+        if cd is not None and self.config.INCREMENTAL_MODE and interval and cd.total % interval == 0:
+            # 這段期間的略過率（%）記入效能指標，由 HUD / 摘要 / Prometheus 輸出
+            total, skipped = cd.total - self._report_mark[0], cd.skipped - self._report_mark[1]
+            metrics.record_count('skip_pct', 100 * skipped / max(1, total))
+            self._report_mark = (cd.total, cd.skipped)
+        return stable_lines
+
+
+def _scheduler_idles(config):
+    """
+    :return: 主循環排程器是否會進入閒置（需要畫面變化結果才能恢復全速）
+    """
+    return not config.USE_PIPELINE and config.SCHEDULER_ENABLED and config.SCHEDULER_IDLE_INTERVAL_MS > 0
+
+
+def _params_key(params):
+    """
+    參數的可比較鍵：ParamSnapshot 直接用其 key，一般 dict 則轉為排序後的 tuple。
+    """
+    key = getattr(params, 'key', None)
+    return key if key is not None else tuple(sorted(params.items()))
+
+
+def compose_lines(stable_lines, shape, config):
+    """
+    計算要畫的線段端點：新線段（alpha 為初始值）延伸到邊界，淡出線段使用原始端點。
+    :param stable_lines: [(線段, alpha)]
+    :param shape: 畫面大小 (h, w)
+    :param config: 全域設定物件
+    :return: (線段端點 int32 (K,4), alpha int32 (K,))
+    """
+    h, w = shape[:2]
+    if not stable_lines:
+        return np.empty((0, 4), dtype=np.int32), np.empty(0, dtype=np.int32)
+    lines = as_segments([line for line, _ in stable_lines])
+    alphas = np.array([int(alpha) for _, alpha in stable_lines], dtype=np.int32)
+    extended = extend_line_segments(lines, {'left': 0, 'top': 0, 'width': w, 'height': h})
+    fresh = alphas >= config.LINE_ALPHA_DEFAULT
+    segments = np.where(fresh[:, None], extended, np.rint(lines).astype(np.int32))
+    return segments, alphas
+
+
+def compose_overlay(stable_lines, shape, config, canvas=None):
+    """
+    將每條線段延伸到邊界，繪製到透明畫布上。
+    新線段延伸到邊界，淡出線段畫原始端點。
+    :param stable_lines: [(線段, alpha)]
+    :param shape: 畫面大小 (h, w)
+    :param config: 全域設定物件
+    :param canvas: 可重複使用的舊畫布（已顯示完畢、大小相同時清空後沿用，不配置新陣列）
+    :return: BGRA 畫布 (h, w, 4)
+    """
+    h, w = shape[:2]
+    if isinstance(canvas, np.ndarray) and canvas.shape == (h, w, 4):
+        overlay_image = canvas
+        overlay_image.fill(0)
+    else:
+        overlay_image = np.zeros((h, w, 4), dtype=np.uint8)  # 透明畫布 (h, w, 4)
+    segments, alphas = compose_lines(stable_lines, shape, config)
+    for (x1, y1, x2, y2), alpha in zip(segments.tolist(), alphas.tolist()):
+        cv2.line(overlay_image, (x1, y1), (x2, y2), config.LINE_COLOR + (alpha,), config.LINE_WIDTH)
+    return overlay_image
+
+
+def compose_frame(stable_lines, shape, config, canvas=None):
+    """
+    依 config.OVERLAY_RENDER_MODE 合成 overlay：
+    'vector' 回傳 (線段端點, alpha, 畫面大小)；'image' 回傳 BGRA 畫布。
+    :param canvas: 已顯示完畢的上一個 compose_frame 結果，'image' 模式會沿用其畫布
+    """
+    if config.OVERLAY_RENDER_MODE == 'vector':
+        segments, alphas = compose_lines(stable_lines, shape, config)
+        return segments, alphas, shape[:2]
+    return compose_overlay(stable_lines, shape, config, canvas)
+
+
+def publish_features(channel, frame, detector):
+    """
+    視覺流程實際跑過時，把畫面、邊緣圖與候選線段發布到共享記憶體給 tuner 預覽
+    （需在下一次 detector.process() 之前呼叫，緩衝區池中的階段輸出之後會被覆寫）。
+    """
+    if detector.detected:
+        channel.publish(frame, detector.vision_processor.last_edges, detector.last_candidates)
+
+
+def show_frame(overlay, payload, config):
+    """
+    將 compose_frame 的結果交給 overlay 視窗（需在 Qt 主執行緒呼叫）。
+    """
+    if config.OVERLAY_RENDER_MODE == 'vector':
+        overlay.update_lines(*payload)
+    else:
+        overlay.update_image(payload)
+
+
+class FramePipeline:
+    """
+    多執行緒管線：
+    - capture 執行緒：擷取畫面（擷取物件在此執行緒內建立，mss 不可跨執行緒）
+    - vision 執行緒：讀參數（唯一呼叫 load_params 的執行緒）、偵測、驗證、追蹤
+    - compose 執行緒：延伸線段並合成 overlay（畫布或向量線段）
+    各階段以 LatestSlot 連接；輸出放在 self.output，參數快照變化時放在 self.params，都由 Qt 主執行緒 poll()。
+    OpenCV 運算期間會釋放 GIL，多核心機器上各階段可真正並行。
+    緩衝區回收：擷取畫面在 vision 執行緒處理完後交還 capture 執行緒；'image' 模式的畫布在
+    Qt 主執行緒顯示完畢後以 recycle() 交還。被 LatestSlot 覆蓋丟棄的項目也會回收，
+    穩定狀態下不再配置新的畫面副本與畫布。
+    """
+    def __init__(self, config, capture_factory, load_params, detector=None, recorder=None, channel=None):
+        """
+        :param config: 全域設定物件
+        :param capture_factory: 無參數函式，回傳具 grab() 的擷取物件
+        :param load_params: 無參數函式，回傳目前的參數 dict（只在 vision 執行緒呼叫，共享記憶體參數通道只有一個讀取端）
+        :param detector: LineDetector，None 時自動建立
+        :param recorder: frame_store.FrameRecorder，不為 None 時錄製每一幀實際處理的畫面與參數
+        :param channel: shared_frames.SharedFrameChannel，不為 None 時把畫面與階段輸出分享給 tuner
+        """
+        self.config = config
+        self.capture_factory = capture_factory
+        self.load_params = load_params
+        self.detector = detector or LineDetector(config)
+        self.recorder = recorder
+        self.channel = channel
+        self.frames = LatestSlot()   # capture → vision：(擷取時間, 畫面)
+        self.results = LatestSlot()  # vision → compose：(擷取時間, 畫面大小, 穩定線段)
+        self.output = LatestSlot()   # compose → Qt：(擷取時間, compose_frame 的結果)
+        self.params = LatestSlot()   # vision → Qt：最新的參數快照（只在快照改變時放入）
+        self._last_params = None
+        # 可重複使用的畫面副本 / 畫布（每個 list 只有一個執行緒 pop；append / pop 在 CPython 下為原子操作）
+        self._spare_frames = []
+        self._spare_canvases = []
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for name, target in (('capture', self._capture_loop), ('vision', self._vision_loop), ('compose', self._compose_loop)):
+            thread = threading.Thread(target=target, name=f'pipeline-{name}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        for slot in (self.frames, self.results, self.output, self.params):
+            slot.close()
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        self._threads = []
+
+    def recycle(self, payload):
+        """
+        交還已顯示完畢的 compose_frame 結果，供 compose 執行緒重複使用其畫布（需在顯示之後呼叫）。
+        """
+        if isinstance(payload, np.ndarray) and len(self._spare_canvases) < 2:
+            self._spare_canvases.append(payload)
+
+    def _recycle_frame(self, frame):
+        if len(self._spare_frames) < 2:
+            self._spare_frames.append(frame)
+
+    def _capture_loop(self):
+        interval = self.config.PIPELINE_CAPTURE_INTERVAL_MS / 1000
+        capture = self.capture_factory()
+        try:
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                # grab() 回傳內部緩衝區，交給下游前需複製（優先複製到已交還的畫面緩衝區）
+                with metrics.stage('capture'):
+                    grabbed = capture.grab()
+                    frame = self._spare_frames.pop() if self._spare_frames else None
+                    if frame is None or frame.shape != grabbed.shape:
+                        frame = grabbed.copy()
+                    else:
+                        np.copyto(frame, grabbed)
+                dropped = self.frames.put((start, frame))
+                if dropped is not None:
+                    self._recycle_frame(dropped[1])
+                remaining = interval - (time.perf_counter() - start)
+                if remaining > 0:
+                    self._stop.wait(remaining)
+        finally:
+            capture.close()
+
+    def _vision_loop(self):
+        while not self._stop.is_set():
+            item = self.frames.get(timeout=0.1)
+            if item is None:
+                continue
+            captured_at, frame = item
+            params = self.load_params()
+            if params is not self._last_params:
+                # 參數快照不可變，未改變時是同一個物件
+                self._last_params = params
+                self.params.put(params)
+            if self.recorder is not None:
+                self.recorder.append(frame, params)
+            stable_lines = self.detector.process(frame, params)
+            if self.channel is not None:
+                publish_features(self.channel, frame, self.detector)
+            shape = frame.shape[:2]
+            self._recycle_frame(frame)
+            if self.detector.unchanged:
+                continue  # 輸出與上一幀相同，畫面上的 overlay 可直接沿用
+            self.results.put((captured_at, shape, stable_lines))
+
+    def _compose_loop(self):
+        while not self._stop.is_set():
+            item = self.results.get(timeout=0.1)
+            if item is None:
+                continue
+            captured_at, shape, stable_lines = item
+            canvas = self._spare_canvases.pop() if self._spare_canvases else None
+            with metrics.stage('compose'):
+                payload = compose_frame(stable_lines, shape, self.config, canvas)
+            dropped = self.output.put((captured_at, payload))
+            if dropped is not None:
+                self.recycle(dropped[1])
@@ -0,0 +1,110 @@
+# point_index.py
+# 點雲空間索引模組：以均勻網格（CSR 格式）分桶邊緣點，加速線段支持點計數
+# 用於 8BallPool_assist 的線段驗證（verifier 的 'grid' 後端）
+
+import numpy as np
+
+
+class PointGrid:
+    """
+    均勻網格點雲索引（CSR 格式）：
+    1. 將畫面切成 cell × cell 的格子，每個點依所在格子分桶
+    2. 點依格子編號排序後連續存放，cell_start[k]:cell_start[k+1] 即為第 k 格的點
+    3. 查詢線段時只走訪線段經過的格子（及其鄰格），成本與線段長度成正比
+    """
+    def __init__(self, points, shape, cell=8, pool=None):
+        """
+        建立索引。
+        :param points: 邊緣點雲 (M,2)，格式 (x, y)
+        :param shape: 畫面大小 (height, width)
+        :param cell: 格子邊長（像素），需大於 2 才能保證 3×3 鄰格涵蓋 1.5 像素支持帶
+        :param pool: BufferPool，不為 None 時格子編號、排序後的點與 CSR 起點都寫入池中的緩衝區
+                     （argsort 的排序索引仍會配置）
+        """
+        self.cell = int(cell)
+        self.height, self.width = shape[:2]
+        self.cols = (self.width + self.cell - 1) // self.cell
+        self.rows = (self.height + self.cell - 1) // self.cell
+        n_cells = self.rows * self.cols
+        points = np.asarray(points).reshape(-1, 2)
+        if len(points) == 0:
+            self.points = np.empty((0, 2), dtype=np.float64)
+            self.cell_start = np.zeros(n_cells + 1, dtype=np.int64)
+            return
+        if pool is None:
+            cell_ids = (points[:, 1] // self.cell).astype(np.int64) * self.cols + points[:, 0] // self.cell
+            # 依格子編號穩定排序，格內保留原始順序
+            order = np.argsort(cell_ids, kind='stable')
+            self.points = points[order].astype(np.float64)
+            self.cell_start = np.zeros(n_cells + 1, dtype=np.int64)
+        else:
+            m = len(points)
+            cell_ids = pool.get('grid_cell_ids', m, np.int32)
+            cell_x = pool.get('grid_cell_x', m, points.dtype)
+            np.floor_divide(points[:, 1], self.cell, out=cell_ids)
+            cell_ids *= self.cols
+            cell_ids += np.floor_divide(points[:, 0], self.cell, out=cell_x)
+            order = np.argsort(cell_ids, kind='stable')
+            self.points = pool.get('grid_points', (m, 2), np.float64)
+            np.copyto(self.points, np.take(points, order, axis=0, out=pool.get('grid_sorted', (m, 2), points.dtype)))
+            self.cell_start = pool.get('grid_cell_start', n_cells + 1, np.int64)
+            self.cell_start[0] = 0
+        counts = np.bincount(cell_ids, minlength=n_cells)
+        np.cumsum(counts, out=self.cell_start[1:])
+
+    def __len__(self):
+        return len(self.points)
+
+    def segment_cells(self, segments):
+        """
+        求每條線段支持帶涵蓋的格子（去重後）。
+        沿線段以 cell/2 間距取樣，取樣點所在格子的 3×3 鄰域即涵蓋所有
+        距線段小於 3/4 cell 的點。
+        :param segments: float (N,4) 線段
+        :return: (owner, cell_ids) 兩個等長陣列，owner 為線段索引
+        """
+        x1, y1, x2, y2 = segments.T
+        lengths = np.hypot(x2 - x1, y2 - y1)
+        step = self.cell / 2
+        n_samples = np.ceil(lengths / step).astype(np.int64) + 1
+        owner = np.repeat(np.arange(len(segments)), n_samples)
+        offsets = np.cumsum(n_samples) - n_samples
+        k = np.arange(len(owner)) - np.repeat(offsets, n_samples)
+        t = k / np.maximum(np.repeat(n_samples - 1, n_samples), 1)
+        sx = x1[owner] + t * (x2 - x1)[owner]
+        sy = y1[owner] + t * (y2 - y1)[owner]
+        # 在四周各加一格的網格上編碼 (線段, 格子)，先去重再做 3×3 鄰域展開
+        # （相鄰取樣點多半落在同一格，展開前去重可讓暫存陣列小一半以上）
+        pcols, prows = self.cols + 2, self.rows + 2
+        cx = np.clip(np.floor(sx / self.cell), -1, self.cols).astype(np.int64) + 1
+        cy = np.clip(np.floor(sy / self.cell), -1, self.rows).astype(np.int64) + 1
+        base = np.unique((owner * prows + cy) * pcols + cx)
+        d = np.array([-pcols - 1, -pcols, -pcols + 1, -1, 0, 1, pcols - 1, pcols, pcols + 1])
+        keys = (base[:, None] + d).reshape(-1)
+        nown, rem = np.divmod(keys, prows * pcols)
+        ncy, ncx = np.divmod(rem, pcols)
+        ncx -= 1
+        ncy -= 1
+        # 超出網格的鄰格（含跨到相鄰線段編碼範圍的鍵）解碼後必落在外框，直接濾除
+        inside = (ncx >= 0) & (ncx < self.cols) & (ncy >= 0) & (ncy < self.rows)
+        keys = np.unique(nown[inside] * (self.rows * self.cols) + ncy[inside] * self.cols + ncx[inside])
+        return keys // (self.rows * self.cols), keys % (self.rows * self.cols)
+
+    def gather(self, segments):
+        """
+        取出每條線段支持帶內的候選點。
+        :param segments: float (N,4) 線段
+        :return: (owner, pts) owner 為每個候選點所屬線段索引，pts 為 (K,2) 點座標
+        """
+        owner, cells = self.segment_cells(segments)
+        starts = self.cell_start[cells]
+        sizes = self.cell_start[cells + 1] - starts
+        nonempty = sizes > 0
+        owner, starts, sizes = owner[nonempty], starts[nonempty], sizes[nonempty]
+        total = int(sizes.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64), np.empty((0, 2), dtype=np.float64)
+        # 將各格的連續區段 [start, start+size) 攤平成點索引
+        offsets = np.cumsum(sizes) - sizes
+        idx = np.arange(total) - np.repeat(offsets - starts, sizes)
+        return np.repeat(owner, sizes), self.points[idx]
@@ -0,0 +1,186 @@
+# ransac.py
+# RANSAC 線段提案模組：直接在邊緣點雲上以批次隨機取樣找直線，作為 Hough（單一 / 雙重）以外的候選來源
+# 用於 8BallPool_assist 的視覺核心（vision_core.py，config.CANDIDATE_MODE = 'ransac'）
+#
+# - 一次抽出一批兩點樣本，以 NumPy 同時計算整批假設直線的支持點數（距離門檻同 verifier.INLIER_DISTANCE）
+# - 自適應停止：依目前最佳假設的內點比例 w，取樣次數達到 log(1 - confidence) / log(1 - w²) 即停止
+# - 先以上一幀的線段為種子直接計算支持度，種子仍成立時不需要任何隨機取樣
+# - 每找到一條線：以內點主成分方向重新擬合，沿線方向依間隙切段、取內點最多的一段作為線段，
+#   移除該段內點後繼續找下一條
+# 稀疏邊緣圖（只有少數輔助線）時，內點比例高、一兩批樣本即可收斂，比雙重 Hough 的全圖投票快得多。
+
+import math
+import numpy as np
+from verifier import INLIER_DISTANCE
+
+
+def _line_from_points(p1, p2):
+    """
+    兩點決定的直線（可批次）。
+    :return: (單位法向量 (B,2), 偏移 c (B,)，直線為 n·p = c, 兩點距離 (B,))
+    """
+    d = p2 - p1
+    length = np.hypot(d[:, 0], d[:, 1])
+    n = np.empty_like(d)
+    n[:, 0] = -d[:, 1]
+    n[:, 1] = d[:, 0]
+    n /= np.maximum(length, 1e-6)[:, None]
+    return n, n[:, 0] * p1[:, 0] + n[:, 1] * p1[:, 1], length
+
+
+def _iterations(confidence, w, max_iterations):
+    """
+    自適應取樣次數 log(1 - confidence) / log(1 - w²)（兩點樣本全為內點的機率為 w²），限制在 [1, max_iterations]。
+    w >= 1 時任一樣本皆為內點，取樣一次即可；confidence >= 1 時無法提早停止，取樣到上限。
+    """
+    if w >= 1:
+        return 1
+    if confidence >= 1 or w <= 0:
+        return max_iterations
+    return max(1, min(max_iterations, math.ceil(math.log1p(-confidence) / math.log1p(-w * w))))
+
+
+def _consensus(pts_t, normals, offsets, distance, max_elements):
+    """
+    每條假設直線的支持點數（點到直線距離 < distance），分塊計算以限制暫存記憶體。
+    :param pts_t: (2,R) float32（轉置後的點雲，矩陣乘法結果為 (B,R)，逐列加總較快）
+    :param normals: (B,2) float32
+    :param offsets: (B,) float32
+    :return: (B,) int32
+    """
+    counts = np.empty(len(normals), dtype=np.int32)
+    chunk = max(1, max_elements // max(1, pts_t.shape[1]))
+    for start in range(0, len(normals), chunk):
+        stop = start + chunk
+        dist = normals[start:stop] @ pts_t
+        dist -= offsets[start:stop, None]
+        np.abs(dist, out=dist)
+        np.sum((dist < distance).view(np.uint8), axis=1, dtype=np.int32, out=counts[start:stop])
+    return counts
+
+
+def _fit_segment(pts, inliers, distance, max_gap):
+    """
+    以內點重新擬合直線，沿線方向依間隙切段，取內點最多的一段。
+    :param pts: (R,2) 剩餘點
+    :param inliers: 初始內點索引
+    :return: (線段 (x1, y1, x2, y2), 該段內點索引) 或 None
+    """
+    if len(inliers) < 2:
+        return None
+    sel = pts[inliers].astype(np.float64)
+    mean = sel.mean(axis=0)
+    sel -= mean
+    sxx, syy, sxy = np.dot(sel[:, 0], sel[:, 0]), np.dot(sel[:, 1], sel[:, 1]), np.dot(sel[:, 0], sel[:, 1])
+    # 2×2 共變異矩陣的主軸方向
+    theta = 0.5 * np.arctan2(2 * sxy, sxx - syy)
+    u = np.array([np.cos(theta), np.sin(theta)])
+    n = np.array([-u[1], u[0]])
+    rel = pts - mean
+    inliers = np.flatnonzero(np.abs(rel @ n) < distance)
+    if len(inliers) < 2:
+        return None
+    t = rel[inliers] @ u
+    order = np.argsort(t)
+    t, inliers = t[order], inliers[order]
+    # 依間隙切段，取內點最多的一段
+    breaks = np.flatnonzero(np.diff(t) > max_gap) + 1
+    bounds = np.concatenate([[0], breaks, [len(t)]])
+    k = int(np.argmax(np.diff(bounds)))
+    lo, hi = bounds[k], bounds[k + 1]
+    a, b = mean + t[lo] * u, mean + t[hi - 1] * u
+    return (a[0], a[1], b[0], b[1]), inliers[lo:hi]
+
+
+def ransac_lines(points, seeds=None, min_inliers=20, min_length=10, max_gap=20, max_lines=8,
+                 confidence=0.99, batch=64, max_iterations=2048, distance=INLIER_DISTANCE,
+                 max_elements=1 << 18, sample_points=256, rng=None):
+    """
+    從點雲依序找出多條直線線段。
+    :param points: 邊緣點雲 (M,2)
+    :param seeds: 上一幀的線段 (K,1,4) / (K,4) 或 None，先以種子計算支持度
+    :param min_inliers: 線段最少內點數（少於此值即停止搜尋）
+    :param min_length: 線段最短長度（像素），也是兩點樣本的最短距離（太近的兩點方向不準）
+    :param max_gap: 同一線段上相鄰內點沿線方向的最大間隙（像素）
+    :param max_lines: 最多找幾條線段
+    :param confidence: 自適應停止的信心水準
+    :param batch: 每批同時評估的兩點樣本數
+    :param max_iterations: 每條線段最多取樣次數
+    :param distance: 內點距離門檻
+    :param max_elements: 每次計算 (點數 × 假設數) 的上限（限制暫存記憶體）
+    :param sample_points: 整批假設先在約這麼多個點的子集合上計數，只有子集合上最好的假設才計算完整支持點數
+    :param rng: numpy.random.Generator，None 時使用固定種子（結果可重現）
+    :return: 線段 int32 (K,1,4)（同 HoughLinesP 輸出格式），找不到時回傳 None
+    """
+    pts = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+    if len(pts) < max(2, min_inliers):
+        return None
+    rng = rng if rng is not None else np.random.default_rng(0)
+    distance = np.float32(distance)
+    alive = np.ones(len(pts), dtype=bool)
+    found = []
+
+    def accept(n, c):
+        """
+        以假設直線的內點擬合線段；成立時加入結果並移除內點。
+        """
+        remaining = np.flatnonzero(alive)
+        rest = pts[remaining]
+        fit = _fit_segment(rest, np.flatnonzero(np.abs(rest @ n - c) < distance), distance, max_gap)
+        if fit is None:
+            return False
+        segment, used = fit
+        if len(used) < min_inliers or np.hypot(segment[2] - segment[0], segment[3] - segment[1]) < min_length:
+            return False
+        found.append(segment)
+        alive[remaining[used]] = False
+        return True
+
+    # 1. 上一幀的線段：依支持度由高到低逐一嘗試
+    if seeds is not None and len(seeds) > 0:
+        seeds = np.asarray(seeds, dtype=np.float32).reshape(-1, 4)
+        normals, offsets, length = _line_from_points(seeds[:, :2], seeds[:, 2:])
+        ok = length > 0
+        normals, offsets = normals[ok], offsets[ok]
+        counts = _consensus(np.ascontiguousarray(pts.T), normals, offsets, distance, max_elements)
+        for i in np.argsort(-counts, kind='stable'):
+            if len(found) >= max_lines or counts[i] < min_inliers:
+                break
+            accept(normals[i], offsets[i])
+
+    # 2. 批次隨機取樣，自適應停止
+    failures = 0
+    while len(found) < max_lines and failures < max_lines:
+        remaining = np.flatnonzero(alive)
+        rest = pts[remaining]
+        r = len(rest)
+        if r < max(2, min_inliers):
+            break
+        rest_t = np.ascontiguousarray(rest.T)
+        subset_t = np.ascontiguousarray(rest_t[:, ::max(1, r // sample_points)])
+        # 若存在內點數 >= min_inliers 的線，取樣這麼多次即可依信心水準找到；之後再依最佳假設的內點比例縮短
+        needed = _iterations(confidence, min_inliers / r, max_iterations)
+        best_count, best, drawn = 0, None, 0
+        while drawn < needed:
+            pairs = rng.integers(0, r, size=(batch, 2))
+            normals, offsets, length = _line_from_points(rest[pairs[:, 0]], rest[pairs[:, 1]])
+            drawn += batch
+            ok = length >= min_length
+            if not ok.any():
+                continue
+            normals, offsets = normals[ok], offsets[ok]
+            i = int(np.argmax(_consensus(subset_t, normals, offsets, distance, max_elements)))
+            count = int(_consensus(rest_t, normals[i:i + 1], offsets[i:i + 1], distance, max_elements)[0])
+            if count > best_count:
+                best_count, best = count, (normals[i], offsets[i])
+                needed = min(needed, _iterations(confidence, best_count / r, max_iterations))
+        if best is None or best_count < min_inliers:
+            break
+        if not accept(*best):
+            # 共線但分散的點（切段後不足）：移除這批內點，避免同一假設反覆被選中
+            n, c = best
+            alive[remaining[np.abs(rest @ n - c) < distance]] = False
+            failures += 1
+    if not found:
+        return None
+    return np.rint(np.asarray(found)).astype(np.int32).reshape(-1, 1, 4)
@@ -0,0 +1,94 @@
+# scheduler.py
+# 幀排程模組：取代固定 30ms 的 QTimer，依每次主循環的實際耗時與延遲預算決定下一次執行時間
+# 用於 8BallPool_assist 的主循環（main.py）
+#
+# - 以「截止時間」排程：每幀的截止時間 = 上一幀截止時間 + 週期，不受單次耗時抖動累積影響
+# - 主循環耗時超過預算時，錯過的截止時間直接略過（不補跑、不排隊），延遲不會越積越大
+# - 一段時間沒有偵測到線段時降到低頻率；閒置中偵測到畫面變化立即恢復全速（SCHEDULER_IDLE_INTERVAL_MS = 0 時不降頻）
+# - config.SCHEDULER_ENABLED = False 時 main.py 改回固定週期的計時器
+
+import time
+
+
+class FrameScheduler:
+    """
+    截止時間驅動的自適應排程器（不依賴 Qt，由呼叫端以單次計時器執行）：
+        start = scheduler.begin()
+        ...主循環...
+        timer.start(scheduler.end(start, active, motion))
+    """
+    def __init__(self, config, clock=time.monotonic):
+        """
+        :param config: 全域設定物件
+        :param clock: 時間來源（秒）
+        """
+        self.budget = config.SCHEDULER_BUDGET_MS / 1000          # 全速時的週期（延遲預算）
+        self.idle_interval = config.SCHEDULER_IDLE_INTERVAL_MS / 1000  # 閒置時的週期（0 表示永不閒置）
+        self.idle_after = config.SCHEDULER_IDLE_AFTER_S          # 多久沒有線段後進入閒置
+        self.min_gap = config.SCHEDULER_MIN_GAP_MS               # 兩次執行之間至少留給事件迴圈的時間（毫秒）
+        self.clock = clock
+        self.idle = False
+        self.cost_ms = None   # 主循環耗時（指數移動平均）
+        self.ticks = 0        # 執行次數
+        self.late = 0         # 超過截止時間才完成的次數
+        self.skipped = 0      # 因逾時而略過的截止時間數
+        self._deadline = None
+        self._last_activity = clock()
+
+    @property
+    def period(self):
+        """
+        :return: 目前的排程週期（秒）
+        """
+        return self.idle_interval if self.idle else self.budget
+
+    def begin(self):
+        """
+        主循環開始時呼叫。
+        :return: 開始時間
+        """
+        start = self.clock()
+        if self._deadline is None:
+            self._deadline = start
+        return start
+
+    def end(self, start, active, motion):
+        """
+        主循環結束時呼叫，計算下一次執行前要等待多久。
+        :param start: begin() 的回傳值
+        :param active: 本幀是否有顯示中的線段
+        :param motion: 本幀畫面是否有變化（只用於閒置中立即再跑一幀；畫面持續變化但沒有線段仍維持閒置）
+        :return: 下一次執行前的等待時間（毫秒，整數）
+        """
+        now = self.clock()
+        cost = (now - start) * 1000
+        self.cost_ms = cost if self.cost_ms is None else 0.8 * self.cost_ms + 0.2 * cost
+        self.ticks += 1
+        if active:
+            self._last_activity = now
+        was_idle = self.idle
+        # 閒置中畫面有變化：立刻再跑一幀（找到線段才維持全速，否則下一幀回到閒置）
+        self.idle = (self.idle_interval > 0 and now - self._last_activity >= self.idle_after
+                     and not (was_idle and motion))
+        if was_idle and not self.idle:
+            # 閒置中偵測到變化或線段：立刻恢復全速，不等原本的低頻截止時間
+            self._deadline = now
+            return self.min_gap
+        period = self.period
+        self._deadline += period
+        if self._deadline < now:
+            # 已錯過截止時間：略過錯過的部分，從下一個還來得及的截止時間繼續
+            self.late += 1
+            missed = int((now - self._deadline) / period) + 1
+            self.skipped += missed
+            self._deadline += missed * period
+        return max(self.min_gap, int(round((self._deadline - now) * 1000)))
+
+    def report(self):
+        """
+        :return: 排程摘要字串
+        """
+        cost = self.cost_ms or 0.0
+        mode = '閒置' if self.idle else '全速'
+        return (f'排程: {mode} 週期 {self.period * 1000:.0f}ms, 平均耗時 {cost:.1f}ms, '
+                f'逾時 {self.late}/{self.ticks}, 略過 {self.skipped}')
@@ -0,0 +1,201 @@
+# shared_frames.py
+# 共享記憶體通道：主程式把已擷取的畫面與階段輸出（邊緣圖、候選線段）分享給 tuner，tuner 把參數直接送回主程式
+# 用於 8BallPool_assist 的參數調整（tuner.py 不必再自己擷取畫面、重跑一次視覺流程）
+#
+# 記憶體配置（multiprocessing.shared_memory，一塊連續區段）：
+#   表頭 uint64 × 16 | 畫面 (容量像素 × 3) | 邊緣圖 (容量像素) | 候選線段 int32 (max_lines × 4) | 參數 JSON
+# 畫面區與參數區各自以 seqlock 保護（單一寫入者）：
+#   寫入前序號 +1（變成奇數），寫完再 +1（變回偶數）；
+#   讀取端在序號為偶數且讀取前後序號相同時才採用，否則視為正在寫入、下次再讀。
+# 跨行程沒有記憶體屏障；預覽畫面偶爾讀到不一致只影響一張預覽圖，參數 JSON 解析失敗則略過、下次再讀。
+
+import json
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+
+# 表頭欄位索引
+_FRAME_SEQ = 0     # 畫面區 seqlock 序號
+_FRAME_ID = 1      # 已發布的幀數
+_HEIGHT = 2
+_WIDTH = 3
+_CHANNELS = 4      # 1：灰階，3：BGR
+_LINES = 5         # 候選線段數
+_PARAMS_SEQ = 6    # 參數區 seqlock 序號
+_PARAMS_LEN = 7    # 參數 JSON 位元組數
+_CAPACITY = 8      # 畫面容量（像素數）
+_MAX_LINES = 9
+_PARAMS_CAPACITY = 10
+_HEADER_SLOTS = 16
+_HEADER_BYTES = _HEADER_SLOTS * 8
+
+
+class SharedFrameChannel:
+    """
+    主程式與 tuner 之間的共享記憶體通道：
+    - 主程式：channel = SharedFrameChannel.create(...)；每次視覺流程跑完 publish()，
+      每幀 poll_params() 取得 tuner 送來的新參數
+    - tuner ：channel = SharedFrameChannel.attach(name)；read() 取得最新畫面與階段輸出，
+      滑桿變動時 write_params()
+    """
+    def __init__(self, shm, owner):
+        """
+        請使用 create() / attach() 建立。
+        :param shm: SharedMemory
+        :param owner: 是否為建立者（close() 時一併刪除共享記憶體）
+        """
+        self.shm = shm
+        self.owner = owner
+        self.name = shm.name
+        buf = shm.buf
+        self.header = np.ndarray(_HEADER_SLOTS, dtype=np.uint64, buffer=buf)
+        capacity = int(self.header[_CAPACITY])
+        max_lines = int(self.header[_MAX_LINES])
+        params_capacity = int(self.header[_PARAMS_CAPACITY])
+        offset = _HEADER_BYTES
+        self._frame = np.ndarray(capacity * 3, dtype=np.uint8, buffer=buf, offset=offset)
+        offset += capacity * 3
+        self._edges = np.ndarray(capacity, dtype=np.uint8, buffer=buf, offset=offset)
+        offset += capacity
+        self._lines = np.ndarray((max_lines, 4), dtype=np.int32, buffer=buf, offset=offset)
+        offset += max_lines * 16
+        self._params = np.ndarray(params_capacity, dtype=np.uint8, buffer=buf, offset=offset)
+        self._last_frame_id = 0       # 讀取端：上一次讀到的幀
+        self._last_params_seq = 0     # 主程式端：上一次採用的參數序號
+        self._read_buffers = None     # 讀取端：(畫面, 邊緣圖, 線段) 複本的緩衝區
+        self._warned = False
+
+    @classmethod
+    def create(cls, capacity, max_lines=512, params_capacity=65536):
+        """
+        建立新的共享記憶體區段（名稱由系統產生，透過 .name 傳給 tuner）。
+        :param capacity: 畫面最多幾個像素（Retina 畫面需以實際像素計算）
+        :param max_lines: 最多分享幾條候選線段
+        :param params_capacity: 參數 JSON 最大位元組數
+        """
+        size = _HEADER_BYTES + capacity * 4 + max_lines * 16 + params_capacity
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        header = np.ndarray(_HEADER_SLOTS, dtype=np.uint64, buffer=shm.buf)
+        header[:] = 0
+        header[_CAPACITY] = capacity
+        header[_MAX_LINES] = max_lines
+        header[_PARAMS_CAPACITY] = params_capacity
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """
+        連接主程式建立的共享記憶體區段。
+        :raises FileNotFoundError: 區段不存在（主程式未啟動或已結束）
+        """
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python 3.13 以前：連接也會被 resource_tracker 追蹤，tuner 結束時會把主程式的區段刪掉
+            shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm, owner=False)
+
+    # === 主程式端 ===
+    def publish(self, frame, edges, lines):
+        """
+        發布一幀畫面與其階段輸出（寫入共享記憶體，呼叫端的陣列可立即重複使用）。
+        :param frame: 畫面 (H, W) 灰階或 (H, W, 3) BGR
+        :param edges: 邊緣圖 (H, W)，None 表示沒有
+        :param lines: 候選線段 (N,1,4) / (N,4) 或 None
+        :return: 是否成功發布（畫面超過容量時不發布）
+        """
+        h, w = frame.shape[:2]
+        channels = 1 if frame.ndim == 2 else frame.shape[2]
+        if h * w > len(self._edges) or channels not in (1, 3):
+            if not self._warned:
+                print(f'共享畫面超過容量，略過發布: {frame.shape}')
+                self._warned = True
+            return False
+        n = 0 if lines is None else min(len(lines), len(self._lines))
+        hdr = self.header
+        hdr[_FRAME_SEQ] += 1
+        self._frame[:h * w * channels].reshape(frame.shape)[...] = frame
+        if edges is not None and edges.shape == (h, w):
+            self._edges[:h * w].reshape(h, w)[...] = edges
+        else:
+            self._edges[:h * w] = 0
+        if n:
+            self._lines[:n] = np.asarray(lines).reshape(-1, 4)[:n]
+        hdr[_HEIGHT], hdr[_WIDTH], hdr[_CHANNELS], hdr[_LINES] = h, w, channels, n
+        hdr[_FRAME_ID] += 1
+        hdr[_FRAME_SEQ] += 1
+        return True
+
+    def poll_params(self):
+        """
+        :return: tuner 送來的新參數 dict；沒有新參數（或正在寫入）時回傳 None
+        """
+        hdr = self.header
+        seq = int(hdr[_PARAMS_SEQ])
+        if seq == self._last_params_seq or seq & 1:
+            return None
+        data = self._params[:int(hdr[_PARAMS_LEN])].tobytes()
+        if int(hdr[_PARAMS_SEQ]) != seq:
+            return None
+        try:
+            params = json.loads(data)
+        except ValueError:
+            return None
+        self._last_params_seq = seq
+        return params
+
+    # === tuner 端 ===
+    def read(self):
+        """
+        讀取最新一幀（複製到讀取端自己的緩衝區，下一次 read() 會覆寫）。
+        :return: (幀編號, 畫面, 邊緣圖, 候選線段 int32 (N,4))；沒有新幀或正在寫入時回傳 None
+        """
+        hdr = self.header
+        seq = int(hdr[_FRAME_SEQ])
+        frame_id = int(hdr[_FRAME_ID])
+        if seq & 1 or frame_id == self._last_frame_id:
+            return None
+        h, w, channels, n = (int(v) for v in hdr[_HEIGHT:_LINES + 1])
+        shape = (h, w) if channels == 1 else (h, w, channels)
+        bufs = self._read_buffers
+        if bufs is None or bufs[0].shape != shape:
+            bufs = self._read_buffers = (np.empty(shape, np.uint8), np.empty((h, w), np.uint8),
+                                         np.empty((len(self._lines), 4), np.int32))
+        frame, edges, lines = bufs
+        frame[...] = self._frame[:frame.size].reshape(shape)
+        edges[...] = self._edges[:h * w].reshape(h, w)
+        lines[:n] = self._lines[:n]
+        if int(hdr[_FRAME_SEQ]) != seq:
+            return None
+        self._last_frame_id = frame_id
+        return frame_id, frame, edges, lines[:n]
+
+    def write_params(self, params):
+        """
+        把參數直接送給主程式（主程式下一幀 poll_params() 取得）。
+        :return: 是否成功（JSON 超過容量時不送出）
+        """
+        data = np.frombuffer(json.dumps(params).encode(), dtype=np.uint8)
+        if len(data) > len(self._params):
+            return False
+        hdr = self.header
+        hdr[_PARAMS_SEQ] += 1
+        self._params[:len(data)] = data
+        hdr[_PARAMS_LEN] = len(data)
+        hdr[_PARAMS_SEQ] += 1
+        return True
+
+    def close(self):
+        """
+        釋放映射；建立者另外刪除共享記憶體區段。
+        """
+        if self.shm is None:
+            return
+        # 先釋放所有 numpy view，SharedMemory.close() 才能解除映射
+        self.header = self._frame = self._edges = self._lines = self._params = None
+        self._read_buffers = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+        self.shm = None
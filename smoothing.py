@@ -0,0 +1,85 @@
+# smoothing.py
+# 平滑濾波模組：Canny 前的去雜訊濾波，可在雙邊濾波與較便宜的替代方案間切換
+# 用於 8BallPool_assist 的視覺核心（vision_core.py）
+#
+# 所有後端共用同一組參數 (d, sigmaColor, sigmaSpace)，切換後端不需要重調滑桿：
+# - 'bilateral'     ：原本的 cv2.bilateralFilter，成本隨 d 平方成長
+# - 'bilateral_down'：先 pyrDown 縮小一半再做雙邊濾波（d、sigmaSpace 減半），最後放大回原尺寸
+# - 'guided'        ：自引導的 guided filter（半徑 d/2、eps = sigmaColor²），只用 box filter，成本與 d 無關
+# - 'median'        ：中值濾波（核大小 d，取奇數）
+# - 'box'           ：均值濾波（核大小 d），最便宜但不保留邊緣
+
+import cv2
+import numpy as np
+
+
+def _bilateral(gray, d, sigma_color, sigma_space, dst=None):
+    return cv2.bilateralFilter(gray, d, sigma_color, sigma_space, dst=dst)
+
+
+def _bilateral_down(gray, d, sigma_color, sigma_space, dst=None):
+    h, w = gray.shape[:2]
+    if h < 2 or w < 2:
+        return _bilateral(gray, d, sigma_color, sigma_space, dst)
+    small = cv2.pyrDown(gray)
+    small = cv2.bilateralFilter(small, max(1, d // 2), sigma_color, max(1, sigma_space / 2))
+    return cv2.resize(small, (w, h), dst=dst, interpolation=cv2.INTER_LINEAR)
+
+
+def _guided(gray, d, sigma_color, sigma_space, dst=None):
+    """
+    自引導 guided filter（He et al.）：以區域平均與變異數決定每個像素保留多少原值，
+    平坦區域被平均、高對比邊緣保留。
+    """
+    radius = max(1, d // 2)
+    ksize = (2 * radius + 1, 2 * radius + 1)
+    eps = float(sigma_color) ** 2
+    src = gray.astype(np.float32)
+    mean = cv2.boxFilter(src, -1, ksize)
+    var = cv2.boxFilter(src * src, -1, ksize) - mean * mean
+    a = var / (var + eps)
+    b = mean - a * mean
+    out = cv2.boxFilter(a, -1, ksize) * src + cv2.boxFilter(b, -1, ksize)
+    np.clip(out, 0, 255, out=out)
+    if dst is None:
+        return out.astype(np.uint8)
+    np.copyto(dst, out, casting='unsafe')
+    return dst
+
+
+def _median(gray, d, sigma_color, sigma_space, dst=None):
+    return cv2.medianBlur(gray, max(1, int(d)) | 1, dst=dst)
+
+
+def _box(gray, d, sigma_color, sigma_space, dst=None):
+    k = max(1, int(d))
+    return cv2.blur(gray, (k, k), dst=dst)
+
+
+_BACKENDS = {
+    'bilateral': _bilateral,
+    'bilateral_down': _bilateral_down,
+    'guided': _guided,
+    'median': _median,
+    'box': _box,
+}
+SMOOTH_BACKENDS = tuple(_BACKENDS)
+
+
+def smooth(gray, backend, d, sigma_color, sigma_space, dst=None):
+    """
+    依後端平滑灰階影像。
+    :param gray: 灰階影像 (H, W) uint8
+    :param backend: 'bilateral' / 'bilateral_down' / 'guided' / 'median' / 'box'
+    :param d: 濾波直徑（核大小）
+    :param sigma_color: 顏色 sigma（guided 的 eps = sigma_color²）
+    :param sigma_space: 空間 sigma（僅雙邊濾波使用）
+    :param dst: 預先配置的輸出 (H, W) uint8（見 buffer_pool.py），None 時配置新陣列；
+                不可與 gray 為同一陣列（雙邊濾波不支援原地運算）
+    :return: 平滑後影像 (H, W) uint8
+    """
+    try:
+        fn = _BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f'Unknown smoothing backend: {backend!r} (choices: {", ".join(_BACKENDS)})')
+    return fn(gray, d, sigma_color, sigma_space, dst)
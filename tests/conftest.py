@@ -0,0 +1,5 @@
+# 測試共用設定：專案模組都在上一層目錄（未打包），加入匯入路徑
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
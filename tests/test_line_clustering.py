@@ -0,0 +1,59 @@
+import cv2
+import numpy as np
+import pytest
+from line_clustering import as_segments, cluster_lines, line_params
+
+
+def _hough_fragments(angle_deg, length=300):
+    """
+    畫一條 1 像素寬的反鋸齒斜線，回傳雙重 Hough（長 / 短）的候選線段。
+    """
+    img = np.zeros((188, 383), dtype=np.uint8)
+    a = np.deg2rad(angle_deg)
+    x0, y0 = 40, 150
+    end = (int(round(x0 + length * np.cos(a))), int(round(y0 - length * np.sin(a))))
+    cv2.line(img, (x0, y0), end, 255, 1, cv2.LINE_AA)
+    edges = cv2.Canny(img, 50, 100)
+    groups = [cv2.HoughLinesP(edges, 1, np.pi / 180, 20, minLineLength=20, maxLineGap=3),
+              cv2.HoughLinesP(edges, 1, np.pi / 180, 10, minLineLength=5, maxLineGap=2)]
+    return np.concatenate([g for g in groups if g is not None])
+
+
+def _angle_error_deg(segments, angle_deg):
+    theta, _, _ = line_params(segments)
+    d = np.abs(np.rad2deg(theta) - (180 - angle_deg) % 180)
+    return np.minimum(d, 180 - d)
+
+
+@pytest.mark.parametrize('angle_deg', [2, 4, 6, 8, 12, 16])
+def test_antialiased_diagonal_keeps_its_angle(angle_deg):
+    candidates = _hough_fragments(angle_deg)
+    merged = as_segments(cluster_lines(candidates))
+    assert len(merged) > 0
+    # 最長的代表線段即為該斜線，不被水平階梯片段拉偏
+    assert _angle_error_deg(merged[:1], angle_deg)[0] < 1
+    # 不產生方向偏掉的長線段（階梯片段被串成的假水平線）
+    _, _, lengths = line_params(merged)
+    assert np.all(_angle_error_deg(merged[lengths > 30], angle_deg) < 2)
+
+
+def test_short_fragments_are_dropped():
+    lines = np.array([[[0, 0, 3, 0]], [[10, 10, 12, 11]]])
+    assert cluster_lines(lines, min_length=5.0) is None
+
+
+def test_collinear_pieces_merge_and_separate_lines_stay_apart():
+    lines = np.array([[[0, 50, 100, 50]], [[110, 51, 200, 51]], [[50, 0, 50, 100]], [[300, 50, 380, 50]]])
+    merged = as_segments(cluster_lines(lines, max_gap=20))
+    assert len(merged) == 3
+    np.testing.assert_allclose(merged[0], [0, 50, 200, 51], atol=1)
+
+
+def test_pieces_across_bin_edges_merge():
+    # 同一條線的兩段方向落在相鄰的角度 / 偏移分桶
+    a, b = np.deg2rad(3.9), np.deg2rad(4.1)
+    lines = np.array([[[0, 100, 150 * np.cos(a), 100 + 150 * np.sin(a)]],
+                      [[160 * np.cos(a), 100 + 160 * np.sin(a),
+                        160 * np.cos(a) + 120 * np.cos(b), 100 + 160 * np.sin(a) + 120 * np.sin(b)]]])
+    merged = as_segments(cluster_lines(lines))
+    assert len(merged) == 1
@@ -0,0 +1,23 @@
+import threading
+from metrics import Metrics
+
+
+def test_concurrent_records_are_not_lost():
+    m = Metrics(64)
+    m.enabled = True
+
+    def worker():
+        for i in range(20000):
+            m.record_latency('stage', i % 7)
+            m.record_count('points', 1)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    ring = m.latency['stage']
+    assert ring.count == 80000
+    assert ring.buckets.sum() == 80000
+    assert ring.total == 4 * sum(i % 7 for i in range(20000))
+    assert m.counts['points'].total == 80000
@@ -0,0 +1,23 @@
+import numpy as np
+from overlay_window import dirty_rects
+
+
+def _covers(rects, x, y, pad):
+    inside = (rects[:, 0] <= x - pad) & (x + pad < rects[:, 0] + rects[:, 2]) & \
+             (rects[:, 1] <= y - pad) & (y + pad < rects[:, 1] + rects[:, 3])
+    return inside.any()
+
+
+def test_dirty_rects_follow_diagonal():
+    seg = np.array([[0.0, 0.0, 800.0, 600.0]])
+    rects = dirty_rects(seg, 3, 16)
+    # 斜線的外接矩形是 800 × 600；切段後的面積只有其零頭
+    assert rects[:, 2:].prod(axis=1).sum() < 0.1 * 800 * 600
+    for t in np.linspace(0, 1, 101):
+        assert _covers(rects, 800 * t, 600 * t, 3)
+
+
+def test_dirty_rects_short_and_empty():
+    rects = dirty_rects(np.array([[5.0, 5.0, 5.0, 5.0], [10.0, 20.0, 14.0, 20.0]]), 2, 16)
+    assert len(rects) == 2
+    assert dirty_rects(np.empty((0, 4)), 2, 16).shape == (0, 4)
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+import ransac
+from ransac import ransac_lines
+
+
+def _line_points(n, start=(10, 20), step=(3, 1)):
+    return np.array([(start[0] + i * step[0], start[1] + i * step[1]) for i in range(n)], dtype=np.int16)
+
+
+def test_iterations_bounds():
+    assert ransac._iterations(0.99, 1.0, 2048) == 1
+    assert ransac._iterations(1.0, 0.5, 2048) == 2048
+    assert ransac._iterations(0.99, 0.0, 2048) == 2048
+    assert 1 <= ransac._iterations(0.99, 0.5, 2048) < 2048
+
+
+def test_all_points_inliers():
+    # 點數恰為 min_inliers 且全部共線：w == 1
+    points = _line_points(20)
+    with np.errstate(all='raise'):
+        lines = ransac_lines(points, min_inliers=20, min_length=10)
+    assert lines is not None and len(lines) == 1
+    np.testing.assert_allclose(lines[0, 0], [10, 20, 67, 39], atol=1)
+
+
+@pytest.mark.parametrize('seeded', [False, True])
+def test_full_confidence(seeded):
+    rng = np.random.default_rng(1)
+    noise = rng.integers(0, 200, (40, 2)).astype(np.int16)
+    points = np.concatenate([_line_points(50), noise])
+    seeds = np.array([[10, 20, 157, 69]]) if seeded else None
+    with np.errstate(all='raise'):
+        lines = ransac_lines(points, seeds=seeds, min_inliers=30, confidence=1.0, max_iterations=512, max_lines=1)
+    assert lines is not None
+    np.testing.assert_allclose(lines[0, 0], [10, 20, 157, 69], atol=1)
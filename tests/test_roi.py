@@ -0,0 +1,83 @@
+import cv2
+import numpy as np
+from config import config
+from frame_change import FrameChangeDetector
+from vision_core import VisionProcessor
+
+PARAMS = {'bilateral_d': 5, 'bilateral_sigmaColor': 50, 'bilateral_sigmaSpace': 5,
+          'canny_threshold1': 200, 'canny_threshold2': 100,
+          'hough_threshold_long': 20, 'hough_minLineLength_long': 20, 'hough_maxLineGap_long': 3,
+          'hough_threshold_short': 10, 'hough_minLineLength_short': 5, 'hough_maxLineGap_short': 2}
+
+
+def _frame(lines):
+    img = np.full((188, 383), 60, dtype=np.uint8)
+    for x1, y1, x2, y2 in lines:
+        cv2.line(img, (x1, y1), (x2, y2), 255, 1)
+    return img
+
+
+def test_roi_strips_map_back_to_frame():
+    diagonal, other = (60, 150, 300, 40), (20, 20, 120, 30)
+    frame = _frame([diagonal, other])
+    vp = VisionProcessor(config)
+    _, full_points = vp.get_features_dual_hough(frame, PARAMS)
+    full_points = full_points.copy()
+    lines, points = vp.get_features_roi(frame, PARAMS, [np.array([diagonal])], 12)
+    # 窄帶經過重新取樣，邊緣點與全畫面結果相差不超過 1 像素；窄帶外的線段不會被處理
+    x1, y1, x2, y2 = diagonal
+    n = np.array([y1 - y2, x2 - x1], dtype=np.float64) / np.hypot(x2 - x1, y2 - y1)
+    expected = full_points[np.abs((full_points - [x1, y1]) @ n) < 3].astype(np.float64)
+    dist = np.hypot(*(expected[:, None, :] - points[None, :, :]).transpose(2, 0, 1)).min(axis=1)
+    assert np.all(dist <= 1.5)
+    assert np.all(np.abs((points - [x1, y1]) @ n) < 14)
+    assert lines is not None
+    assert all(abs((seg[:2] - [x1, y1]) @ n) < 3 and abs((seg[2:] - [x1, y1]) @ n) < 3 for seg in lines.reshape(-1, 4))
+    assert vp.last_edges.shape == frame.shape
+    assert np.count_nonzero(vp.last_edges) == len(points)
+
+
+def test_changed_outside():
+    tracked = [np.array([[60, 150, 300, 40]])]
+    cd = FrameChangeDetector()
+    assert cd.changed(_frame([(60, 150, 300, 40)]))
+    assert cd.changed_outside(tracked, 12)  # 沒有參考畫面
+    # 線段本身移動：變化都在窄帶內
+    assert cd.changed(_frame([(60, 152, 300, 42)]))
+    assert not cd.changed_outside(tracked, 12)
+    # 窄帶外出現新線段
+    assert cd.changed(_frame([(60, 152, 300, 42), (20, 20, 120, 30)]))
+    assert cd.changed_outside(tracked, 12)
+
+
+def _processed_shapes(vp):
+    shapes = []
+    extract = vp.get_features_dual_hough
+
+    def spy(frame, params, seeds=None):
+        shapes.append(frame.shape[:2])
+        return extract(frame, params, seeds=seeds)
+
+    vp.get_features_dual_hough = spy
+    return shapes
+
+
+def test_roi_processes_fewer_pixels_than_full_frame():
+    line = (60, 150, 300, 40)
+    frame = _frame([line])
+    vp = VisionProcessor(config)
+    shapes = _processed_shapes(vp)
+    vp.get_features_roi(frame, PARAMS, [np.array([line])], 12)
+    (h, w), = shapes
+    assert h * w < frame.size
+
+
+def test_roi_falls_back_when_strips_cover_the_frame():
+    # 預設 bilateral_d = 20：每條窄帶含濾波邊界共 2 × (24 + 11) + 1 列，三條長斜線的窄帶比整張畫面大
+    lines = [(10, 180, 370, 10), (10, 10, 370, 180), (190, 0, 200, 187)]
+    frame = _frame(lines)
+    params = dict(PARAMS, bilateral_d=20)
+    vp = VisionProcessor(config)
+    shapes = _processed_shapes(vp)
+    vp.get_features_roi(frame, params, [np.array([l]) for l in lines], 24)
+    assert shapes == [frame.shape]
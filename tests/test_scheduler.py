@@ -0,0 +1,59 @@
+from config import config
+from scheduler import FrameScheduler
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _run(scheduler, clock, seconds, active, motion):
+    end = clock.now + seconds
+    while clock.now < end:
+        start = scheduler.begin()
+        wait = scheduler.end(start, active, motion)
+        clock.now += wait / 1000
+
+
+def test_idle_without_lines_even_if_frames_change():
+    clock = _Clock()
+    s = FrameScheduler(config, clock)
+    _run(s, clock, config.SCHEDULER_IDLE_AFTER_S, active=False, motion=True)
+    ticks = s.ticks
+    _run(s, clock, 10, active=False, motion=True)
+    # 每個閒置週期最多再多跑一幀
+    assert s.ticks - ticks <= 2 * 10 / s.idle_interval + 2
+
+
+def test_lines_keep_full_rate():
+    clock = _Clock()
+    s = FrameScheduler(config, clock)
+    _run(s, clock, config.SCHEDULER_IDLE_AFTER_S + 1, active=True, motion=False)
+    assert not s.idle
+
+
+def test_motion_wakes_from_idle():
+    clock = _Clock()
+    s = FrameScheduler(config, clock)
+    _run(s, clock, config.SCHEDULER_IDLE_AFTER_S + 1, active=False, motion=False)
+    assert s.idle
+    start = s.begin()
+    assert s.end(start, False, True) == s.min_gap
+    assert not s.idle
+    # 恢復全速的這一幀找到線段才維持全速
+    clock.now += 0.01
+    start = s.begin()
+    s.end(start, True, False)
+    assert not s.idle
+
+
+def test_zero_idle_interval_never_idles():
+    clock = _Clock()
+    s = FrameScheduler(config, clock)
+    s.idle_interval = 0
+    _run(s, clock, config.SCHEDULER_IDLE_AFTER_S + 1, active=False, motion=False)
+    assert not s.idle
+    assert s.ticks >= (config.SCHEDULER_IDLE_AFTER_S + 1) / s.budget
@@ -0,0 +1,41 @@
+import json
+import os
+import numpy as np
+from utils import extend_line_segment, extend_line_segments, save_params
+
+BOUNDS = {'left': 0, 'top': 0, 'width': 383, 'height': 188}
+
+
+def _random_lines(rng, n=500):
+    lines = rng.integers(-20, 400, (n, 4))
+    lines[::7, 2] = lines[::7, 0]       # 垂直
+    lines[1::7, 3] = lines[1::7, 1]     # 水平
+    lines[2::7, 2:] = lines[2::7, :2]   # 長度為 0
+    return lines
+
+
+def test_batch_matches_scalar():
+    rng = np.random.default_rng(0)
+    lines = _random_lines(rng)
+    batch = extend_line_segments(lines, BOUNDS)
+    for line, got in zip(lines, batch):
+        a, b = extend_line_segment(line, BOUNDS)
+        expected = np.array([a, b], dtype=np.float64)
+        got = got.reshape(2, 2)
+        # 端點順序不限；交點四捨五入的計算方式不同，容許 1 像素
+        err = min(np.abs(got - expected).max(), np.abs(got[::-1] - expected).max())
+        assert err <= 1, (line, got, expected)
+
+
+def test_zero_length_extends_vertically():
+    out = extend_line_segments(np.array([[50, 60, 50, 60]]), BOUNDS)
+    np.testing.assert_array_equal(out, [[50, 0, 50, 188]])
+
+
+def test_save_params_keeps_file_mode(tmp_path):
+    path = tmp_path / 'params.json'
+    path.write_text('{}')
+    os.chmod(path, 0o644)
+    save_params({'min_inliers': 20}, str(path))
+    assert os.stat(path).st_mode & 0o777 == 0o644
+    assert json.loads(path.read_text()) == {'min_inliers': 20}
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+import verifier
+from point_index import PointGrid
+
+
+def _random_case(rng, h=120, w=200):
+    """
+    隨機邊緣圖（幾條真實線段 + 雜訊）與候選線段；點雲即邊緣圖的非零像素。
+    """
+    edges = np.zeros((h, w), dtype=np.uint8)
+    for _ in range(rng.integers(1, 4)):
+        x1, x2 = rng.uniform(0, w, 2)
+        y1, y2 = rng.uniform(0, h, 2)
+        n = int(np.hypot(x2 - x1, y2 - y1)) + 1
+        xs = np.rint(np.linspace(x1, x2, n) + rng.normal(0, 0.4, n)).astype(int).clip(0, w - 1)
+        ys = np.rint(np.linspace(y1, y2, n) + rng.normal(0, 0.4, n)).astype(int).clip(0, h - 1)
+        edges[ys, xs] = 255
+    noise = rng.random((h, w)) < 0.02
+    edges[noise] = 255
+    ys, xs = np.nonzero(edges)
+    points = np.stack([xs, ys], axis=1).astype(np.int16)
+    # 候選：隨機線段，含超出畫面、長度為 0 與重複的線段
+    lines = rng.uniform(-10, max(h, w) + 10, (rng.integers(5, 30), 4))
+    lines[0, 2:] = lines[0, :2]
+    lines = np.rint(np.concatenate([lines, lines[:2]])).astype(np.int32).reshape(-1, 1, 4)
+    return edges, points, lines
+
+
+@pytest.mark.parametrize('mode', ['numpy', 'raster', 'grid'])
+def test_backends_match_loop(mode):
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        edges, points, lines = _random_case(rng)
+        index = PointGrid(points, edges.shape, 8)
+        segments = verifier._as_segments(lines)
+        expected = verifier._score_loop(segments, points)
+        counts = verifier._BACKENDS[mode](segments, points, edges, index)
+        np.testing.assert_array_equal(counts, expected)
+        min_inliers = int(rng.integers(0, 15))
+        top = verifier.verify_lines(lines, points, min_inliers, mode=mode, edges=edges, index=index)
+        ref = verifier.verify_lines(lines, points, min_inliers, mode='loop')
+        assert [tuple(l.ravel()) for l in top] == [tuple(l.ravel()) for l in ref]
@@ -1,15 +1,26 @@
 # tuner.py
 # 參數調整器 GUI：即時調整影像處理參數，預覽效果並儲存到 params_ransac.json
 # 用於 8BallPool_assist 的參數微調與除錯
+#
+# 共享模式（python tuner.py --shared <名稱>，由 main.py 在 config.TUNER_SHARED 時啟動）：
+# 預覽直接使用主程式已擷取的畫面與邊緣圖 / 候選線段（shared_frames.py），不另外擷取與處理；
+# 滑桿變動立即經由共享記憶體送給主程式，參數檔仍在停止變動後寫入以便保存。
 
 import cv2
 import numpy as np
 import tkinter as tk
 from tkinter import ttk
+import argparse
 import json
-from capture import capture_screen
+import threading
+from capture import open_capture
 from config import config
 from vision_core import VisionProcessor
+from frame_change import FrameChangeDetector
+from pipeline import LatestSlot
+from shared_frames import SharedFrameChannel
+from smoothing import SMOOTH_BACKENDS
+import utils
 from PIL import Image, ImageTk
 
 PARAMS_FILE = 'params_ransac.json'
@@ -20,6 +31,7 @@ def default_params():
     回傳預設參數 dict，供參數檔缺漏時補齊
     """
     return {
+        'smooth_backend': config.SMOOTH_BACKEND,
         'bilateral_d': config.BILATERAL_D,
         'bilateral_sigmaColor': config.BILATERAL_SIGMA_COLOR,
         'bilateral_sigmaSpace': config.BILATERAL_SIGMA_SPACE,
@@ -29,6 +41,15 @@ def default_params():
         'hough_minLineLength': config.HOUGH_MIN_LINE_LENGTH,
         'hough_maxLineGap': config.HOUGH_MAX_LINE_GAP,
         'min_inliers': config.MIN_INLIERS,
+        # HSV 白色遮罩
+        'hsv_gate': int(config.HSV_GATE),
+        'hsv_dilate': config.HSV_GATE_DILATE,
+        'hsv_h_low': int(config.HSV_WHITE_LOWER[0]),
+        'hsv_s_low': int(config.HSV_WHITE_LOWER[1]),
+        'hsv_v_low': int(config.HSV_WHITE_LOWER[2]),
+        'hsv_h_high': int(config.HSV_WHITE_UPPER[0]),
+        'hsv_s_high': int(config.HSV_WHITE_UPPER[1]),
+        'hsv_v_high': int(config.HSV_WHITE_UPPER[2]),
         # 長線段 Hough 參數
         'hough_threshold_long': config.HOUGH_THRESHOLD_LONG,
         'hough_minLineLength_long': config.HOUGH_MIN_LINE_LENGTH_LONG,
@@ -61,29 +82,139 @@ def load_params():
 
 def save_params(params):
     """
-    儲存參數到檔案
+    儲存參數到檔案（原子寫入，主程式不會讀到寫到一半的檔案）
     """
-    with open(PARAMS_FILE, 'w') as f:
-        json.dump(params, f)
+    utils.save_params(params, PARAMS_FILE)
+
+class PreviewWorker:
+    """
+    背景預覽執行緒：擷取、影像處理與預覽圖繪製都在這裡完成，
+    Tk 主執行緒只負責把完成的預覽圖轉成 PhotoImage，滑桿操作不會被影像處理卡住。
+    共享模式下不擷取也不處理，只讀取主程式發布的畫面與階段輸出並繪製預覽圖。
+    """
+    def __init__(self, get_params, preview_width, channel=None):
+        """
+        :param get_params: 無參數函式，回傳目前的參數 dict
+        :param preview_width: 預覽圖寬度（像素）
+        :param channel: SharedFrameChannel（共享模式），None 時自行擷取與處理
+        """
+        self.get_params = get_params
+        self.preview_width = preview_width
+        self.channel = channel
+        self.vision_processor = VisionProcessor(config) if channel is None else None
+        # 畫面沒變時沿用同一個幀編號，調整滑桿時只重跑受影響的階段
+        self.change_detector = FrameChangeDetector()
+        self.frame_id = 0
+        self.output = LatestSlot()  # (邊緣預覽 RGB, 偵測結果預覽 RGB)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='tuner-preview', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.output.close()
+        self._thread.join(timeout=1.0)
+
+    def _run(self):
+        if self.channel is not None:
+            self._run_shared()
+            return
+        # 擷取物件在此執行緒內建立（mss 不可跨執行緒）；預覽需要彩色畫面
+        capture = open_capture(config.GAME_WINDOW_RECT, config.CAPTURE_SOURCE)
+        last_key = None
+        try:
+            while not self._stop.is_set():
+                try:
+                    frame = capture.grab()
+                    params = self.get_params()
+                    if self.change_detector.changed(frame):
+                        self.frame_id += 1
+                    key = (self.frame_id, tuple(sorted(params.items())))
+                    if key == last_key:
+                        # 畫面與參數都沒變，預覽圖不需要更新
+                        self._stop.wait(0.01)
+                        continue
+                    last_key = key
+                    self.output.put(self.render(frame, params))
+                except Exception as e:
+                    print(f"預覽更新錯誤: {e}")
+                    self._stop.wait(0.1)
+        finally:
+            capture.close()
+
+    def _run_shared(self):
+        while not self._stop.is_set():
+            item = self.channel.read()
+            if item is None:
+                # 主程式沒有新結果（畫面與參數都沒變時主程式也不會重跑視覺流程）
+                self._stop.wait(0.01)
+                continue
+            _, frame, edges, lines = item
+            self.output.put(self.draw(frame, edges, lines))
+
+    def render(self, frame, params):
+        """
+        影像處理並繪製預覽圖：
+        1. 先把畫面與邊緣圖縮小到預覽大小，再標註（只處理預覽像素數）
+        2. 點雲以縮小後的邊緣遮罩一次上色（綠色）
+        3. 候選線段座標縮放後以一次 cv2.polylines 畫出（藍色）
+        :return: (邊緣預覽 RGB, 偵測結果預覽 RGB)
+        """
+        features = self.vision_processor.extract(frame, params, frame_id=self.frame_id)
+        return self.draw(frame, features.edges, features.candidate_lines)
+
+    def draw(self, frame, edges, lines):
+        """
+        繪製預覽圖（見 render()）。
+        :param frame: 畫面 (H, W) 灰階或 (H, W, 3) BGR
+        :param edges: 邊緣圖 (H, W)
+        :param lines: 候選線段 (N,1,4) / (N,4) 或 None
+        :return: (邊緣預覽 RGB, 偵測結果預覽 RGB)
+        """
+        h, w = frame.shape[:2]
+        scale = self.preview_width / w
+        new_size = (self.preview_width, max(1, int(h * scale)))
+        # 邊緣圖以 INTER_AREA 縮小，細邊緣不會在縮小時消失
+        edges_small = cv2.resize(edges, new_size, interpolation=cv2.INTER_AREA)
+        small = cv2.resize(frame, new_size, interpolation=cv2.INTER_AREA)
+        debug_rgb = cv2.cvtColor(small, cv2.COLOR_GRAY2RGB if small.ndim == 2 else cv2.COLOR_BGR2RGB)
+        debug_rgb[edges_small > 0] = (0, 255, 0)
+        if lines is not None and len(lines) > 0:
+            pts = np.rint(np.asarray(lines, dtype=np.float64).reshape(-1, 2, 2) * scale).astype(np.int32)
+            cv2.polylines(debug_rgb, pts, False, (0, 0, 255), 1)
+        return cv2.cvtColor(edges_small, cv2.COLOR_GRAY2RGB), debug_rgb
+
 
 class TunerGUI:
-    def __init__(self):
+    def __init__(self, channel=None):
+        """
+        :param channel: SharedFrameChannel（共享模式），None 時為獨立模式
+        """
         self.params = load_params()
-        self.vision_processor = VisionProcessor(config)
+        self.channel = channel
         self.PREVIEW_WIDTH = 350
         
         # 建立主視窗
         self.root = tk.Tk()
         self.root.title("Tuner")
-        self.root.geometry("800x430")
+        self.root.geometry("800x560")
         
         # 建立變數
         self.vars = {}
         self.sliders = {}
+        self._save_job = None  # 延遲寫入參數檔的排程
         
         # 建立介面
         self.create_widgets()
         
+        # 預覽在背景執行緒計算（預覽區域寬度 = 視窗寬度減去邊距後均分，再減去間距）
+        available_width = 800 - 20
+        self.preview_worker = PreviewWorker(lambda: self.params, available_width // 2 - 5, channel)
+        self.preview_worker.start()
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        
         # 開始更新循環
         self.update_preview()
         
@@ -110,6 +241,9 @@ class TunerGUI:
         # 建立右側參數（Hough）
         self.create_right_params(right_frame)
         
+        # HSV 白色遮罩參數（參數列下方）
+        self.create_hsv_params(main_frame)
+        
         # 預覽框架（下半部分）
         preview_frame = ttk.Frame(main_frame)
         preview_frame.pack(fill=tk.BOTH, expand=True, pady=(3, 0))
@@ -126,6 +260,7 @@ class TunerGUI:
         bilateral_frame = ttk.LabelFrame(parent, text="Bilateral Filter")
         bilateral_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 2))
         
+        self.create_combobox(bilateral_frame, "Backend", "smooth_backend", SMOOTH_BACKENDS)
         self.create_slider(bilateral_frame, "d", "bilateral_d", 1, 40)
         self.create_slider(bilateral_frame, "SigmaColor", "bilateral_sigmaColor", 1, 400)
         self.create_slider(bilateral_frame, "SigmaSpace", "bilateral_sigmaSpace", 1, 200)
@@ -164,6 +299,28 @@ class TunerGUI:
             self.create_slider(hough_short_frame, "MinLineLen", "hough_minLineLength_short", 1, 50)
             self.create_slider(hough_short_frame, "MaxLineGap", "hough_maxLineGap_short", 1, 100)
     
+    def create_hsv_params(self, parent):
+        # HSV 白色遮罩：左欄下限、右欄上限，開關與擴張半徑放在最上面一列
+        hsv_frame = ttk.LabelFrame(parent, text="HSV White Gate")
+        hsv_frame.pack(fill=tk.X, pady=(0, 3))
+        
+        top_frame = ttk.Frame(hsv_frame)
+        top_frame.pack(fill=tk.X)
+        gate_frame = ttk.Frame(top_frame)
+        gate_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(0, 5))
+        dilate_frame = ttk.Frame(top_frame)
+        dilate_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=(5, 0))
+        self.create_slider(gate_frame, "Enable", "hsv_gate", 0, 1)
+        self.create_slider(dilate_frame, "Dilate", "hsv_dilate", 0, 10)
+        
+        lower_frame = ttk.Frame(hsv_frame)
+        lower_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(0, 5))
+        upper_frame = ttk.Frame(hsv_frame)
+        upper_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=(5, 0))
+        for channel, max_val in (("h", 180), ("s", 255), ("v", 255)):
+            self.create_slider(lower_frame, f"{channel.upper()} low", f"hsv_{channel}_low", 0, max_val)
+            self.create_slider(upper_frame, f"{channel.upper()} high", f"hsv_{channel}_high", 0, max_val)
+    
     def create_slider(self, parent, label, key, min_val, max_val):
         frame = ttk.Frame(parent)
         frame.pack(fill=tk.X, pady=0)
@@ -191,66 +348,50 @@ class TunerGUI:
         var.trace('w', update_value)
         self.sliders[key] = slider
     
+    def create_combobox(self, parent, label, key, choices):
+        frame = ttk.Frame(parent)
+        frame.pack(fill=tk.X, pady=0)
+        
+        ttk.Label(frame, text=label, width=10).pack(side=tk.LEFT)
+        
+        # 變數（字串選項）
+        var = tk.StringVar(value=self.params.get(key, choices[0]))
+        self.vars[key] = var
+        
+        combobox = ttk.Combobox(frame, textvariable=var, values=list(choices), state="readonly", width=18)
+        combobox.pack(side=tk.LEFT, padx=(5, 5))
+        
+        var.trace('w', lambda *args: self.update_params())
+        self.sliders[key] = combobox
+    
     def update_params(self):
         # 收集所有參數
         params = {}
         for key, var in self.vars.items():
             params[key] = var.get()
         
-        # 儲存參數
-        save_params(params)
+        # 預覽立即套用（共享模式下同時直接送給主程式）；寫檔則延遲到滑桿停止變動後（debounce）
         self.params = params
+        if self.channel is not None:
+            self.channel.write_params(params)
+        if self._save_job is not None:
+            self.root.after_cancel(self._save_job)
+        self._save_job = self.root.after(config.PARAMS_SAVE_DEBOUNCE_MS, self.flush_params)
+
+    def flush_params(self):
+        self._save_job = None
+        save_params(self.params)
     
     def update_preview(self):
-        try:
-            # 擷取畫面
-            frame = capture_screen(config.GAME_WINDOW_RECT)
-            
-            # 取得參數
-            params = self.params.copy()
-            
-            # 影像處理
-            if config.USE_DUAL_HOUGH:
-                candidate_lines, points = self.vision_processor.get_features_dual_hough(frame, params)
-            else:
-                candidate_lines, points = self.vision_processor.get_features(frame, params)
-            
-            # 邊緣圖像重建
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            filtered = cv2.bilateralFilter(gray, params['bilateral_d'], params['bilateral_sigmaColor'], params['bilateral_sigmaSpace'])
-            edges = cv2.Canny(filtered, params['canny_threshold1'], params['canny_threshold2'])
-            
-            # 偵測結果圖
-            debug_view = frame.copy()
-            
-            # 畫點雲（綠色）
-            for x, y in points:
-                cv2.circle(debug_view, (int(x), int(y)), 1, (0,255,0), -1)
-            
-            # 畫 Hough 線段（藍色）
-            if candidate_lines is not None:
-                for line in candidate_lines:
-                    x1, y1, x2, y2 = line[0]
-                    cv2.line(debug_view, (x1, y1), (x2, y2), (255,0,0), 1)
-            
-            # 縮小預覽（讓預覽圖填滿可用空間）
-            h, w = debug_view.shape[:2]
-            # 計算預覽區域的可用寬度（視窗寬度減去邊距）
-            available_width = 800 - 20  # 視窗寬度減去左右邊距
-            preview_width = available_width // 2 - 5  # 均分寬度，減去間距
-            scale = preview_width / w
-            new_size = (preview_width, int(h * scale))
-            debug_view_small = cv2.resize(debug_view, new_size)
-            edges_rgb = cv2.cvtColor(edges, cv2.COLOR_GRAY2RGB)
-            edges_small = cv2.resize(edges_rgb, new_size)
-            
-            # 轉換為 PIL Image
-            edges_pil = Image.fromarray(edges_small)
-            debug_pil = Image.fromarray(cv2.cvtColor(debug_view_small, cv2.COLOR_BGR2RGB))
-            
+        """
+        Tk 主執行緒：取出背景執行緒完成的預覽圖並顯示（沒有新預覽時不做事）。
+        """
+        result = self.preview_worker.output.poll()
+        if result is not None:
+            edges_rgb, debug_rgb = result
             # 轉換為 PhotoImage
-            edges_photo = ImageTk.PhotoImage(edges_pil)
-            debug_photo = ImageTk.PhotoImage(debug_pil)
+            edges_photo = ImageTk.PhotoImage(Image.fromarray(edges_rgb))
+            debug_photo = ImageTk.PhotoImage(Image.fromarray(debug_rgb))
             
             # 更新標籤
             self.edges_label.configure(image=edges_photo, text="")
@@ -258,16 +399,35 @@ class TunerGUI:
             
             self.debug_label.configure(image=debug_photo, text="")
             self.debug_label.image = debug_photo
-            
-        except Exception as e:
-            print(f"預覽更新錯誤: {e}")
         
-        # 30ms 後再次更新
-        self.root.after(30, self.update_preview)
+        # 15ms 後再次檢查
+        self.root.after(15, self.update_preview)
+
+    def close(self):
+        if self._save_job is not None:
+            self.root.after_cancel(self._save_job)
+            self.flush_params()
+        self.preview_worker.stop()
+        if self.channel is not None:
+            self.channel.close()
+        self.root.destroy()
     
     def run(self):
         self.root.mainloop()
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Parameter tuner')
+    parser.add_argument('--shared', metavar='NAME', help='shared memory channel created by main.py')
+    args = parser.parse_args(argv)
+    channel = None
+    if args.shared:
+        try:
+            channel = SharedFrameChannel.attach(args.shared)
+        except FileNotFoundError:
+            print(f'找不到共享記憶體 {args.shared}，改為獨立擷取模式')
+    app = TunerGUI(channel)
+    app.run()
+
+
 if __name__ == "__main__":
-    app = TunerGUI()
-    app.run() 
\ No newline at end of file
+    main() 
\ No newline at end of file
@@ -3,8 +3,14 @@
 # 用於 8BallPool_assist 的主程式與調參器
 
 import json
+import os
+import tempfile
+import threading
+import time
+from collections.abc import Mapping
 import numpy as np
 from config import config
+from line_clustering import as_segments
 
 def load_params():
     """
@@ -29,6 +35,130 @@ def load_params():
             'min_inliers': config.MIN_INLIERS
         }
 
+def save_params(params, path=None):
+    """
+    原子寫入參數檔：先寫入同資料夾的暫存檔，再以 os.replace 取代，
+    讀取端永遠不會讀到寫到一半的檔案。
+    :param params: 參數 dict
+    :param path: 參數檔路徑，預設為 config.PARAMS_FILE
+    """
+    path = path or config.PARAMS_FILE
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.params-', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(dict(params), f)
+        try:
+            # mkstemp 建立的檔案權限為 0600，沿用原參數檔的權限
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class ParamSnapshot(Mapping):
+    """
+    不可變的參數快照：
+    - 介面同唯讀 dict（get / [] / items ...）
+    - version：每次內容變更遞增，下游快取可用來判斷參數是否改變
+    - key：可雜湊的 (key, value) tuple，可用作快取鍵
+    """
+    __slots__ = ('_data', 'version', 'key')
+
+    def __init__(self, data, version=0):
+        self._data = dict(data)
+        self.version = version
+        self.key = tuple(sorted(self._data.items()))
+
+    def __getitem__(self, k):
+        return self._data[k]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def copy(self):
+        """
+        :return: 可修改的 dict 副本
+        """
+        return dict(self._data)
+
+    def __repr__(self):
+        return f'ParamSnapshot(v{self.version}, {self._data!r})'
+
+
+class ParamStore:
+    """
+    變更驅動的參數來源（取代每幀呼叫 load_params）：
+    1. 每隔 poll_interval 秒才 stat 一次參數檔
+    2. 只有 mtime / 大小 / inode 改變時才重新解析 JSON
+    3. 回傳不可變的 ParamSnapshot；內容相同時沿用同一個快照（版本不變）
+    4. 解析失敗時保留上一個有效快照
+    可在多個執行緒中呼叫 get()。
+    """
+    def __init__(self, path=None, poll_interval=None):
+        self.path = path or config.PARAMS_FILE
+        if poll_interval is None:
+            poll_interval = config.PARAMS_POLL_INTERVAL_MS / 1000
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._signature = None
+        self._next_check = 0.0
+        self._snapshot = None
+
+    def _stat_signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def get(self):
+        """
+        :return: 目前的 ParamSnapshot
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._snapshot is not None and now < self._next_check:
+                return self._snapshot
+            self._next_check = now + self.poll_interval
+            signature = self._stat_signature()
+            if self._snapshot is None or signature != self._signature:
+                self._signature = signature
+                self._reload()
+            return self._snapshot
+
+    def update(self, data):
+        """
+        直接套用新參數（例如 tuner 經由共享記憶體送來的參數），不必等參數檔寫入。
+        之後參數檔寫入相同內容時不會再產生新版本。
+        :param data: 參數 dict
+        """
+        with self._lock:
+            if self._snapshot is not None and dict(self._snapshot) == data:
+                return
+            version = self._snapshot.version + 1 if self._snapshot is not None else 0
+            self._snapshot = ParamSnapshot(data, version)
+
+    def _reload(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except Exception:
+            if self._snapshot is not None:
+                return
+            data = load_params()  # 無有效檔案時使用預設值
+        if self._snapshot is not None and dict(self._snapshot) == data:
+            return
+        version = self._snapshot.version + 1 if self._snapshot is not None else 0
+        self._snapshot = ParamSnapshot(data, version)
+
+
 def extend_line_segment(line, bounds):
     """
     將一條 Hough 線段延伸為穿越整個畫面邊界的直線段。
@@ -91,4 +221,45 @@ def extend_line_segment(line, bounds):
     elif len(points) == 2:
         return points[0], points[1]
     else:
-        return (x1, y1), (x2, y2) 
\ No newline at end of file
+        return (x1, y1), (x2, y2) 
+
+
+def extend_line_segments(lines, bounds):
+    """
+    批次版 extend_line_segment：一次將 N 條線段延伸到畫面邊界。
+    以參數式 p = p1 + t·(p2 - p1) 求與四條邊界的交點（平行的邊界得到 nan，自然被排除），
+    取落在畫面內的交點中 t 最小與最大者作為延伸端點；無法延伸（線段在畫面外）時保留原始端點。
+    垂直（含長度為 0）與水平線同 extend_line_segment：直接延伸為整個畫面高 / 寬的線段。
+    :param lines: (N,4)、(N,1,4) 陣列，或驗證器 / 追蹤器輸出的線段列表
+    :param bounds: 畫布邊界 dict（含 width, height）
+    :return: int32 (N,4) 延伸後的端點 [x1, y1, x2, y2]
+    """
+    seg = as_segments(lines)
+    width = bounds['width']
+    height = bounds['height']
+    x1, y1, x2, y2 = seg.T
+    dx = (x2 - x1)[:, None]
+    dy = (y2 - y1)[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # 與 x=0、x=width、y=0、y=height 的交點參數 (N,4)
+        t = np.concatenate([
+            (np.array([0, width]) - x1[:, None]) / dx,
+            (np.array([0, height]) - y1[:, None]) / dy,
+        ], axis=1)
+        px = x1[:, None] + t * dx
+        py = y1[:, None] + t * dy
+    eps = 1e-6
+    valid = (np.isfinite(t) & (px >= -eps) & (px <= width + eps) & (py >= -eps) & (py <= height + eps))
+    tmin = np.where(valid, t, np.inf).min(axis=1)
+    tmax = np.where(valid, t, -np.inf).max(axis=1)
+    ok = tmax > tmin
+    tmin = np.where(ok, tmin, 0.0)
+    tmax = np.where(ok, tmax, 1.0)
+    dx = dx[:, 0]
+    dy = dy[:, 0]
+    out = np.stack([x1 + tmin * dx, y1 + tmin * dy, x1 + tmax * dx, y1 + tmax * dy], axis=1)
+    vertical = dx == 0
+    horizontal = (dy == 0) & ~vertical
+    out[vertical] = np.stack([x1, np.zeros_like(x1), x1, np.full_like(x1, height)], axis=1)[vertical]
+    out[horizontal] = np.stack([np.zeros_like(y1), y1, np.full_like(y1, width), y1], axis=1)[horizontal]
+    return np.rint(out).astype(np.int32)
@@ -1,46 +1,245 @@
 # verifier.py
 # 線段驗證模組：根據點雲支持度驗證 Hough 線段，篩選出最可靠的線段
 # 用於 8BallPool_assist 的線段過濾與排序
+#
+# 驗證引擎支援多種後端（由 config.VERIFY_MODE 或 mode 參數選擇）：
+# - 'loop'  ：原始逐線段 Python 迴圈（參考實作）
+# - 'numpy' ：分塊向量化，一次計算所有候選線段，記憶體用量受 config.VERIFY_MAX_ELEMENTS 限制
+# - 'raster'：沿線段取樣，直接查 Canny 邊緣圖支持帶內的邊緣像素（需提供 edges，不需要點雲）
+# - 'grid'  ：以 PointGrid 空間索引只檢查線段經過的格子，成本與線段長度成正比
 
 import numpy as np
+from config import config
+from point_index import PointGrid
 
-def verify_lines(candidate_lines, points, min_inliers=20):
+INLIER_DISTANCE = 1.5  # 點到線段距離小於此值視為支持點
+TOP_K = 3              # 最多回傳幾條線段
+
+
+def _as_segments(candidate_lines):
     """
-    用點雲支持度驗證 Hough 線段：
-    1. 遍歷每條候選線段，計算點雲中有多少點「貼近」這條線段（距離 < 1.5 像素）
-    2. 支持度高於 min_inliers 的線段才被視為有效
-    3. 最後只取支持度最高的前三條線段
-    :param candidate_lines: Hough 提案線段 (N,1,4)
-    :param points: 邊緣點雲 (M,2)
-    :param min_inliers: 最小支持點數
-    :return: 最佳線段列表（每條格式同 Hough 輸出）
+    將 Hough 輸出 (N,1,4) 或 (N,4) 轉為 float64 (N,4) 陣列。
     """
-    if candidate_lines is None or len(candidate_lines) == 0 or points is None or len(points) == 0:
-        return []
-    supported_lines = []
-    for line in candidate_lines:
-        x1, y1, x2, y2 = line[0]
+    return np.asarray(candidate_lines, dtype=np.float64).reshape(-1, 4)
+
+
+def _out(pool, name, shape, dtype=np.float64):
+    """
+    :return: 緩衝區池中的輸出陣列，沒有緩衝區池時回傳 None（由 NumPy / OpenCV 配置新陣列）
+    """
+    return None if pool is None else pool.get(name, shape, dtype)
+
+
+def _score_loop(segments, points, edges=None, index=None, pool=None):
+    """
+    原始實作：逐條線段計算所有點到線段的距離。
+    :return: 每條線段的支持點數 (N,)，長度為 0 的線段為 -1
+    """
+    counts = np.full(len(segments), -1, dtype=np.int64)
+    px = points[:, 0]
+    py = points[:, 1]
+    for i, (x1, y1, x2, y2) in enumerate(segments):
         # 線段向量
         dx = x2 - x1
         dy = y2 - y1
         norm = np.hypot(dx, dy)
         if norm == 0:
             continue
-        # 計算所有點到線段的最短距離
-        px = points[:, 0]
-        py = points[:, 1]
         # 投影參數 t (0<=t<=1在線段上)
         t = ((px - x1) * dx + (py - y1) * dy) / (norm ** 2)
         t = np.clip(t, 0, 1)
         proj_x = x1 + t * dx
         proj_y = y1 + t * dy
         dists = np.hypot(px - proj_x, py - proj_y)
-        inlier_count = np.sum(dists < 1.5)  # 支持點數
-        if inlier_count > min_inliers:
-            supported_lines.append((line, inlier_count))
-    if not supported_lines:
+        counts[i] = np.sum(dists < INLIER_DISTANCE)
+    return counts
+
+
+def _score_numpy(segments, points, edges=None, index=None, pool=None):
+    """
+    分塊向量化：每塊同時計算多條線段對全部點的距離，
+    區塊大小使 (線段數 × 點數) 不超過 config.VERIFY_MAX_ELEMENTS。
+    有緩衝區池時，點座標與每塊的 (chunk, M) 暫存陣列都重複使用池中的緩衝區。
+    :return: 每條線段的支持點數 (N,)，長度為 0 的線段為 -1
+    """
+    n = len(segments)
+    m = len(points)
+    counts = np.full(n, -1, dtype=np.int64)
+    if pool is None:
+        px = points[:, 0].astype(np.float64)[None, :]
+        py = points[:, 1].astype(np.float64)[None, :]
+    else:
+        px = _out(pool, 'verify_px', (1, m))
+        py = _out(pool, 'verify_py', (1, m))
+        np.copyto(px[0], points[:, 0])
+        np.copyto(py[0], points[:, 1])
+    x1, y1, x2, y2 = segments.T
+    dx = x2 - x1
+    dy = y2 - y1
+    norm = np.hypot(dx, dy)
+    valid = np.flatnonzero(norm > 0)
+    if len(valid) == 0:
+        return counts
+    len2 = norm ** 2
+    limit = INLIER_DISTANCE ** 2
+    chunk = max(1, config.VERIFY_MAX_ELEMENTS // max(1, m))
+    for start in range(0, len(valid), chunk):
+        idx = valid[start:start + chunk]
+        shape = (len(idx), m)
+        cdx = dx[idx, None]
+        cdy = dy[idx, None]
+        # 點相對線段起點的向量 (chunk, M)
+        rx = np.subtract(px, x1[idx, None], out=_out(pool, 'verify_rx', shape))
+        ry = np.subtract(py, y1[idx, None], out=_out(pool, 'verify_ry', shape))
+        # 投影參數 t (0<=t<=1在線段上)
+        t = np.multiply(rx, cdx, out=_out(pool, 'verify_t', shape))
+        tmp = np.multiply(ry, cdy, out=_out(pool, 'verify_tmp', shape))
+        t += tmp
+        t /= len2[idx, None]
+        np.clip(t, 0, 1, out=t)
+        # 垂足到點的向量，原地計算以減少暫存陣列
+        rx -= np.multiply(t, cdx, out=tmp)
+        ry -= np.multiply(t, cdy, out=tmp)
+        rx *= rx
+        ry *= ry
+        rx += ry
+        # 以平方距離比較，省去 sqrt
+        counts[idx] = np.count_nonzero(np.less(rx, limit, out=_out(pool, 'verify_hit', shape, np.bool_)), axis=1)
+    return counts
+
+
+def _score_raster(segments, points, edges=None, index=None, pool=None):
+    """
+    邊緣圖查表：逐條線段沿主軸方向（|dx| >= |dy| 時為 x，否則為 y）走訪每一欄，
+    取該欄內直線附近的幾個像素（距直線 < INLIER_DISTANCE 的像素，在副軸方向離直線不超過
+    INLIER_DISTANCE / cosθ <= 2.13 像素），直接查邊緣圖是否為邊緣像素，再以與 'loop' 相同的公式計算精確距離。
+    每個 (線段, 像素) 只會產生一次，不需要去重；點雲即邊緣圖的非零像素，因此支持點數與 'loop' 完全相同。
+    :return: 每條線段的支持點數 (N,)，長度為 0 的線段為 -1
+    """
+    if edges is None:
+        # 沒有邊緣圖時退回向量化後端
+        return _score_numpy(segments, points, pool=pool)
+    h, w = edges.shape[:2]
+    n = len(segments)
+    counts = np.full(n, -1, dtype=np.int64)
+    x1, y1, x2, y2 = segments.T
+    dx = x2 - x1
+    dy = y2 - y1
+    norm = np.hypot(dx, dy)
+    valid = np.flatnonzero(norm > 0)
+    if len(valid) == 0:
+        return counts
+    counts[valid] = 0
+    # 主軸 (a) / 副軸 (b) 座標
+    swap = np.abs(dy[valid]) > np.abs(dx[valid])
+    a1 = np.where(swap, y1[valid], x1[valid])
+    b1 = np.where(swap, x1[valid], y1[valid])
+    da = np.where(swap, dy[valid], dx[valid])
+    db = np.where(swap, dx[valid], dy[valid])
+    a2 = a1 + da
+    # 主軸上涵蓋端點外 INLIER_DISTANCE 的每一欄
+    a_lo = np.ceil(np.minimum(a1, a2) - INLIER_DISTANCE).astype(np.int64)
+    n_cols = np.floor(np.maximum(a1, a2) + INLIER_DISTANCE).astype(np.int64) - a_lo + 1
+    owner = np.repeat(np.arange(len(valid)), n_cols)
+    offsets = np.cumsum(n_cols) - n_cols
+    a = np.repeat(a_lo - offsets, n_cols) + np.arange(len(owner))
+    # 該欄直線的副軸座標與半寬；每欄取 6 個像素即涵蓋 2 × 2.13 的範圍
+    bc = b1[owner] + (a - a1[owner]) * (db / da)[owner]
+    r = INLIER_DISTANCE * norm[valid] / np.abs(da)
+    b = np.floor(bc - r[owner]).astype(np.int64)[:, None] + np.arange(6)
+    a = np.broadcast_to(a[:, None], b.shape)
+    own = np.broadcast_to(owner[:, None], b.shape)
+    sw = np.broadcast_to(swap[owner][:, None], b.shape)
+    px = np.where(sw, b, a)
+    py = np.where(sw, a, b)
+    inside = (px >= 0) & (px < w) & (py >= 0) & (py < h)
+    own, px, py = own[inside], px[inside], py[inside]
+    on_edge = edges[py, px] != 0
+    own = own[on_edge]
+    if len(own) == 0:
+        return counts
+    px = px[on_edge].astype(np.float64)
+    py = py[on_edge].astype(np.float64)
+    # 與 'loop' 相同的距離公式（逐元素運算順序一致，邊界上的點判定也一致）
+    ox1, oy1 = x1[valid][own], y1[valid][own]
+    odx, ody = dx[valid][own], dy[valid][own]
+    tt = ((px - ox1) * odx + (py - oy1) * ody) / (norm[valid][own] ** 2)
+    np.clip(tt, 0, 1, out=tt)
+    hits = np.hypot(px - (ox1 + tt * odx), py - (oy1 + tt * ody)) < INLIER_DISTANCE
+    counts[valid] = np.bincount(own[hits], minlength=len(valid))
+    return counts
+
+
+def _score_grid(segments, points, edges=None, index=None, pool=None):
+    """
+    空間索引查詢：只取出線段支持帶經過之格子內的點，再計算精確距離。
+    結果與 'numpy' 後端相同，但成本與線段長度成正比，而非與總點數成正比。
+    :return: 每條線段的支持點數 (N,)，長度為 0 的線段為 -1
+    """
+    if index is None:
+        # 沒有預先建立的索引時就地建立（畫面大小以點雲範圍估計）
+        h = int(points[:, 1].max()) + 1
+        w = int(points[:, 0].max()) + 1
+        index = PointGrid(points, (h, w), config.GRID_CELL_SIZE)
+    n = len(segments)
+    counts = np.full(n, -1, dtype=np.int64)
+    x1, y1, x2, y2 = segments.T
+    dx = x2 - x1
+    dy = y2 - y1
+    len2 = dx * dx + dy * dy
+    valid = np.flatnonzero(len2 > 0)
+    if len(valid) == 0:
+        return counts
+    owner, pts = index.gather(segments[valid])
+    counts[valid] = 0
+    if len(owner) == 0:
+        return counts
+    # 每個 (線段, 候選點) 配對的點到線段距離
+    odx = dx[valid][owner]
+    ody = dy[valid][owner]
+    rx = pts[:, 0] - x1[valid][owner]
+    ry = pts[:, 1] - y1[valid][owner]
+    t = (rx * odx + ry * ody) / len2[valid][owner]
+    np.clip(t, 0, 1, out=t)
+    rx -= t * odx
+    ry -= t * ody
+    hits = rx * rx + ry * ry < INLIER_DISTANCE ** 2
+    counts[valid] = np.bincount(owner[hits], minlength=len(valid))
+    return counts
+
+
+_BACKENDS = {
+    'loop': _score_loop,
+    'numpy': _score_numpy,
+    'raster': _score_raster,
+    'grid': _score_grid,
+}
+
+
+def verify_lines(candidate_lines, points, min_inliers=20, mode=None, edges=None, index=None, pool=None):
+    """
+    用點雲支持度驗證 Hough 線段：
+    1. 計算每條候選線段的支持度（點雲中距離線段 < 1.5 像素的點數）
+    2. 支持度高於 min_inliers 的線段才被視為有效
+    3. 最後只取支持度最高的前三條線段
+    :param candidate_lines: Hough 提案線段 (N,1,4)
+    :param points: 邊緣點雲 (M,2)
+    :param min_inliers: 最小支持點數
+    :param mode: 驗證後端 'loop' / 'numpy' / 'raster' / 'grid'，None 時使用 config.VERIFY_MODE
+    :param edges: Canny 邊緣圖（'raster' 後端使用）
+    :param index: 點雲空間索引 PointGrid（'grid' 後端使用）
+    :param pool: BufferPool，不為 None 時 'numpy' 後端重複使用其中的暫存陣列
+    :return: 最佳線段列表（每條格式同 Hough 輸出）
+    """
+    if candidate_lines is None or len(candidate_lines) == 0 or points is None or len(points) == 0:
+        return []
+    mode = mode or config.VERIFY_MODE
+    if mode not in _BACKENDS:
+        raise ValueError(f'Unknown verify mode: {mode}')
+    counts = _BACKENDS[mode](_as_segments(candidate_lines), points, edges, index, pool)
+    supported = np.flatnonzero(counts > min_inliers)
+    if len(supported) == 0:
         return []
-    # 依支持度排序，取前三
-    supported_lines.sort(key=lambda x: x[1], reverse=True)
-    best_lines = [item[0] for item in supported_lines[:3]]
-    return best_lines 
\ No newline at end of file
+    # 依支持度排序（穩定排序，同分時保留原始順序），取前三
+    order = supported[np.argsort(-counts[supported], kind='stable')]
+    return [candidate_lines[i] for i in order[:TOP_K]]
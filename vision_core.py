@@ -1,119 +1,645 @@
 # vision_core.py
 # 視覺核心模組：負責從畫面中提取邊緣點雲與 Hough 線段候選
 # 用於 8BallPool_assist 的主要影像處理流程
+#
+# 流程拆成明確的階段（灰階 → 濾波 → Canny → 點雲 → Hough），每個階段的輸出都可取得，
+# 並以「幀編號 + 該階段實際用到的參數」為鍵快取：
+# 例如調整 Hough 滑桿不會重跑雙邊濾波，雙重 Hough 的兩次偵測共用同一張邊緣圖。
+#
+# 金字塔模式（config.PYRAMID_MODE）：濾波、Canny、Hough 在縮小的畫面上找候選，
+# 再只沿每條候選線段取全解析度的窄帶做濾波與邊緣偵測，以連續角度重新擬合線段；
+# 全解析度的成本只和線段長度成正比，不隨擷取區域面積成長。
+#
+# RANSAC 候選（config.CANDIDATE_MODE = 'ransac'）：以 ransac.py 直接在邊緣點雲上批次取樣找線段，取代 Hough 階段，
+# 並以上一幀的驗證結果為種子；稀疏邊緣圖時比雙重 Hough 快。
+#
+# 緩衝區池（config.BUFFER_POOL）：灰階、濾波、邊緣、遮罩與點雲都寫入預先配置的緩衝區（見 buffer_pool.py），
+# 點雲以 int16 存放。階段輸出在下一幀重新計算時會被覆寫，需要跨幀保留的呼叫端請自行 copy()。
 
+import itertools
 import cv2
 import numpy as np
+from buffer_pool import BufferPool, point_dtype
+from line_clustering import cluster_lines
+from metrics import metrics
+from point_index import PointGrid
+from ransac import ransac_lines
+from smoothing import smooth
+
+
+class FrameFeatures:
+    """
+    單幀各階段的輸出。
+    """
+    def __init__(self):
+        self.gray = None             # 灰階畫面
+        self.filtered = None         # 濾波後畫面（金字塔模式為縮小後的畫面）
+        self.mask = None             # 白色輔助線顏色遮罩（未啟用 HSV 遮罩時為 None）
+        self.edges = None            # Canny 邊緣圖（金字塔模式只含候選線段窄帶內的邊緣；啟用遮罩時已套用）
+        self.points = None           # 邊緣點雲 (M,2) int16（畫面邊長超過 32767 時為 int32）
+        self.index = None            # 點雲空間索引（僅 grid 驗證後端需要）
+        self.raw_lines = None        # 分群前的 Hough / RANSAC 線段 (N,1,4) 或 None
+        self.candidate_lines = None  # 交給驗證的候選線段（啟用分群時為代表線段）
+
 
 class VisionProcessor:
     """
     視覺核心：負責從畫面中提取點雲與 Hough 線段候選。
     """
-    def __init__(self, config):
+    def __init__(self, config, pool=None):
         """
         初始化，保存全域設定。
         :param config: 全域設定物件
+        :param pool: BufferPool，None 時依 config.BUFFER_POOL 建立（關閉時每個階段都配置新陣列）
         """
         self.config = config
+        self.pool = pool if pool is not None else (BufferPool() if config.BUFFER_POOL else None)
+        self.last_edges = None  # 最近一幀的 Canny 邊緣圖（供 raster 驗證後端使用）
+        self.last_index = None  # 最近一幀的點雲空間索引（供 grid 驗證後端使用）
+        self.last_features = None  # 最近一幀的各階段輸出 FrameFeatures
+        self._cache = {}  # 階段名稱 -> (快取鍵, 輸出)，每個階段只保留最新一筆
+        self._auto_ids = itertools.count()
+
+    # === 階段參數（每個階段只取自己用到的參數，作為快取鍵） ===
+    def smooth_params(self, params):
+        """
+        :return: (後端, d, sigmaColor, sigmaSpace)，見 smoothing.py
+        """
+        return (
+            params.get('smooth_backend', self.config.SMOOTH_BACKEND),
+            params.get('bilateral_d', self.config.BILATERAL_D),
+            params.get('bilateral_sigmaColor', self.config.BILATERAL_SIGMA_COLOR),
+            params.get('bilateral_sigmaSpace', self.config.BILATERAL_SIGMA_SPACE),
+        )
+
+    def canny_params(self, params):
+        return (
+            params.get('canny_threshold1', self.config.CANNY_THRESHOLD1),
+            params.get('canny_threshold2', self.config.CANNY_THRESHOLD2),
+        )
 
-    def get_features(self, frame, params):
+    def gate_params(self, params):
+        """
+        HSV 白色遮罩參數（預設值來自 config.HSV_WHITE_LOWER / HSV_WHITE_UPPER）。
+        :return: (是否啟用, HSV 下限, HSV 上限, 擴張半徑)
+        """
+        cfg = self.config
+        lower, upper = cfg.HSV_WHITE_LOWER, cfg.HSV_WHITE_UPPER
+        return (
+            bool(params.get('hsv_gate', cfg.HSV_GATE)),
+            tuple(int(params.get(f'hsv_{c}_low', lower[i])) for i, c in enumerate('hsv')),
+            tuple(int(params.get(f'hsv_{c}_high', upper[i])) for i, c in enumerate('hsv')),
+            int(params.get('hsv_dilate', cfg.HSV_GATE_DILATE)),
+        )
+
+    def hough_params(self, params, variant=None):
+        """
+        :param variant: None 為單一 Hough，'long' / 'short' 為雙重 Hough 的長 / 短線段
+        :return: (threshold, minLineLength, maxLineGap)
+        """
+        cfg = self.config
+        if variant == 'long':
+            return (
+                params.get('hough_threshold_long', cfg.HOUGH_THRESHOLD),
+                params.get('hough_minLineLength_long', max(20, cfg.HOUGH_MIN_LINE_LENGTH)),
+                params.get('hough_maxLineGap_long', cfg.HOUGH_MAX_LINE_GAP),
+            )
+        if variant == 'short':
+            return (
+                params.get('hough_threshold_short', max(1, cfg.HOUGH_THRESHOLD // 2)),
+                params.get('hough_minLineLength_short', 1),
+                params.get('hough_maxLineGap_short', cfg.HOUGH_MAX_LINE_GAP),
+            )
+        return (
+            params.get('hough_threshold', cfg.HOUGH_THRESHOLD),
+            params.get('hough_minLineLength', cfg.HOUGH_MIN_LINE_LENGTH),
+            params.get('hough_maxLineGap', cfg.HOUGH_MAX_LINE_GAP),
+        )
+
+    def ransac_params(self, params):
+        """
+        :return: (最少內點數, 最短長度, 最大間隙, 最多線段數, 信心水準)，見 ransac.ransac_lines
+        """
+        cfg = self.config
+        return (
+            params.get('ransac_min_inliers', params.get('min_inliers', cfg.MIN_INLIERS)),
+            params.get('ransac_min_length', cfg.RANSAC_MIN_LENGTH),
+            params.get('ransac_max_gap', cfg.RANSAC_MAX_GAP),
+            params.get('ransac_max_lines', cfg.RANSAC_MAX_LINES),
+            params.get('ransac_confidence', cfg.RANSAC_CONFIDENCE),
+        )
+
+    def _stage(self, name, key, compute):
+        """
+        階段快取：鍵相同時直接回傳上次的輸出，否則重新計算（並記錄耗時）。
+        """
+        cached = self._cache.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with metrics.stage(name):
+            result = compute()
+        self._cache[name] = (key, result)
+        return result
+
+    def _buffer(self, name, shape, dtype=np.uint8):
+        """
+        :return: 緩衝區池中的輸出陣列；未啟用緩衝區池時回傳 None（OpenCV 的 dst=None 即配置新陣列）
+        """
+        return None if self.pool is None else self.pool.get(name, shape, dtype)
+
+    # === 各階段 ===
+    def stage_gray(self, frame, key):
+        """
+        a. 轉灰階（輸入已是灰階時直接使用）
+        """
+        if frame.ndim == 2:
+            return self._stage('gray', key, lambda: frame)
+        return self._stage('gray', key, lambda: cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY,
+                                                              dst=self._buffer('gray', frame.shape[:2])))
+
+    def stage_smooth(self, gray, key, params):
+        """
+        b. 平滑濾波（預設雙邊濾波：保留邊緣、去除雜訊；後端見 smoothing.py）
+        """
+        sp = self.smooth_params(params)
+        return self._stage('smooth', (key, sp), lambda: smooth(gray, *sp, dst=self._buffer('smooth', gray.shape))), (key, sp)
+
+    def stage_edges(self, filtered, key, params):
+        """
+        c. Canny 邊緣偵測
+        """
+        cp = self.canny_params(params)
+        return self._stage('edges', (key, cp),
+                           lambda: cv2.Canny(filtered, *cp, edges=self._buffer('edges', filtered.shape))), (key, cp)
+
+    def stage_mask(self, frame, key, params):
+        """
+        顏色遮罩：HSV 範圍內（白色輔助線）的像素，向外擴張 hsv_dilate 像素。
+        灰階輸入無法判斷飽和度，只以亮度 >= V 下限判斷。
+        :return: (遮罩 (H, W) uint8 或 None（未啟用）, 快取鍵)
+        """
+        enabled, lower, upper, radius = gp = self.gate_params(params)
+        if not enabled:
+            return None, key
+
+        def compute():
+            shape = frame.shape[:2]
+            if frame.ndim == 2:
+                mask = cv2.inRange(frame, lower[2], upper[2], dst=self._buffer('mask_raw', shape))
+            else:
+                hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV, dst=self._buffer('hsv', frame.shape))
+                mask = cv2.inRange(hsv, lower, upper, dst=self._buffer('mask_raw', shape))
+            if radius > 0:
+                kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2 * radius + 1, 2 * radius + 1))
+                mask = cv2.dilate(mask, kernel, dst=self._buffer('mask', shape))
+            return mask
+        return self._stage('mask', (key, gp), compute), (key, gp)
+
+    def stage_gate(self, edges, mask, key, mask_key):
+        """
+        c2. 以顏色遮罩過濾邊緣：只保留輔助線附近的邊緣，點雲與 Hough 的輸入因此大幅減少
+        """
+        if mask is None:
+            return edges, key
+        if mask.shape != edges.shape:
+            # 金字塔模式：遮罩縮小到邊緣圖大小（INTER_AREA 後 > 0，細線不會消失）
+            mask = cv2.resize(mask, edges.shape[::-1], dst=self._buffer('mask_small', edges.shape),
+                              interpolation=cv2.INTER_AREA)
+        key = (key, mask_key)
+        # 有 mask 時 OpenCV 不會寫入遮罩外的像素，預先配置的輸出需先清為 0
+        return self._stage('gate', key, lambda: cv2.bitwise_and(
+            edges, edges, dst=None if self.pool is None else self.pool.zeros('gated', edges.shape), mask=mask)), key
+
+    def stage_points(self, edges, key):
+        """
+        d. 點雲轉換（邊緣像素座標），需要時同時建立空間索引
+        :return: (points, index)
+        """
+        def compute():
+            points = edge_points(edges, self.pool)
+            # 同時建立點雲空間索引（僅 grid 驗證後端需要）
+            index = PointGrid(points, edges.shape, self.config.GRID_CELL_SIZE, self.pool) if self.config.VERIFY_MODE == 'grid' else None
+            return points, index
+        return self._stage('points', (key, self.config.VERIFY_MODE), compute)
+
+    def stage_hough(self, edges, key, params, variant=None):
+        """
+        e. HoughLinesP 提案
+        """
+        threshold, min_line_length, max_line_gap = self.hough_params(params, variant)
+        return self._stage(
+            f'hough_{variant}', (key, threshold, min_line_length, max_line_gap),
+            lambda: cv2.HoughLinesP(
+                edges,
+                1,
+                np.pi / 180,
+                threshold=threshold,
+                minLineLength=min_line_length,
+                maxLineGap=max_line_gap
+            )
+        )
+
+    def stage_ransac(self, points, key, params, seeds=None):
+        """
+        e'. RANSAC 提案（取代 Hough）
+        :param seeds: 種子線段 (K,4)（與 points 同一座標系）或 None
+        :return: (lines, 快取鍵)；種子不同結果也可能不同，鍵包含種子
+        """
+        cfg = self.config
+        min_inliers, min_length, max_gap, max_lines, confidence = self.ransac_params(params)
+        seeds = None if seeds is None or len(seeds) == 0 else np.asarray(seeds, dtype=np.float32).reshape(-1, 4)
+        key = (key, self.ransac_params(params), None if seeds is None else seeds.tobytes())
+        return self._stage(
+            'ransac', key,
+            lambda: ransac_lines(
+                points, seeds,
+                min_inliers=min_inliers,
+                min_length=min_length,
+                max_gap=max_gap,
+                max_lines=max_lines,
+                confidence=confidence,
+                batch=cfg.RANSAC_BATCH,
+                max_iterations=cfg.RANSAC_MAX_ITERATIONS,
+                max_elements=cfg.VERIFY_MAX_ELEMENTS,
+            )
+        ), key
+
+    def stage_cluster(self, lines, key):
+        """
+        f. 近似共線線段分群合併（config.CLUSTER_LINES 關閉時直接回傳）
+        """
+        cfg = self.config
+        if not cfg.CLUSTER_LINES:
+            return lines
+        tol = (cfg.CLUSTER_ANGLE_TOL_DEG, cfg.CLUSTER_RHO_TOL, cfg.CLUSTER_MAX_GAP, cfg.CLUSTER_MIN_LENGTH)
+        return self._stage('cluster', (key, tol), lambda: cluster_lines(lines, *tol))
+
+    def extract(self, frame, params, frame_id=None, dual=None, seeds=None):
+        """
+        依序執行各階段並回傳所有中間輸出。
+        :param frame: 輸入畫面 (BGR 或灰階)
+        :param params: 影像處理參數 dict
+        :param frame_id: 幀編號；相同編號代表相同畫面，可沿用快取。None 表示新畫面
+        :param dual: True 雙重 Hough、False 單一 Hough，None 時依 config.USE_DUAL_HOUGH（RANSAC 模式不使用）
+        :param seeds: RANSAC 模式的種子線段（通常為上一幀的驗證結果）或 None
+        :return: FrameFeatures
+        """
+        if frame_id is None:
+            frame_id = ('auto', next(self._auto_ids))
+        if dual is None:
+            dual = self.config.USE_DUAL_HOUGH
+        if self.config.PYRAMID_MODE:
+            return self.extract_pyramid(frame, params, frame_id, dual, seeds)
+        f = FrameFeatures()
+        f.gray = self.stage_gray(frame, frame_id)
+        f.filtered, key = self.stage_smooth(f.gray, frame_id, params)
+        f.edges, key = self.stage_edges(f.filtered, key, params)
+        f.mask, mask_key = self.stage_mask(frame, frame_id, params)
+        f.edges, key = self.stage_gate(f.edges, f.mask, key, mask_key)
+        f.points, f.index = self.stage_points(f.edges, key)
+        if self.config.CANDIDATE_MODE == 'ransac':
+            f.raw_lines, key = self.stage_ransac(f.points, key, params, seeds)
+        elif dual:
+            lines_long = self.stage_hough(f.edges, key, params, 'long')
+            lines_short = self.stage_hough(f.edges, key, params, 'short')
+            key = (key, self.hough_params(params, 'long'), self.hough_params(params, 'short'))
+            f.raw_lines = self._stage('merge', key, lambda: merge_lines(lines_long, lines_short))
+        else:
+            f.raw_lines = self.stage_hough(f.edges, key, params)
+            key = (key, self.hough_params(params))
+        f.candidate_lines = self.stage_cluster(f.raw_lines, key)
+        self.last_features = f
+        self.last_edges = f.edges
+        self.last_index = f.index
+        return f
+
+    def coarse_params(self, params, factor):
+        """
+        金字塔模式：把與像素尺度相關的參數換算到縮小 factor 倍的畫面
+        （濾波直徑 / 空間 sigma、Hough 票數 / 最小長度 / 最大間隙、RANSAC 內點數 / 最短長度 / 最大間隙；
+        Canny 門檻與顏色 sigma 不變）。
+        :return: 參數 dict
+        """
+        backend, d, sigma_color, sigma_space = self.smooth_params(params)
+        coarse = dict(params)
+        coarse.update({
+            'smooth_backend': backend,
+            'bilateral_d': max(1, round(d / factor)),
+            'bilateral_sigmaColor': sigma_color,
+            'bilateral_sigmaSpace': max(1, sigma_space / factor),
+        })
+        for variant, suffix in ((None, ''), ('long', '_long'), ('short', '_short')):
+            threshold, min_line_length, max_line_gap = self.hough_params(params, variant)
+            coarse[f'hough_threshold{suffix}'] = max(1, round(threshold / factor))
+            coarse[f'hough_minLineLength{suffix}'] = max(1, round(min_line_length / factor))
+            coarse[f'hough_maxLineGap{suffix}'] = max(1, round(max_line_gap / factor))
+        min_inliers, min_length, max_gap, _, _ = self.ransac_params(params)
+        coarse['ransac_min_inliers'] = max(2, round(min_inliers / factor))
+        coarse['ransac_min_length'] = max(1, min_length / factor)
+        coarse['ransac_max_gap'] = max(1, max_gap / factor)
+        return coarse
+
+    def extract_pyramid(self, frame, params, frame_id, dual, seeds=None):
+        """
+        金字塔模式的 extract：
+        1. 灰階畫面以 pyrDown 縮小 2^PYRAMID_LEVELS 倍
+        2. 縮小畫面上依序濾波、Canny、Hough（或 RANSAC，種子同樣縮小）、分群，得到粗略候選
+        3. 候選放大回全解析度，沿線段取窄帶精修（refine_lines），窄帶內的邊緣即為驗證用點雲
+        :return: FrameFeatures（座標皆為全解析度）
+        """
+        cfg = self.config
+        levels = cfg.PYRAMID_LEVELS
+        factor = 2 ** levels
+        coarse = self.coarse_params(params, factor)
+        f = FrameFeatures()
+        f.gray = self.stage_gray(frame, frame_id)
+        small = self._stage('pyramid', (frame_id, levels), lambda: _downscale(f.gray, levels))
+        f.filtered, key = self.stage_smooth(small, frame_id, coarse)
+        edges_small, key = self.stage_edges(f.filtered, key, coarse)
+        f.mask, mask_key = self.stage_mask(frame, frame_id, params)
+        edges_small, key = self.stage_gate(edges_small, f.mask, key, mask_key)
+        if cfg.CANDIDATE_MODE == 'ransac':
+            points_small = self._stage('coarse_points', key, lambda: edge_points(edges_small, self.pool))
+            if seeds is not None and len(seeds) > 0:
+                seeds = np.asarray(seeds, dtype=np.float32).reshape(-1, 4) / factor
+            raw, key = self.stage_ransac(points_small, key, coarse, seeds)
+        elif dual:
+            lines_long = self.stage_hough(edges_small, key, coarse, 'long')
+            lines_short = self.stage_hough(edges_small, key, coarse, 'short')
+            key = (key, self.hough_params(coarse, 'long'), self.hough_params(coarse, 'short'))
+            raw = self._stage('merge', key, lambda: merge_lines(lines_long, lines_short))
+        else:
+            raw = self.stage_hough(edges_small, key, coarse)
+            key = (key, self.hough_params(coarse))
+        candidates = self.stage_cluster(raw, key)
+        f.raw_lines = None if raw is None else raw * factor
+        key = (key, self.smooth_params(params), self.canny_params(params), cfg.PYRAMID_BAND)
+
+        def refine():
+            lines = None if candidates is None else candidates * factor
+            lines, points = refine_lines(f.gray, lines, cfg.PYRAMID_BAND + factor,
+                                         self.smooth_params(params), self.canny_params(params), f.mask)
+            points = points.astype(point_dtype(f.gray.shape))
+            edges = np.zeros(f.gray.shape, dtype=np.uint8) if self.pool is None else self.pool.zeros('refine_edges', f.gray.shape)
+            edges[points[:, 1], points[:, 0]] = 255
+            index = PointGrid(points, edges.shape, cfg.GRID_CELL_SIZE, self.pool) if cfg.VERIFY_MODE == 'grid' else None
+            return lines, points, edges, index
+        f.candidate_lines, f.points, f.edges, f.index = self._stage('refine', key, refine)
+        self.last_features = f
+        self.last_edges = f.edges
+        self.last_index = f.index
+        return f
+
+    def get_features(self, frame, params, frame_id=None, seeds=None):
         """
         從輸入畫面同時提取：
         1. 邊緣點雲（用於驗證）
         2. Hough 線段候選（用於提案）
         流程：
         a. 轉灰階
-        b. 雙邊濾波（保留邊緣、去除雜訊）
+        b. 平滑濾波（預設雙邊濾波，保留邊緣、去除雜訊）
         c. Canny 邊緣偵測
         d. 轉點雲
-        e. HoughLinesP 提案
-        :param frame: 輸入畫面 (BGR)
+        e. HoughLinesP 提案（RANSAC 模式為 RANSAC 提案）
+        f. 近似共線線段分群合併（可選）
+        :param frame: 輸入畫面 (BGR 或灰階)
         :param params: 影像處理參數 dict
+        :param frame_id: 幀編號（可沿用快取），None 表示新畫面
+        :param seeds: RANSAC 模式的種子線段或 None
         :return: (candidate_lines, points)
         """
-        # a. 轉灰階
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        # b. 雙邊濾波（可調參數，預設值見 config）
-        d = params.get('bilateral_d', self.config.BILATERAL_D)
-        sigmaColor = params.get('bilateral_sigmaColor', self.config.BILATERAL_SIGMA_COLOR)
-        sigmaSpace = params.get('bilateral_sigmaSpace', self.config.BILATERAL_SIGMA_SPACE)
-        filtered = cv2.bilateralFilter(gray, d, sigmaColor, sigmaSpace)
-        # c. Canny 邊緣偵測
-        threshold1 = params.get('canny_threshold1', self.config.CANNY_THRESHOLD1)
-        threshold2 = params.get('canny_threshold2', self.config.CANNY_THRESHOLD2)
-        edges = cv2.Canny(filtered, threshold1, threshold2)
-        # d. 點雲轉換（邊緣像素座標）
-        ys, xs = np.where(edges == 255)
-        points = np.stack([xs, ys], axis=1) if len(xs) > 0 else np.empty((0, 2), dtype=np.int32)
-        # e. Hough 直線提案
-        hough_threshold = params.get('hough_threshold', self.config.HOUGH_THRESHOLD)
-        min_line_length = params.get('hough_minLineLength', self.config.HOUGH_MIN_LINE_LENGTH)
-        max_line_gap = params.get('hough_maxLineGap', self.config.HOUGH_MAX_LINE_GAP)
-        candidate_lines = cv2.HoughLinesP(
-            edges,
-            1,
-            np.pi / 180,
-            threshold=hough_threshold,
-            minLineLength=min_line_length,
-            maxLineGap=max_line_gap
-        )
-        # 返回 Hough 線段與點雲
-        return candidate_lines, points
+        f = self.extract(frame, params, frame_id, dual=False, seeds=seeds)
+        return f.candidate_lines, f.points
 
-    def get_features_dual_hough(self, frame, params):
+    def get_features_dual_hough(self, frame, params, frame_id=None, seeds=None):
         """
         進階：雙重 Hough 偵測，分別針對長線段與短線段
-        :param frame: 輸入畫面 (BGR)
+        :param frame: 輸入畫面 (BGR 或灰階)
         :param params: 影像處理參數 dict
+        :param frame_id: 幀編號（可沿用快取），None 表示新畫面
+        :param seeds: RANSAC 模式的種子線段或 None
         :return: (candidate_lines, points)
         """
-        # a. 轉灰階
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        # b. 雙邊濾波
-        d = params.get('bilateral_d', self.config.BILATERAL_D)
-        sigmaColor = params.get('bilateral_sigmaColor', self.config.BILATERAL_SIGMA_COLOR)
-        sigmaSpace = params.get('bilateral_sigmaSpace', self.config.BILATERAL_SIGMA_SPACE)
-        filtered = cv2.bilateralFilter(gray, d, sigmaColor, sigmaSpace)
-        # c. Canny 邊緣偵測
-        threshold1 = params.get('canny_threshold1', self.config.CANNY_THRESHOLD1)
-        threshold2 = params.get('canny_threshold2', self.config.CANNY_THRESHOLD2)
-        edges = cv2.Canny(filtered, threshold1, threshold2)
-        # d. 點雲轉換
-        ys, xs = np.where(edges == 255)
-        points = np.stack([xs, ys], axis=1) if len(xs) > 0 else np.empty((0, 2), dtype=np.int32)
-        # e1. Hough 長線段
-        hough_threshold_long = params.get('hough_threshold_long', self.config.HOUGH_THRESHOLD)
-        min_line_length_long = params.get('hough_minLineLength_long', max(20, self.config.HOUGH_MIN_LINE_LENGTH))
-        max_line_gap_long = params.get('hough_maxLineGap_long', self.config.HOUGH_MAX_LINE_GAP)
-        lines_long = cv2.HoughLinesP(
-            edges,
-            1,
-            np.pi / 180,
-            threshold=hough_threshold_long,
-            minLineLength=min_line_length_long,
-            maxLineGap=max_line_gap_long
-        )
-        # e2. Hough 短線段
-        hough_threshold_short = params.get('hough_threshold_short', max(1, self.config.HOUGH_THRESHOLD // 2))
-        min_line_length_short = params.get('hough_minLineLength_short', 1)
-        max_line_gap_short = params.get('hough_maxLineGap_short', self.config.HOUGH_MAX_LINE_GAP)
-        lines_short = cv2.HoughLinesP(
-            edges,
-            1,
-            np.pi / 180,
-            threshold=hough_threshold_short,
-            minLineLength=min_line_length_short,
-            maxLineGap=max_line_gap_short
-        )
-        # 合併去重
-        all_lines = []
-        seen = set()
-        for group in [lines_long, lines_short]:
-            if group is not None:
-                for line in group:
-                    key = tuple(line[0])
-                    if key not in seen:
-                        all_lines.append(line)
-                        seen.add(key)
-        candidate_lines = np.array(all_lines) if all_lines else None
-        return candidate_lines, points 
\ No newline at end of file
+        f = self.extract(frame, params, frame_id, dual=True, seeds=seeds)
+        return f.candidate_lines, f.points
+
+    def get_features_roi(self, frame, params, lines, margin, dual=True, seeds=None):
+        """
+        ROI 模式：只處理目前追蹤線段周圍的窄帶。
+        1. 近似共線的追蹤線段先合併；沿每條線段（兩端各延伸 margin）以 cv2.remap 取出寬 2×margin+1 的窄帶，上下堆疊成一張小圖
+           （同 refine_lines；處理量只與線段長度成正比，斜線或多條線也不會擴大成整張畫面；
+           窄帶圖的像素數不少於整張畫面時改為處理整張畫面）
+        2. 對窄帶圖做濾波、邊緣偵測與 Hough（RANSAC 模式以各窄帶的中線為種子）
+        3. 邊緣點與候選線段端點查表映射回整張畫面座標；端點落在不同窄帶或窄帶外的候選捨棄
+        :param frame: 輸入畫面 (BGR 或灰階)
+        :param params: 影像處理參數 dict
+        :param lines: 目前追蹤中的線段列表（每條格式同 Hough 輸出）
+        :param margin: 窄帶半寬（像素）
+        :param dual: True 使用雙重 Hough，False 使用單一 Hough
+        :param seeds: RANSAC 模式的種子線段或 None（不為 None 時改用各窄帶中線）
+        :return: (candidate_lines, points)，座標皆為整張畫面座標
+        """
+        extract = self.get_features_dual_hough if dual else self.get_features
+        h, w = frame.shape[:2]
+        # 同一條線的多段追蹤結果先合併，避免重疊的窄帶重複處理
+        cfg = self.config
+        merged = cluster_lines(lines, cfg.CLUSTER_ANGLE_TOL_DEG, cfg.CLUSTER_RHO_TOL, cfg.CLUSTER_MAX_GAP, 0.0)
+        seg = np.empty((0, 4)) if merged is None else merged.reshape(-1, 4).astype(np.float64)
+        seg = seg[np.hypot(seg[:, 2] - seg[:, 0], seg[:, 3] - seg[:, 1]) > 0]
+        if len(seg) == 0:
+            return extract(frame, params, seeds=seeds)
+        pad = max(1, int(self.smooth_params(params)[1]) // 2 + 1)  # 濾波與 Canny 需要的邊界
+        rows = 2 * (margin + pad) + 1
+        width = int(np.ceil(np.hypot(seg[:, 2] - seg[:, 0], seg[:, 3] - seg[:, 1]).max())) + 2 * margin + 1
+        if len(seg) * rows * width >= h * w:
+            # 窄帶圖（含濾波邊界）不比整張畫面小時，直接處理整張畫面較省
+            return extract(frame, params, seeds=seeds)
+        map_x, map_y, cols, rows = _strip_maps(seg, margin, pad)
+        strips = cv2.remap(frame, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        if seeds is not None:
+            # 追蹤線段在窄帶圖中即為各窄帶的中線
+            center = np.arange(len(seg)) * rows + pad + margin
+            seeds = np.stack([np.full(len(seg), margin), center, cols - margin - 1, center], axis=1)
+        candidate_lines, points = extract(strips, params, seeds=seeds)
+        # 邊緣點：只取各窄帶中間 2×margin+1 列、線段長度內的欄位，映射回畫面座標
+        points = np.asarray(points, dtype=np.int64)
+        keep = _strip_inside(points[:, 0], points[:, 1], cols, rows, pad)
+        px = np.rint(map_x[points[keep, 1], points[keep, 0]]).astype(np.int64)
+        py = np.rint(map_y[points[keep, 1], points[keep, 0]]).astype(np.int64)
+        inside = (px >= 0) & (px < w) & (py >= 0) & (py < h)
+        flat = np.unique(py[inside] * w + px[inside])
+        points = np.stack([flat % w, flat // w], axis=1).astype(point_dtype((h, w)))
+        if candidate_lines is not None:
+            c = np.asarray(candidate_lines).reshape(-1, 4).astype(np.int64)
+            keep = (_strip_inside(c[:, 0], c[:, 1], cols, rows, pad) & _strip_inside(c[:, 2], c[:, 3], cols, rows, pad)
+                    & (c[:, 1] // rows == c[:, 3] // rows))
+            c = c[keep]
+            mapped = np.stack([map_x[c[:, 1], c[:, 0]], map_y[c[:, 1], c[:, 0]],
+                               map_x[c[:, 3], c[:, 2]], map_y[c[:, 3], c[:, 2]]], axis=1)
+            candidate_lines = np.rint(mapped).astype(np.int32).reshape(-1, 1, 4) if len(c) else None
+        edges = np.zeros((h, w), dtype=np.uint8) if self.pool is None else self.pool.zeros('roi_edges', (h, w))
+        edges[points[:, 1], points[:, 0]] = 255
+        self.last_edges = edges
+        if self.last_index is not None:
+            self.last_index = PointGrid(points, edges.shape, self.config.GRID_CELL_SIZE, self.pool)
+        return candidate_lines, points
+
+
+def edge_points(edges, pool=None):
+    """
+    邊緣圖轉點雲（列優先順序，同 np.nonzero）。
+    有緩衝區池時以 np.compress 把非零像素的線性索引寫入預先配置的緩衝區，再以 np.divmod 拆成 (x, y)，
+    不產生 np.nonzero 的兩個 int64 索引陣列與 np.stack 的暫存。
+    :param edges: 邊緣圖 (H, W) uint8（0 / 255）
+    :param pool: BufferPool 或 None
+    :return: (M,2) 點雲 (x, y)，dtype 見 buffer_pool.point_dtype
+    """
+    h, w = edges.shape
+    dtype = point_dtype(edges.shape)
+    if pool is None:
+        ys, xs = np.nonzero(edges)
+        return np.stack([xs, ys], axis=1).astype(dtype, copy=False)
+    n = cv2.countNonZero(edges)
+    points = pool.get('points', (n, 2), dtype)
+    if n == 0:
+        return points
+    flag = np.not_equal(edges, 0, out=pool.get('edge_flag', edges.shape, np.bool_))
+    idx = np.compress(flag.ravel(), pool.arange(h * w), out=pool.get('edge_index', n, np.int32))
+    np.divmod(idx, w, out=(points[:, 1], points[:, 0]))
+    return points
+
+
+def _downscale(gray, levels):
+    """
+    以 pyrDown（高斯模糊 + 隔點取樣）縮小 levels 次。
+    """
+    for _ in range(levels):
+        gray = cv2.pyrDown(gray)
+    return gray
+
+
+def _strip_maps(seg, band, margin):
+    """
+    沿每條線段（兩端各延伸 band）取寬 2×band+1、上下另留 margin 列邊界的窄帶，所有窄帶上下堆疊，
+    回傳 cv2.remap 的取樣座標（窄帶圖像素 (列, 欄) 對應的畫面座標也由此查表）。
+    :param seg: float (K,4) 長度大於 0 的線段
+    :return: (map_x, map_y) float32 (K×rows, width)；每條窄帶的有效欄數 cols (K,)；每條窄帶的列數 rows。
+             超出各自長度的欄位座標為 -1
+    """
+    d = seg[:, 2:] - seg[:, :2]
+    length = np.hypot(d[:, 0], d[:, 1])
+    u = d / length[:, None]                   # 方向
+    nrm = np.stack([-u[:, 1], u[:, 0]], 1)    # 法向
+    start = seg[:, :2] - u * band
+    cols = np.ceil(length).astype(np.int64) + 2 * band + 1
+    rows = 2 * (band + margin) + 1
+    k, width = len(seg), int(cols.max())
+    i = np.arange(width, dtype=np.float32)
+    j = np.arange(rows, dtype=np.float32) - (band + margin)
+    start, u, nrm = start.astype(np.float32), u.astype(np.float32), nrm.astype(np.float32)
+    # (k, rows, width) 的取樣座標；超出各自長度的欄位設為 -1（remap 以邊界像素填補，之後再濾掉）
+    valid = i[None, None, :] < cols[:, None, None]
+    map_x = np.where(valid, start[:, 0, None, None] + u[:, 0, None, None] * i + nrm[:, 0, None, None] * j[:, None], -1)
+    map_y = np.where(valid, start[:, 1, None, None] + u[:, 1, None, None] * i + nrm[:, 1, None, None] * j[:, None], -1)
+    return map_x.reshape(k * rows, width), map_y.reshape(k * rows, width), cols, rows
+
+
+def _strip_inside(xs, ys, cols, rows, margin):
+    """
+    窄帶圖中的像素 (xs, ys) 是否落在所屬窄帶的中間列（去掉上下 margin 列邊界）、且在線段長度內。
+    """
+    k = ys // rows
+    j = ys % rows
+    return (j >= margin) & (j < rows - margin) & (xs < cols[np.minimum(k, len(cols) - 1)] - 1)
+
+
+def refine_lines(gray, lines, band, smooth_params, canny, mask=None):
+    """
+    在全解析度畫面上精修候選線段：
+    1. 沿每條線段（兩端各延伸 band）以 cv2.remap 取出寬 2×band+1 的窄帶，所有窄帶上下堆疊成一張小圖
+       （窄帶上下另留濾波半徑的邊界，避免濾波受相鄰窄帶影響）
+    2. 對整張窄帶圖做一次平滑濾波與 Canny，邊緣像素再映射回畫面座標
+    3. 每條線段以窄帶內邊緣點的主成分方向重新擬合（連續角度，不受 Hough 1° 量化限制），
+       端點取邊緣點在該方向上的投影範圍
+    成本只與線段長度 × 窄帶寬度成正比。
+    :param gray: 全解析度灰階畫面
+    :param lines: 候選線段 (N,1,4)（全解析度座標）或 None
+    :param band: 窄帶半寬（像素）
+    :param smooth_params: 平滑濾波參數 (後端, d, sigmaColor, sigmaSpace)
+    :param canny: Canny 門檻 (threshold1, threshold2)
+    :param mask: 顏色遮罩 (H, W)，不為 None 時只保留遮罩內的邊緣點
+    :return: (精修後線段 int32 (K,1,4) 或 None, 窄帶內的邊緣點 (M,2))
+    """
+    empty = np.empty((0, 2), dtype=np.int32)
+    if lines is None or len(lines) == 0:
+        return None, empty
+    h, w = gray.shape
+    seg = np.asarray(lines, dtype=np.float64).reshape(-1, 4)
+    d = seg[:, 2:] - seg[:, :2]
+    length = np.hypot(d[:, 0], d[:, 1])
+    keep = length > 0
+    seg, d, length = seg[keep], d[keep], length[keep]
+    if len(seg) == 0:
+        return None, empty
+    margin = max(1, int(smooth_params[1]) // 2 + 1)  # 濾波與 Canny 需要的邊界
+    map_x, map_y, cols, rows = _strip_maps(seg, band, margin)
+    k, width = len(seg), map_x.shape[1]
+    strips = cv2.remap(gray, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+    edges = cv2.Canny(smooth(strips, *smooth_params), *canny).reshape(k, rows, width)
+    # 只取每條窄帶的中間 2×band+1 列、線段長度內的欄位（先取稀疏的邊緣像素再篩選）
+    owner, ys, xs = np.nonzero(edges)
+    keep = (ys >= margin) & (ys < rows - margin) & (xs < cols[owner] - 1)
+    owner, ys, xs = owner[keep], ys[keep], xs[keep]
+    if len(owner) == 0:
+        return None, empty
+    flat = (owner * rows + ys) * width + xs
+    px = np.rint(map_x.ravel()[flat]).astype(np.int64)
+    py = np.rint(map_y.ravel()[flat]).astype(np.int64)
+    inside = (px >= 0) & (px < w) & (py >= 0) & (py < h)
+    owner, px, py = owner[inside], px[inside], py[inside]
+    if mask is not None:
+        gated = mask[py, px] > 0
+        owner, px, py = owner[gated], px[gated], py[gated]
+    # 每條線段的主成分擬合（以 bincount 向量化），少於 2 個邊緣點的線段捨棄
+    count = np.bincount(owner, minlength=k)
+    fitted = np.nonzero(count >= 2)[0]
+    if len(fitted) == 0:
+        return None, empty
+    points = np.unique(py * w + px)
+    points = np.stack([points % w, points // w], axis=1)
+    sel = count[owner] >= 2
+    owner, px, py = owner[sel], px[sel], py[sel]
+    n = np.maximum(count, 1)
+    mx = np.bincount(owner, px, k) / n
+    my = np.bincount(owner, py, k) / n
+    dx, dy = px - mx[owner], py - my[owner]
+    sxx = np.bincount(owner, dx * dx, k)
+    syy = np.bincount(owner, dy * dy, k)
+    sxy = np.bincount(owner, dx * dy, k)
+    theta = 0.5 * np.arctan2(2 * sxy, sxx - syy)
+    ux, uy = np.cos(theta), np.sin(theta)
+    t = dx * ux[owner] + dy * uy[owner]
+    order = np.argsort(owner, kind='stable')
+    starts = np.searchsorted(owner[order], fitted)
+    tmin = np.minimum.reduceat(t[order], starts)
+    tmax = np.maximum.reduceat(t[order], starts)
+    refined = np.stack([mx[fitted] + tmin * ux[fitted], my[fitted] + tmin * uy[fitted],
+                        mx[fitted] + tmax * ux[fitted], my[fitted] + tmax * uy[fitted]], axis=1)
+    return np.rint(refined).astype(np.int32).reshape(-1, 1, 4), points
+
+
+def merge_lines(*groups):
+    """
+    合併多組 Hough 輸出並去除完全相同的線段。
+    :return: (N,1,4) 或 None
+    """
+    all_lines = []
+    seen = set()
+    for group in groups:
+        if group is not None:
+            for line in group:
+                key = tuple(line[0])
+                if key not in seen:
+                    all_lines.append(line)
+                    seen.add(key)
+    return np.array(all_lines) if all_lines else None